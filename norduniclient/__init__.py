@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import absolute_import
+import sys as _sys
+from norduniclient import core as _core
 from norduniclient.core import *
 
 __author__ = 'lundberg'
@@ -10,7 +12,30 @@ __author__ = 'lundberg'
 # You can use it like this:
 # from norduniclient import graphdb as db
 # get_node(db.manager, 'node_id*)
+# The database connection is opened on first use of graphdb.manager or neo4jdb.
 graphdb = GraphDB.get_instance()
 
-neo4jdb = graphdb.manager  # Works as the old neo4jdb
+__all__ = _core.__all__ + ['graphdb']
+
+
+def __getattr__(name):
+    if name == 'neo4jdb':
+        return graphdb.manager  # Works as the old neo4jdb
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+if _sys.version_info < (3, 7):  # Module __getattr__ is not supported
+    class _LazyManager(object):
+        """
+        Stands in for graphdb.manager and opens the database connection on first attribute access.
+        """
+
+        def __getattr__(self, item):
+            return getattr(graphdb.manager, item)
+
+        def __setattr__(self, key, value):
+            setattr(graphdb.manager, key, value)
+
+    neo4jdb = _LazyManager()
+    __all__.append('neo4jdb')
 
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio interface for norduniclient, Python 3.5+ only.
+
+The blocking core functions run on a thread pool with as many workers as the driver has connections, so many
+independent queries can be awaited concurrently without blocking the event loop.
+
+    manager = AsyncNeo4jDBSessionManager('bolt://localhost:7687', 'neo4j', 'secret')
+    node = await aio.get_node_model(manager, handle_id)
+    relations, location = await asyncio.gather(manager.run(node.get_relations), manager.run(node.get_location_path))
+    async for port in aio.get_nodes_by_type(manager, 'Port'):
+        ...
+
+    node = await aio.get_async_node_model(manager, handle_id)
+    relations = await node.get_relations()
+"""
+
+from __future__ import absolute_import
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from norduniclient import core
+from norduniclient.contextmanager import Neo4jDBSessionManager
+
+__author__ = 'lundberg'
+
+
+def _get_loop():
+    try:
+        return asyncio.get_running_loop()
+    except AttributeError:  # Python < 3.7
+        return asyncio.get_event_loop()
+
+
+class AsyncNeo4jDBSessionManager(object):
+    """
+    Wraps a Neo4jDBSessionManager and runs blocking calls on its executor, bounded by max_pool_size.
+
+    AsyncNeo4jDBSessionManager.manager is the wrapped blocking manager, use it for model instances.
+
+    await AsyncNeo4jDBSessionManager.run(func, *args, **kwargs)
+    """
+
+    def __init__(self, uri, username=None, password=None, encrypted=True, max_pool_size=50, manager=None):
+        self.uri = uri
+        if manager is None:
+            manager = Neo4jDBSessionManager(uri=uri, username=username, password=password, encrypted=encrypted,
+                                            max_pool_size=max_pool_size)
+        self.manager = manager
+
+    @classmethod
+    def from_manager(cls, manager):
+        return cls(manager.uri, manager=manager)
+
+    def _get_executor(self):
+        return self.manager.executor
+    executor = property(_get_executor)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs a blocking call, for example a model method, on the executor.
+        """
+        return await self.run_in_executor(self.executor, func, *args, **kwargs)
+
+    async def run_in_executor(self, executor, func, *args, **kwargs):
+        """
+        Runs a blocking call on another executor, like the thread of an AsyncIterator.
+        """
+        return await _get_loop().run_in_executor(executor,
+                                                 functools.partial(self.manager.run_pooled, func, *args, **kwargs))
+
+    def iterate(self, func, *args, **kwargs):
+        """
+        Returns an async iterator over the generator returned by func(*args, **kwargs).
+        """
+        return AsyncIterator(self, func, *args, **kwargs)
+
+
+class AsyncIterator(object):
+    """
+    Consumes a blocking generator, batch_size items per executor call. The generator runs on a thread of its own, as
+    the session it reads from can not move between threads, and is closed when it is exhausted or by aclose.
+
+        iterator = aio.get_nodes_by_type(manager, 'Port')
+        try:
+            async for port in iterator:
+                ...
+        finally:
+            await iterator.aclose()
+    """
+
+    batch_size = 100
+
+    def __init__(self, manager, func, *args, **kwargs):
+        self._manager = manager
+        self._generator = functools.partial(func, *args, **kwargs)
+        self._iterator = None
+        self._executor = None
+        self._batch = []
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    def _next_batch(self):
+        if self._iterator is None:
+            self._iterator = iter(self._generator())
+        return list(islice(self._iterator, self.batch_size))
+
+    def _close(self):
+        close = getattr(self._iterator, 'close', None)
+        if close is not None:
+            close()
+
+    async def __anext__(self):
+        if not self._batch:
+            if self._closed:
+                raise StopAsyncIteration
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            try:
+                self._batch = await self._manager.run_in_executor(self._executor, self._next_batch)
+            except Exception:
+                await self.aclose()
+                raise
+            if not self._batch:
+                await self.aclose()
+                raise StopAsyncIteration
+            self._batch.reverse()
+        return self._batch.pop()
+
+    async def aclose(self):
+        """
+        Closes the generator, and with it the session, on the thread it runs on. Items not yet consumed are dropped.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._batch = []
+        if self._executor is not None:
+            try:
+                await self._manager.run_in_executor(self._executor, self._close)
+            finally:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+class AsyncNodeModel(object):
+    """
+    Wraps a node model so that its methods return awaitables running on the executor. The incoming, outgoing and
+    relationships properties are coroutine methods, other attributes are read from the wrapped model.
+
+    AsyncNodeModel.model is the wrapped blocking model.
+    """
+
+    def __init__(self, manager, model):
+        self.manager = manager
+        self.model = model
+
+    def __repr__(self):
+        return u'<{c} {model!r}>'.format(c=self.__class__.__name__, model=self.model)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        attr = getattr(self.model, name)
+        if callable(attr):
+            return functools.partial(self.manager.run, attr)
+        return attr
+
+    async def incoming(self):
+        return await self.manager.run(getattr, self.model, 'incoming')
+
+    async def outgoing(self):
+        return await self.manager.run(getattr, self.model, 'outgoing')
+
+    async def relationships(self):
+        return await self.manager.run(getattr, self.model, 'relationships')
+
+
+def _coroutine(func):
+    @functools.wraps(func)
+    async def wrapper(manager, *args, **kwargs):
+        return await manager.run(func, manager.manager, *args, **kwargs)
+    return wrapper
+
+
+async def get_async_node_model(manager, handle_id=None, node=None):
+    """
+    :param manager: AsyncNeo4jDBSessionManager
+    :param handle_id: Nodes handle id
+    :param node: Node object
+    :type handle_id: str|unicode
+    :type node: neo4j.v1.types.Node
+    :return: Node model with awaitable methods
+    :rtype: AsyncNodeModel
+    """
+    model = await manager.run(core.get_node_model, manager.manager, handle_id=handle_id, node=node)
+    return AsyncNodeModel(manager, model)
+
+
+async def get_async_node_models(manager, handle_ids):
+    """
+    :param manager: AsyncNeo4jDBSessionManager
+    :param handle_ids: Handle ids
+    :type handle_ids: list
+    :return: Handle id -> node model with awaitable methods, or None for missing nodes
+    :rtype: dict
+    """
+    node_models = await manager.run(core.get_node_models, manager.manager, handle_ids)
+    return {handle_id: AsyncNodeModel(manager, model) if model is not None else None
+            for handle_id, model in node_models.items()}
+
+
+def _async_iterator(func):
+    @functools.wraps(func)
+    def wrapper(manager, *args, **kwargs):
+        return manager.iterate(func, manager.manager, *args, **kwargs)
+    return wrapper
+
+
+create_node = _coroutine(core.create_node)
+create_nodes = _coroutine(core.create_nodes)
+get_node = _coroutine(core.get_node)
+get_nodes = _coroutine(core.get_nodes)
+get_node_bundle = _coroutine(core.get_node_bundle)
+get_node_meta_type = _coroutine(core.get_node_meta_type)
+delete_node = _coroutine(core.delete_node)
+get_relationship = _coroutine(core.get_relationship)
+get_relationship_bundle = _coroutine(core.get_relationship_bundle)
+delete_relationship = _coroutine(core.delete_relationship)
+create_relationship = _coroutine(core.create_relationship)
+create_relationships = _coroutine(core.create_relationships)
+get_relationships = _coroutine(core.get_relationships)
+set_node_properties = _coroutine(core.set_node_properties)
+set_relationship_properties = _coroutine(core.set_relationship_properties)
+get_unique_node_by_name = _coroutine(core.get_unique_node_by_name)
+get_node_model = _coroutine(core.get_node_model)
+get_node_models = _coroutine(core.get_node_models)
+get_relationship_model = _coroutine(core.get_relationship_model)
+query_to_dict = _coroutine(core.query_to_dict)
+query_to_list = _coroutine(core.query_to_list)
+read_query_to_dict = _coroutine(core.read_query_to_dict)
+read_query_to_list = _coroutine(core.read_query_to_list)
+
+query_to_iterator = _async_iterator(core.query_to_iterator)
+read_query_to_iterator = _async_iterator(core.read_query_to_iterator)
+get_nodes_by_value = _async_iterator(core.get_nodes_by_value)
+get_node_by_type = _async_iterator(core.get_node_by_type)
+search_nodes_by_value = _async_iterator(core.search_nodes_by_value)
+get_nodes_by_type = _async_iterator(core.get_nodes_by_type)
+get_nodes_by_name = _async_iterator(core.get_nodes_by_name)
+get_indexed_node = _async_iterator(core.get_indexed_node)
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+EXPLAIN/PROFILE audit of the queries the node models run.
+
+collect_queries calls every get_ method on the models of the given nodes, with arguments from SAMPLE_ARGUMENTS, and
+records the queries they run. audit profiles each query in a transaction that is rolled back and reports the starting
+operators, estimated rows, db hits and variable length expansion bounds. Compare the reports with a saved baseline
+with find_regressions to catch queries that stop using an index. Reports are keyed on the calling function, so a
+changed query is compared with the query it replaced.
+
+Run it against a test database, seed adds a small topology with a node of the common model types:
+
+    python -m norduniclient.audit bolt://localhost:7687 --username neo4j --password secret --baseline audit.json
+"""
+
+from __future__ import absolute_import
+
+import argparse
+import json
+import re
+import sys
+
+from norduniclient import core
+from norduniclient import helpers
+from norduniclient.contextmanager import Neo4jDBSessionManager
+
+import logging
+logger = logging.getLogger(__name__)
+
+__author__ = 'lundberg'
+
+# Starting operators that read every node of a label or index instead of seeking
+SCAN_OPERATORS = ('AllNodesScan', 'NodeByLabelScan', 'NodeIndexScan', 'NodeIndexContainsScan', 'NodeIndexEndsWithScan')
+
+_VAR_LENGTH_RE = re.compile(r'\*(\d*)(\.\.(\d*))?')
+
+SEED_NODES = [
+    ('audit-site', 'Audit Site', 'Location', 'Site'),
+    ('audit-rack', 'Audit Rack', 'Location', 'Rack'),
+    ('audit-router', 'Audit Router', 'Physical', 'Router'),
+    ('audit-router-port', 'ge-0/0/1', 'Physical', 'Port'),
+    ('audit-odf', 'Audit ODF', 'Physical', 'ODF'),
+    ('audit-odf-port', '1', 'Physical', 'Port'),
+    ('audit-cable', 'Audit Cable', 'Physical', 'Cable'),
+    ('audit-unit', '0', 'Logical', 'Unit'),
+    ('audit-service', 'Audit Service', 'Logical', 'Service'),
+    ('audit-host', 'Audit Host', 'Logical', 'Host'),
+    ('audit-peering-group', 'Audit Peering Group', 'Logical', 'Peering_Group'),
+    ('audit-customer', 'Audit Customer', 'Relation', 'Customer'),
+    ('audit-provider', 'Audit Provider', 'Relation', 'Provider'),
+    ('audit-peering-partner', 'Audit Peering Partner', 'Relation', 'Peering_Partner'),
+]
+
+SEED_RELATIONSHIPS = [
+    ('audit-site', 'audit-rack', 'Has'),
+    ('audit-router', 'audit-rack', 'Located_in'),
+    ('audit-odf', 'audit-rack', 'Located_in'),
+    ('audit-router', 'audit-router-port', 'Has'),
+    ('audit-odf', 'audit-odf-port', 'Has'),
+    ('audit-cable', 'audit-router-port', 'Connected_to'),
+    ('audit-cable', 'audit-odf-port', 'Connected_to'),
+    ('audit-unit', 'audit-router-port', 'Part_of'),
+    ('audit-service', 'audit-unit', 'Depends_on'),
+    ('audit-host', 'audit-service', 'Depends_on'),
+    ('audit-peering-group', 'audit-unit', 'Depends_on'),
+    ('audit-customer', 'audit-service', 'Uses'),
+    ('audit-provider', 'audit-service', 'Provides'),
+    ('audit-provider', 'audit-router', 'Owns'),
+    ('audit-provider', 'audit-site', 'Responsible_for'),
+    ('audit-peering-partner', 'audit-peering-group', 'Uses'),
+]
+
+# Arguments, by parameter name, for the get_ methods that take arguments
+SAMPLE_ARGUMENTS = {
+    'node_type': 'Port',
+    'port_name': 'ge-0/0/1',
+    'unit_name': '0',
+    'service_handle_id': 'audit-service',
+    'group_handle_id': 'audit-peering-group',
+    'dependency_handle_id': 'audit-unit',
+    'ip_address': '127.0.0.1',
+    'port': '80',
+    'protocol': 'tcp',
+}
+
+
+def seed(manager):
+    """
+    Creates the SEED_NODES and SEED_RELATIONSHIPS topology.
+
+    :param manager: Neo4jDBSessionManager
+    :return: Handle ids of the created nodes
+    :rtype: list
+    """
+    core.create_nodes(manager, [{'handle_id': handle_id, 'name': name, 'meta_type_label': meta_type,
+                                 'type_label': type_label}
+                                for handle_id, name, meta_type, type_label in SEED_NODES])
+    for result in core.create_relationships(manager, SEED_RELATIONSHIPS):
+        if isinstance(result, Exception):
+            raise result
+    return [node[0] for node in SEED_NODES]
+
+
+class QueryRecorder(object):
+    """
+    Instrumentation that keeps the first query text and parameters per calling function and query.
+    """
+
+    def __init__(self):
+        self.queries = {}
+
+    def record(self, event):
+        self.queries.setdefault((event.function, event.query), event)
+
+
+def collect_queries(manager, handle_ids):
+    """
+    Loads the model of every node and calls all its get_ methods, the required arguments are taken from
+    SAMPLE_ARGUMENTS. Methods with other required arguments are skipped.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_ids: Nodes to load
+    :type handle_ids: list
+
+    :return: QueryEvents of the distinct queries run, by function and query
+    :rtype: list
+    """
+    recorder = QueryRecorder()
+    previous, manager.instrumentation = manager.instrumentation, recorder
+    try:
+        for handle_id in handle_ids:
+            model = core.get_node_model(manager, handle_id)
+            for name in sorted(dir(model)):
+                method = getattr(model, name)
+                if not name.startswith('get_') or not callable(method):
+                    continue
+                arguments = helpers.required_arguments(method)
+                if not set(arguments) <= set(SAMPLE_ARGUMENTS):
+                    logger.info('{!s}.{!s} skipped, no sample arguments'.format(type(model).__name__, name))
+                    continue
+                try:
+                    method(**{argument: SAMPLE_ARGUMENTS[argument] for argument in arguments})
+                except Exception as e:
+                    logger.warning('{!s}.{!s} failed: {!s}'.format(type(model).__name__, name, e))
+    finally:
+        manager.instrumentation = previous
+    return [recorder.queries[key] for key in sorted(recorder.queries)]
+
+
+def explain(manager, query, parameters=None, profile=True):
+    """
+    Runs the query with PROFILE, or EXPLAIN, in a transaction that is rolled back. Do not use it in a unit of work.
+
+    :return: The plan
+    :rtype: neo4j.v1.ProfiledPlan|neo4j.v1.Plan
+    """
+    prefix = 'PROFILE' if profile else 'EXPLAIN'
+    with manager.session as s:
+        t = s.begin_transaction()
+        try:
+            summary = t.run('{!s} {!s}'.format(prefix, query), parameters or {}).consume()
+        finally:
+            t.success = False
+            t.close()
+    return summary.profile if profile else summary.plan
+
+
+def _operator(plan):
+    return plan.operator_type.split('@')[0]
+
+
+def _walk(plan):
+    yield plan
+    for child in plan.children:
+        for p in _walk(child):
+            yield p
+
+
+def var_length_bounds(expand_expression):
+    """
+    :param expand_expression: ExpandExpression argument of a VarLengthExpand, eg. (a)-[:Has*1..]->(b)
+    :return: [min, max], max is None when unbounded
+    :rtype: list
+    """
+    match = _VAR_LENGTH_RE.search(expand_expression or '')
+    if not match:
+        return [1, None]
+    low, dots, high = match.groups()
+    low = int(low) if low else 1
+    if not dots:
+        return [low, low] if match.group(1) else [1, None]
+    return [low, int(high) if high else None]
+
+
+def analyse_plan(plan):
+    """
+    :return: Starting operators, estimated rows, db hits, rows and variable length bounds of a plan
+    :rtype: dict
+    """
+    plans = list(_walk(plan))
+    start_operators = sorted(set(_operator(p) for p in plans if not p.children and _operator(p) != 'Argument'))
+    report = {
+        'start_operators': start_operators,
+        'scans': [operator for operator in start_operators if operator in SCAN_OPERATORS],
+        'estimated_rows': plan.arguments.get('EstimatedRows'),
+        'db_hits': sum(p.db_hits for p in plans) if hasattr(plan, 'db_hits') else None,
+        'rows': plan.rows if hasattr(plan, 'rows') else None,
+        'var_length': [var_length_bounds(p.arguments.get('ExpandExpression'))
+                       for p in plans if _operator(p).startswith('VarLengthExpand')],
+    }
+    report['unbounded'] = any(bounds[1] is None for bounds in report['var_length'])
+    return report
+
+
+def audit(manager, handle_ids, profile=True):
+    """
+    Profiles every query the models of the nodes run.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_ids: Nodes to load the models of
+    :param profile: PROFILE the queries, EXPLAIN them if False
+
+    :return: One report per function and query, keyed on the function and the order of its queries
+    :rtype: list
+    """
+    reports = []
+    counts = {}
+    for event in collect_queries(manager, handle_ids):
+        counts[event.function] = counts.get(event.function, 0) + 1
+        key = event.function
+        if counts[event.function] > 1:
+            key = '{!s} #{!s}'.format(event.function, counts[event.function])
+        report = {
+            'key': key,
+            'function': event.function,
+            'query_id': event.query_id,
+        }
+        try:
+            report.update(analyse_plan(explain(manager, event.query, event.parameters, profile)))
+        except Exception as e:
+            report['error'] = str(e)
+        reports.append(report)
+    return reports
+
+
+def find_regressions(reports, baseline, db_hits_factor=2.0):
+    """
+    Compares reports with a baseline from an earlier audit.
+
+    :param reports: Reports from audit
+    :param baseline: Reports from an earlier audit
+    :param db_hits_factor: Report queries with this many times more db hits than in the baseline
+
+    :return: (key, description) of every regression, and of the keys that are new or missing from the baseline
+    :rtype: list
+    """
+    baseline = {report['key']: report for report in baseline}
+    regressions = [(key, 'is missing, it is in the baseline')
+                   for key in sorted(set(baseline) - set(report['key'] for report in reports))]
+    for report in reports:
+        old = baseline.get(report['key'])
+        if old is None:
+            regressions.append((report['key'], 'is new, it is not in the baseline'))
+            continue
+        if 'error' in old:
+            continue
+        if 'error' in report:
+            regressions.append((report['key'], 'fails: {!s}'.format(report['error'])))
+            continue
+        new_scans = sorted(set(report['scans']) - set(old['scans']))
+        if new_scans:
+            regressions.append((report['key'], 'starts with {!s} instead of {!s}'.format(
+                ', '.join(new_scans), ', '.join(old['start_operators']))))
+        if report['unbounded'] and not old['unbounded']:
+            regressions.append((report['key'], 'has an unbounded variable length expansion'))
+        if report['db_hits'] and old['db_hits'] is not None and report['db_hits'] > old['db_hits'] * db_hits_factor:
+            regressions.append((report['key'], '{!s} db hits instead of {!s}'.format(report['db_hits'],
+                                                                                   old['db_hits'])))
+    return regressions
+
+
+def save_baseline(reports, fp):
+    json.dump(reports, fp, sort_keys=True, indent=2)
+
+
+def load_baseline(fp):
+    return json.load(fp)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='EXPLAIN/PROFILE audit of the norduniclient model queries.')
+    parser.add_argument('uri')
+    parser.add_argument('--username', default='neo4j')
+    parser.add_argument('--password')
+    parser.add_argument('--encrypted', action='store_true')
+    parser.add_argument('--baseline', help='JSON file with the reports of an earlier audit')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the reports to the baseline file')
+    parser.add_argument('--no-seed', action='store_true', help='Audit the seed nodes without creating them')
+    args = parser.parse_args(argv)
+
+    manager = Neo4jDBSessionManager(args.uri, args.username, args.password, encrypted=args.encrypted)
+    handle_ids = [node[0] for node in SEED_NODES] if args.no_seed else seed(manager)
+    reports = audit(manager, handle_ids)
+    for report in reports:
+        warnings = report.get('scans', []) + (['unbounded'] if report.get('unbounded') else [])
+        print('{!s}: {!s} {!s}'.format(report['key'], ', '.join(report.get('start_operators', [])),
+                                       ', '.join(warnings) or report.get('error', '')))
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as fp:
+            save_baseline(reports, fp)
+        return 0
+    if args.baseline:
+        with open(args.baseline) as fp:
+            regressions = find_regressions(reports, load_baseline(fp))
+        for key, description in regressions:
+            print('REGRESSION {!s}: {!s}'.format(key, description))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
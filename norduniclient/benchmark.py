@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic NORDUnet style topology and benchmarks for norduniclient.
+
+generate_topology returns the nodes and relationships of a seeded, reproducible inventory. Every scale unit adds two
+sites with racks, a router with FPCs, PICs, ports and units, an ODF, cables, optical links, multiplex sections and
+paths, services, customers and peering partners. build_topology writes it with the public core API.
+
+run builds the topology at each scale and times the core functions and every get_ method without arguments of the
+models, writing the results as JSON so runs can be compared between commits:
+
+    python -m norduniclient.benchmark bolt://localhost:7687 --password secret --scales 1 10 --output head.json
+    python -m norduniclient.benchmark --compare base.json head.json
+
+Run it against a test database, nodes with handle ids starting with bench- are deleted between scales.
+"""
+
+from __future__ import absolute_import
+
+import argparse
+import json
+import platform
+import random
+import sys
+from collections import defaultdict, namedtuple
+from functools import partial
+
+from norduniclient import core
+from norduniclient import helpers
+from norduniclient import queries
+from norduniclient.contextmanager import Neo4jDBSessionManager
+from norduniclient.instrumentation import perf_counter
+
+__author__ = 'lundberg'
+
+PREFIX = 'bench-'
+
+Topology = namedtuple('Topology', ['nodes', 'relationships'])
+
+
+class _Builder(object):
+
+    def __init__(self):
+        self.nodes = []
+        self.relationships = []
+        self.counters = defaultdict(int)
+
+    def node(self, meta_type, type_label, name=None):
+        self.counters[type_label] += 1
+        handle_id = '{!s}{!s}-{:d}'.format(PREFIX, type_label.lower(), self.counters[type_label])
+        self.nodes.append({'handle_id': handle_id, 'name': name or handle_id, 'meta_type_label': meta_type,
+                           'type_label': type_label})
+        return handle_id
+
+    def rel(self, handle_id, other_handle_id, rel_type):
+        self.relationships.append((handle_id, other_handle_id, rel_type))
+
+
+def generate_topology(scale=1, seed=0, ports_per_pic=4):
+    """
+    :param scale: Number of two site units
+    :param seed: Random seed, the same seed and scale always gives the same topology
+    :param ports_per_pic: Ports on every PIC and ODF ports per router port
+
+    :rtype: Topology
+    """
+    rnd = random.Random(seed)
+    b = _Builder()
+    provider = b.node('Relation', 'Provider', 'NORDUnet')
+    sites = []
+    for i in range(2 * scale):
+        site = b.node('Location', 'Site', 'Site {:d}'.format(i))
+        b.rel(provider, site, 'Responsible_for')
+        racks = [b.node('Location', 'Rack', 'Rack {:d}'.format(r)) for r in range(2)]
+        for rack in racks:
+            b.rel(site, rack, 'Has')
+
+        router = b.node('Physical', 'Router', 'router{:d}.nordu.net'.format(i))
+        b.rel(router, racks[0], 'Located_in')
+        b.rel(provider, router, 'Owns')
+        odf = b.node('Physical', 'ODF', 'ODF {:d}'.format(i))
+        b.rel(odf, racks[1], 'Located_in')
+
+        router_ports, units, odf_ports = [], [], []
+        for f in range(2):
+            fpc = b.node('Physical', 'FPC', 'FPC {:d}'.format(f))
+            b.rel(router, fpc, 'Has')
+            for p in range(2):
+                pic = b.node('Physical', 'PIC', 'PIC {:d}'.format(p))
+                b.rel(fpc, pic, 'Has')
+                for n in range(ports_per_pic):
+                    port = b.node('Physical', 'Port', 'xe-{:d}/{:d}/{:d}'.format(f, p, n))
+                    b.rel(pic, port, 'Has')
+                    router_ports.append(port)
+                    unit = b.node('Logical', 'Unit', '0')
+                    b.rel(unit, port, 'Part_of')
+                    units.append(unit)
+        for n in range(2 * len(router_ports)):
+            odf_port = b.node('Physical', 'Port', '{:d}'.format(n + 1))
+            b.rel(odf, odf_port, 'Has')
+            odf_ports.append(odf_port)
+        # Patch every router port to the first half of the ODF ports
+        for router_port, odf_port in zip(router_ports, odf_ports):
+            cable = b.node('Physical', 'Cable')
+            b.rel(cable, router_port, 'Connected_to')
+            b.rel(cable, odf_port, 'Connected_to')
+        sites.append({'site': site, 'router': router, 'units': units, 'odf_ports': odf_ports[len(router_ports):]})
+
+    # Optical ring between the ODFs of neighbouring sites
+    paths = []
+    for i, site in enumerate(sites):
+        other = sites[(i + 1) % len(sites)]
+        if other is site:
+            break
+        cable = b.node('Physical', 'Cable')
+        b.rel(cable, site['odf_ports'][0], 'Connected_to')
+        b.rel(cable, other['odf_ports'][1], 'Connected_to')
+        link = b.node('Logical', 'Optical_Link')
+        b.rel(link, cable, 'Depends_on')
+        oms = b.node('Logical', 'Optical_Multiplex_Section')
+        b.rel(oms, link, 'Depends_on')
+        path = b.node('Logical', 'Optical_Path')
+        b.rel(path, oms, 'Depends_on')
+        b.rel(provider, path, 'Provides')
+        paths.append(path)
+
+    all_units = [unit for site in sites for unit in site['units']]
+    for c in range(4 * scale):
+        customer = b.node('Relation', 'Customer', 'Customer {:d}'.format(c))
+        for s in range(2):
+            service = b.node('Logical', 'Service')
+            for unit in rnd.sample(all_units, 2):
+                b.rel(service, unit, 'Depends_on')
+            if paths:
+                b.rel(service, rnd.choice(paths), 'Depends_on')
+            b.rel(customer, service, 'Uses')
+            b.rel(provider, service, 'Provides')
+
+    for p in range(2 * scale):
+        partner = b.node('Relation', 'Peering_Partner', 'Peer {:d}'.format(p))
+        group = b.node('Logical', 'Peering_Group', 'Peering group {:d}'.format(p))
+        b.rel(partner, group, 'Uses')
+        b.rel(group, rnd.choice(all_units), 'Depends_on')
+
+    return Topology(b.nodes, b.relationships)
+
+
+def build_topology(manager, topology, chunk_size=1000):
+    """
+    Writes the topology with core.create_nodes and core.create_relationships.
+    """
+    core.create_nodes(manager, topology.nodes, chunk_size=chunk_size)
+    for result in core.create_relationships(manager, topology.relationships, chunk_size=chunk_size):
+        if isinstance(result, Exception):
+            raise result
+
+
+def delete_topology(manager, chunk_size=1000):
+    """
+    Deletes all nodes with a handle id starting with PREFIX.
+    """
+    q = queries.render('delete_nodes_by_handle_id_prefix')
+    while True:
+        with manager.transaction as t:
+            count = t.run(q, {'prefix': PREFIX, 'limit': chunk_size}).single()['count']
+        if count < chunk_size:
+            break
+
+
+def _sample(topology, type_label, count, rnd):
+    handle_ids = [node['handle_id'] for node in topology.nodes if node['type_label'] == type_label]
+    return rnd.sample(handle_ids, min(count, len(handle_ids)))
+
+
+def benchmarks(manager, topology, samples=3, seed=0):
+    """
+    :return: (name, callable) of the core functions and the model methods to time
+    :rtype: list
+    """
+    rnd = random.Random(seed)
+    port = _sample(topology, 'Port', 1, rnd)[0]
+    some_ids = _sample(topology, 'Port', 100, rnd)
+    first, second = topology.relationships[0][:2]
+    calls = [
+        ('core.get_node', partial(core.get_node, manager, port)),
+        ('core.get_node_bundle', partial(core.get_node_bundle, manager, port)),
+        ('core.get_nodes', partial(core.get_nodes, manager, some_ids)),
+        ('core.get_node_model', partial(core.get_node_model, manager, port)),
+        ('core.get_node_models', partial(core.get_node_models, manager, some_ids)),
+        ('core.get_nodes_by_type', lambda: list(core.get_nodes_by_type(manager, 'Port'))),
+        ('core.get_nodes_by_type.paged', lambda: list(core.get_nodes_by_type(manager, 'Port', page_size=500))),
+        ('core.get_indexed_node', lambda: list(core.get_indexed_node(manager, 'name', 'xe-0/1',
+                                                                      lookup_func='STARTS WITH'))),
+        ('core.search_nodes_by_value', lambda: list(core.search_nodes_by_value(manager, 'Customer 1',
+                                                                               node_type='Customer'))),
+        ('core.get_relationships', partial(core.get_relationships, manager, first, second)),
+    ]
+    type_labels = sorted(set(node['type_label'] for node in topology.nodes))
+    for type_label in type_labels:
+        handle_ids = _sample(topology, type_label, samples, rnd)
+        model = core.get_node_model(manager, handle_ids[0])
+        for name in sorted(dir(model)):
+            method = getattr(model, name)
+            if not name.startswith('get_') or not callable(method) or helpers.required_arguments(method):
+                continue
+            models = [core.get_node_model(manager, handle_id) for handle_id in handle_ids]
+            calls.append(('{!s}.{!s}'.format(type_label, name),
+                          partial(_call_all, [getattr(m, name) for m in models])))
+    return calls
+
+
+def _call_all(methods):
+    for method in methods:
+        method()
+
+
+def _time(func, repeat):
+    times = []
+    for i in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    times.sort()
+    return {'min': times[0], 'median': times[len(times) // 2], 'max': times[-1]}
+
+
+def run(manager, scales=(1, 5, 10), repeat=5, seed=0, label=None):
+    """
+    Builds the topology at every scale and times the benchmarks.
+
+    :return: JSON serializable results
+    :rtype: dict
+    """
+    results = []
+    for scale in scales:
+        delete_topology(manager)
+        topology = generate_topology(scale, seed)
+        start = perf_counter()
+        build_topology(manager, topology)
+        build_time = perf_counter() - start
+        size = {'scale': scale, 'nodes': len(topology.nodes), 'relationships': len(topology.relationships)}
+        results.append(dict(size, name='build_topology', min=build_time, median=build_time, max=build_time))
+        for name, func in benchmarks(manager, topology, seed=seed):
+            try:
+                results.append(dict(size, name=name, **_time(func, repeat)))
+            except Exception as e:
+                results.append(dict(size, name=name, error=str(e)))
+    delete_topology(manager)
+    return {
+        'label': label,
+        'seed': seed,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+
+def compare(base, head, threshold=1.2):
+    """
+    :return: (scale, name, base median, head median, ratio) for the benchmarks slower than threshold times base
+    :rtype: list
+    """
+    base_medians = {(r['scale'], r['name']): r['median'] for r in base['results'] if 'median' in r}
+    slower = []
+    for r in head['results']:
+        key = (r['scale'], r['name'])
+        if 'median' not in r or not base_medians.get(key):
+            continue
+        ratio = r['median'] / base_medians[key]
+        if ratio > threshold:
+            slower.append((r['scale'], r['name'], base_medians[key], r['median'], ratio))
+    return sorted(slower, key=lambda item: -item[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark norduniclient against a synthetic topology.')
+    parser.add_argument('uri', nargs='?')
+    parser.add_argument('--username', default='neo4j')
+    parser.add_argument('--password')
+    parser.add_argument('--encrypted', action='store_true')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='Compare two result files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as base, open(args.compare[1]) as head:
+            slower = compare(json.load(base), json.load(head))
+        for scale, name, base_median, head_median, ratio in slower:
+            print('{!s} scale {:d}: {:.4f}s -> {:.4f}s ({:.2f}x)'.format(name, scale, base_median, head_median,
+                                                                        ratio))
+        return 1 if slower else 0
+    if not args.uri:
+        parser.error('uri is required')
+    manager = Neo4jDBSessionManager(args.uri, args.username, args.password, encrypted=args.encrypted)
+    results = run(manager, args.scales, args.repeat, args.seed, args.label)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, sort_keys=True, indent=2)
+    else:
+        json.dump(results, sys.stdout, sort_keys=True, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
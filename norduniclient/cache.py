@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+__author__ = 'lundberg'
+
+
+class NodeCache(object):
+    """
+    Identity map for node bundles keyed on handle_id.
+
+    Without arguments the cache is unbounded and entries never expire, which is what you want for a cache scoped
+    to a single request. Set max_size to evict the least recently used entries and ttl (seconds) to expire entries
+    for a cache shared between requests.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, handle_id):
+        return self.get(handle_id) is not None
+
+    def get(self, handle_id):
+        with self._lock:
+            entry = self._entries.pop(handle_id, None)
+            if entry is None:
+                return None
+            bundle, expires = entry
+            if expires is not None and expires < time.time():
+                return None
+            self._entries[handle_id] = entry  # Mark as most recently used
+            return bundle
+
+    def set(self, handle_id, bundle):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries.pop(handle_id, None)
+            self._entries[handle_id] = (bundle, expires)
+            if self.max_size is not None:
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+    def evict(self, *handle_ids):
+        with self._lock:
+            for handle_id in handle_ids:
+                self._entries.pop(handle_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -3,11 +3,27 @@
 from __future__ import absolute_import
 
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from threading import local, Lock
+from neo4j.v1 import READ_ACCESS, WRITE_ACCESS
 from norduniclient.core import get_db_driver
+from norduniclient.cache import NodeCache
+from norduniclient.instrumentation import InstrumentedSession
 
 __author__ = 'lundberg'
 
 
+def _bookmark_position(bookmark):
+    """
+    :return: Transaction id of a neo4j:bookmark:v1:tx<id> bookmark, or -1 for other formats
+    :rtype: int
+    """
+    try:
+        return int(bookmark.rsplit(':tx', 1)[1])
+    except (IndexError, ValueError):
+        return -1
+
+
 class Neo4jDBSessionManager:
 
     """
@@ -17,40 +33,269 @@ class Neo4jDBSessionManager:
     Neo4jDBSessionManager.session()
 
     Neo4jDBSessionManager.transaction()
+
+    Neo4jDBSessionManager.read_session() is used for read only work. It is opened with read access mode, so a
+    routing uri (bolt+routing://) sends it to a follower, or to the driver for read_uri if one is given. Sessions
+    start after the bookmark of the last write made through the manager, so reads see earlier writes.
+
+    Use Neo4jDBSessionManager.unit_of_work() to run several calls in the same session and transaction.
+
+    Use Neo4jDBSessionManager.gather(*calls) to run independent calls concurrently.
+
+    Pass a NodeCache as node_cache to keep loaded nodes between calls, or use Neo4jDBSessionManager.identity_map to
+    cache nodes for the duration of a with block in the current thread. Writes through norduniclient evict the
+    affected nodes from the caches.
+
+    Pass a norduniclient.search.SearchIndex as search_index to answer search_nodes_by_value from a client side index,
+    it is added to node_listeners to follow the writes.
+    Objects in node_listeners, like norduniclient.typeahead.PrefixIndex, have invalidate(*handle_ids) called when
+    nodes change. Objects in relationship_listeners have invalidate(*handle_ids) called with the start and end nodes
+    of relationships created or deleted through norduniclient.core.
+
+    A norduniclient.impact.DependencyGraph sets itself as dependency_graph to answer the get_dependent_as_types and
+    get_dependencies_as_types model methods from a client side snapshot.
+
+    With materialize_dependents set, writes through norduniclient keep the transitive Depends_on and Part_of
+    dependents of every node stored on the node, and get_dependent_as_types of CommonQueries looks them up instead of
+    expanding the dependency paths. Run norduniclient.core.rebuild_dependents before enabling it.
+
+    Node properties in normalized_properties get a lower cased shadow property, eg. _name_lc for name, that
+    get_indexed_node uses for case insensitive lookups. Run norduniclient.core.backfill_normalized_properties to
+    normalize existing nodes and index the shadow properties.
+
+    Set instrumentation, eg. a norduniclient.instrumentation.QueryMetrics, to record the calling function, wall time,
+    time to first record, number of records and errors of every query.
     """
 
-    def __init__(self, uri, username=None, password=None, encrypted=True, max_pool_size=50):
+    def __init__(self, uri, username=None, password=None, encrypted=True, max_pool_size=50, node_cache=None,
+                 read_uri=None, search_index=None, normalized_properties=None, instrumentation=None,
+                 materialize_dependents=False):
         self.uri = uri
         self.driver = get_db_driver(uri, username, password, encrypted, max_pool_size)
+        self.read_driver = self.driver
+        if read_uri:
+            self.read_driver = get_db_driver(read_uri, username, password, encrypted, max_pool_size)
+        self.last_bookmark = None
+        self._bookmark_lock = Lock()
+        self.max_pool_size = max_pool_size
+        self._node_cache = node_cache
+        self.node_listeners = []
+        self.relationship_listeners = []
+        self._search_index = None
+        self.search_index = search_index
+        self.dependency_graph = None
+        self.materialize_dependents = materialize_dependents
+        self.instrumentation = instrumentation
+        self.normalized_properties = tuple(normalized_properties or ())
+        self._local = local()
+        self._executor = None
+        self._executor_lock = Lock()
+
+    def _get_node_cache(self):
+        scoped_cache = getattr(self._local, 'node_cache', None)
+        if scoped_cache is not None:
+            return scoped_cache
+        return self._node_cache
+
+    def _set_node_cache(self, node_cache):
+        self._node_cache = node_cache
+    node_cache = property(_get_node_cache, _set_node_cache)
+
+    def _get_search_index(self):
+        return self._search_index
+
+    def _set_search_index(self, search_index):
+        # The search index follows node writes as a node listener
+        if self._search_index is not None and self._search_index in self.node_listeners:
+            self.node_listeners.remove(self._search_index)
+        self._search_index = search_index
+        if search_index is not None:
+            self.node_listeners.append(search_index)
+    search_index = property(_get_search_index, _set_search_index)
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_pool_size)
+            return self._executor
+    executor = property(_get_executor)
+
+    def run_pooled(self, func, *args, **kwargs):
+        """
+        Runs a call on a thread of the executor, marking the thread so gather called from it does not wait on the
+        executor. Submit calls to the executor through it.
+        """
+        previous = getattr(self._local, 'pooled', False)
+        self._local.pooled = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._local.pooled = previous
+
+    def _run_inline(self, call):
+        transaction, self._local.transaction = getattr(self._local, 'transaction', None), None
+        try:
+            return call()
+        except Exception as e:
+            return e
+        finally:
+            self._local.transaction = transaction
+
+    def gather(self, *calls):
+        """
+        Runs independent calls, for example model methods, concurrently on a thread pool bounded by max_pool_size.
+        Use functools.partial for calls that take arguments. The calls run outside any unit of work of the
+        calling thread. Called from a thread of the pool, the calls run one after the other in that thread, as
+        waiting for other threads of a full pool would deadlock.
+
+        :param calls: Callables without arguments
+        :return: The result of each call, or the exception it raised, in the order of the calls
+        :rtype: list
+        """
+        if getattr(self._local, 'pooled', False):
+            return [self._run_inline(call) for call in calls]
+        futures = [self.executor.submit(self.run_pooled, call) for call in calls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _changed(self):
+        return getattr(self._local, 'changed', None) or (set(), set())
+
+    def evict_nodes(self, *handle_ids):
+        self._changed()[0].update(handle_ids)
+        for cache in (getattr(self._local, 'node_cache', None), self._node_cache):
+            if cache is not None:
+                cache.evict(*handle_ids)
+        for listener in self.node_listeners:
+            listener.invalidate(*handle_ids)
+
+    def relationships_changed(self, *handle_ids):
+        self._changed()[1].update(handle_ids)
+        for listener in self.relationship_listeners:
+            listener.invalidate(*handle_ids)
 
     @contextmanager
-    def _session(self):
-        session = self.driver.session()
+    def _identity_map(self):
+        previous = getattr(self._local, 'node_cache', None)
+        self._local.node_cache = NodeCache()
         try:
-            yield session
+            yield self._local.node_cache
+        finally:
+            self._local.node_cache = previous
+    identity_map = property(_identity_map)
+
+    @contextmanager
+    def _open_session(self, driver, access_mode):
+        transaction = getattr(self._local, 'transaction', None)
+        if transaction is not None:  # Inside a unit of work
+            yield transaction
+            return
+        session = driver.session(access_mode=access_mode, bookmark=self.last_bookmark)
+        instrumented = self._instrument(session)
+        try:
+            yield instrumented
         except Exception as e:
             raise e
         finally:
             try:
+                if instrumented is not session:
+                    instrumented.finish()
                 session.close()
+                if access_mode == WRITE_ACCESS:
+                    self._advance_bookmark(session)
             except Exception:
                 pass
+
+    def _advance_bookmark(self, session):
+        # Sessions closed concurrently must not move last_bookmark back to an earlier write
+        bookmark = session.last_bookmark()
+        if not bookmark:
+            return
+        with self._bookmark_lock:
+            if self.last_bookmark is None or _bookmark_position(bookmark) >= _bookmark_position(self.last_bookmark):
+                self.last_bookmark = bookmark
+
+    def _instrument(self, session):
+        if self.instrumentation is None:
+            return session
+        return InstrumentedSession(session, self.instrumentation)
+
+    def _session(self):
+        return self._open_session(self.driver, WRITE_ACCESS)
     session = property(_session)
 
+    def _read_session(self):
+        return self._open_session(self.read_driver, READ_ACCESS)
+    read_session = property(_read_session)
+
     @contextmanager
     def _transaction(self):
-        session = self.driver.session()
+        transaction = getattr(self._local, 'transaction', None)
+        if transaction is not None:  # Inside a unit of work
+            yield transaction
+            return
+        session = self.driver.session(access_mode=WRITE_ACCESS, bookmark=self.last_bookmark)
         transaction = session.begin_transaction()
+        instrumented = self._instrument(transaction)
         try:
-            yield transaction
+            yield instrumented
         except Exception as e:
             transaction.success = False
             raise e
         else:
-            transaction.success = True
+            if transaction.success is None:
+                transaction.success = True
         finally:
             try:
-                session.close()
-            except Exception:
-                pass
+                if instrumented is not transaction:
+                    instrumented.finish()
+                if not transaction.closed():
+                    transaction.close()
+            finally:
+                try:
+                    session.close()
+                    self._advance_bookmark(session)
+                except Exception:
+                    pass
     transaction = property(_transaction)
+
+    @contextmanager
+    def unit_of_work(self, rollback=False):
+        """
+        Runs everything done with this manager in the current thread within the with block in one session and
+        transaction. The transaction is committed when the block exits and rolled back if it raises. A unit of work
+        started inside another one joins the outer unit of work.
+
+        Nodes read in the unit of work are cached for the current thread only, as other threads should not see
+        uncommitted changes. When the unit of work ends the nodes and relationships it changed are evicted from the
+        caches and listeners again, as they might have loaded the changes before they were committed or rolled back.
+
+        :param rollback: Always roll back the transaction, eg. to isolate tests from each other
+        :type rollback: bool
+        """
+        if getattr(self._local, 'transaction', None) is not None:
+            yield self._local.transaction
+            return
+        previous_cache = getattr(self._local, 'node_cache', None)
+        changed_nodes, changed_relationships = self._local.changed = set(), set()
+        try:
+            with self.transaction as transaction:
+                self._local.transaction = transaction
+                if previous_cache is None and self._node_cache is not None:
+                    self._local.node_cache = NodeCache()
+                try:
+                    yield transaction
+                    if rollback:
+                        transaction.success = False
+                finally:
+                    self._local.transaction = None
+                    self._local.node_cache = previous_cache
+        finally:
+            self._local.changed = None
+            self.evict_nodes(*changed_nodes)
+            self.relationships_changed(*changed_relationships)
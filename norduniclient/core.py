@@ -20,44 +20,118 @@
 
 from __future__ import absolute_import
 
+import base64
+import json
+import re
+from itertools import islice
+from collections import defaultdict
 from neo4j.v1 import GraphDatabase, basic_auth
 from neo4j.exceptions import ProtocolError
 from norduniclient import exceptions
+from norduniclient import helpers
 from norduniclient import models
+from norduniclient import queries
+from norduniclient import schema
 
 import logging
 logger = logging.getLogger(__name__)
 
-# Load Django settings
+# Exported to norduniclient by its star import
+__all__ = [
+    'exceptions', 'models',
+    'NEO4J_URI', 'NEO4J_USERNAME', 'NEO4J_PASSWORD', 'MAX_POOL_SIZE', 'ENCRYPTED', 'META_TYPES', 'RELATIONSHIP_RULES',
+    'POSSIBLE_RELATIONSHIPS', 'DEPENDENCY_RELATIONSHIP_TYPES', 'REGEX_CHARACTERS',
+    'get_settings', 'GraphDB', 'init_db', 'get_db_driver',
+    'query_to_dict', 'query_to_list', 'query_to_iterator', 'read_query_to_dict', 'read_query_to_list',
+    'read_query_to_iterator', 'neo4j_entity_to_dict',
+    'create_node', 'create_nodes', 'get_node', 'get_nodes', 'get_node_bundle', 'delete_node', 'get_node_meta_type',
+    'get_relationship', 'get_relationship_bundle', 'delete_relationship',
+    'create_resume_token', 'get_nodes_by_value', 'get_node_by_type', 'search_nodes_by_value', 'get_nodes_by_type',
+    'get_nodes_by_name', 'create_index', 'get_indexed_node', 'backfill_normalized_properties',
+    'refresh_dependents', 'rebuild_dependents', 'get_unique_node_by_name',
+    'create_location_relationship', 'create_logical_relationship', 'create_relation_relationship',
+    'create_physical_relationship', 'create_relationship', 'create_relationships', 'get_relationships',
+    'set_node_properties', 'set_relationship_properties', 'get_node_model', 'get_node_models', 'get_relationship_model',
+]
+
+# Defaults, overridden by Django settings when init_db is called without arguments
 NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD = None, None, None
 MAX_POOL_SIZE = 50
 ENCRYPTED = False
-try:
-    from django.conf import settings as django_settings
-    try:
-        # Mandatory Django settings for quick init
-        NEO4J_URI = django_settings.NEO4J_RESOURCE_URI
-        NEO4J_USERNAME = django_settings.NEO4J_USERNAME
-        NEO4J_PASSWORD = django_settings.NEO4J_PASSWORD
-    except AttributeError:
-        pass
-    # Optional Django settings for quick init
-    try:
-        MAX_POOL_SIZE = django_settings.NEO4J_MAX_POOL_SIZE
-    except AttributeError:
-        pass
+
+
+def get_settings():
+    """
+    Reads the Neo4j settings from Django settings if Django is available and configured.
+
+    :return: uri, username, password, encrypted and max_pool_size
+    :rtype: dict
+    """
+    settings = {
+        'uri': NEO4J_URI,
+        'username': NEO4J_USERNAME,
+        'password': NEO4J_PASSWORD,
+        'encrypted': ENCRYPTED,
+        'max_pool_size': MAX_POOL_SIZE,
+    }
     try:
-        ENCRYPTED = django_settings.NEO4J_ENCRYPTED
-    except AttributeError:
-        pass
-except ImportError:
-    logger.info('Starting up without a Django environment.')
-    logger.info('Initial: norduniclient.neo4jdb == None.')
-    logger.info('Use norduniclient.init_db to open a database connection.')
+        from django.conf import settings as django_settings
+        from django.core.exceptions import ImproperlyConfigured
+    except ImportError:
+        logger.info('Starting up without a Django environment.')
+        logger.info('Use norduniclient.init_db to open a database connection.')
+        return settings
+    names = {
+        'uri': 'NEO4J_RESOURCE_URI',
+        'username': 'NEO4J_USERNAME',
+        'password': 'NEO4J_PASSWORD',
+        'encrypted': 'NEO4J_ENCRYPTED',
+        'max_pool_size': 'NEO4J_MAX_POOL_SIZE',
+    }
+    for key, name in names.items():
+        try:
+            settings[key] = getattr(django_settings, name)
+        except AttributeError:
+            pass
+        except ImproperlyConfigured:
+            logger.info('Django settings are not configured.')
+            break
+    return settings
 
 
 META_TYPES = ['Physical', 'Logical', 'Relation', 'Location']
 
+# Allowed relationship types keyed on start node meta type and end node meta type
+RELATIONSHIP_RULES = {
+    'Location': {
+        'Location': ['Has'],
+    },
+    'Logical': {
+        'Logical': ['Depends_on'],
+        'Physical': ['Depends_on', 'Part_of'],
+    },
+    'Relation': {
+        'Logical': ['Uses', 'Provides'],
+        'Location': ['Responsible_for'],
+        'Physical': ['Owns', 'Provides'],
+    },
+    'Physical': {
+        'Physical': ['Has', 'Connected_to'],
+        'Location': ['Located_in'],
+    },
+}
+
+POSSIBLE_RELATIONSHIPS = ['{}:{}:{}'.format(meta_type, other_meta_type, rel_type)
+                          for meta_type, rules in RELATIONSHIP_RULES.items()
+                          for other_meta_type, rel_types in rules.items()
+                          for rel_type in rel_types]
+
+# Relationship types followed by the materialized dependents
+DEPENDENCY_RELATIONSHIP_TYPES = ('Depends_on', 'Part_of')
+
+# Values of search_nodes_by_value without these are matched the same as a regular expression and as a substring
+REGEX_CHARACTERS = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
 
 class GraphDB(object):
 
@@ -70,9 +144,6 @@ class GraphDB(object):
             cls._instance = cls()
         return cls._instance
 
-    def __init__(self):
-        self._manager = self.manager
-
     @property
     def manager(self):
         if self._manager is None:
@@ -88,23 +159,31 @@ class GraphDB(object):
         self._manager = manager
 
 
-def init_db(uri=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD, encrypted=ENCRYPTED,
-            max_pool_size=MAX_POOL_SIZE):
+def init_db(uri=None, username=None, password=None, encrypted=None, max_pool_size=None):
+    """
+    Creates a Neo4jDBSessionManager and sets up the database schema. Arguments that are not given are read from
+    Django settings.
+
+    :rtype: norduniclient.contextmanager.Neo4jDBSessionManager|None
+    """
+    if uri is None:
+        settings = get_settings()
+        uri = settings['uri']
+        username = username if username is not None else settings['username']
+        password = password if password is not None else settings['password']
+        encrypted = encrypted if encrypted is not None else settings['encrypted']
+        max_pool_size = max_pool_size if max_pool_size is not None else settings['max_pool_size']
+    encrypted = encrypted if encrypted is not None else ENCRYPTED
+    max_pool_size = max_pool_size if max_pool_size is not None else MAX_POOL_SIZE
     if uri:
         try:
             from norduniclient.contextmanager import Neo4jDBSessionManager
             manager = Neo4jDBSessionManager(uri=uri, username=username, password=password, encrypted=encrypted,
                                             max_pool_size=max_pool_size)
             try:
-                with manager.session as s:
-                    s.run('CREATE CONSTRAINT ON (n:Node) ASSERT n.handle_id IS UNIQUE')
+                schema.ensure_schema(manager)
             except Exception as e:
-                logger.error('Could not create constraints for Neo4j database: {!s}'.format(uri))
-                raise e
-            try:
-                create_index(manager, 'name')
-            except Exception as e:
-                logger.error('Could not create index for Neo4j database: {!s}'.format(uri))
+                logger.error('Could not create constraints and indexes for Neo4j database: {!s}'.format(uri))
                 raise e
             return manager
         except ProtocolError as e:
@@ -114,7 +193,7 @@ def init_db(uri=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD, enc
 
 def get_db_driver(uri, username=None, password=None, encrypted=True, max_pool_size=50, trust=0):
     """
-    :param uri: Bolt uri
+    :param uri: Bolt uri, or memory://name for the in-memory graph name
     :type uri: str
     :param username: Neo4j username
     :type username: str
@@ -127,46 +206,85 @@ def get_db_driver(uri, username=None, password=None, encrypted=True, max_pool_si
     :param trust: Trust cert on first use (0) or do not accept unknown cert (1)
     :type trust: Integer
     :return: Neo4j driver
-    :rtype: neo4j.v1.session.Driver
+    :rtype: neo4j.v1.session.Driver|norduniclient.memory.MemoryDriver
     """
+    if uri.startswith('memory://'):
+        from norduniclient import memory
+        return memory.MemoryDriver(uri)
     return GraphDatabase.driver(uri, auth=basic_auth(username, password), encrypted=encrypted,
                                 max_pool_size=max_pool_size, trust=trust)
 
 
 def query_to_dict(manager, query, **kwargs):
-    d = {}
     with manager.session as s:
-        result = s.run(query, kwargs)
-        for record in result:
-            for key, value in record.items():
-                d[key] = value
-    return d
+        return _records_to_dict(s.run(query, kwargs))
 
 
 def query_to_list(manager, query, **kwargs):
-    out = []
     with manager.session as s:
-        result = s.run(query, kwargs)
-        for record in result:
-            d = {}
-            for key, value in record.items():
-                d[key] = value
-            out.append(d)
-    return out
+        return _records_to_list(s.run(query, kwargs))
 
 
 def query_to_iterator(manager, query, **kwargs):
     with manager.session as s:
-        result = s.run(query, kwargs)
-        for record in result:
-            d = {}
-            for key, value in record.items():
-                d[key] = value
+        for d in _records_to_iterator(s.run(query, kwargs)):
             yield d
 
 
-def neo4j_entity_to_dict(node):
-    return {k: v for k, v in node.items()}
+def read_query_to_dict(manager, query, **kwargs):
+    """
+    Same as query_to_dict for read only queries, using a read session.
+    """
+    with manager.read_session as s:
+        return _records_to_dict(s.run(query, kwargs))
+
+
+def read_query_to_list(manager, query, **kwargs):
+    """
+    Same as query_to_list for read only queries, using a read session.
+    """
+    with manager.read_session as s:
+        return _records_to_list(s.run(query, kwargs))
+
+
+def read_query_to_iterator(manager, query, **kwargs):
+    """
+    Same as query_to_iterator for read only queries, using a read session.
+    """
+    with manager.read_session as s:
+        for d in _records_to_iterator(s.run(query, kwargs)):
+            yield d
+
+
+def _records_to_dict(result):
+    d = {}
+    for record in result:
+        for key, value in record.items():
+            d[key] = value
+    return d
+
+
+def _records_to_list(result):
+    return list(_records_to_iterator(result))
+
+
+def _records_to_iterator(result):
+    for record in result:
+        d = {}
+        for key, value in record.items():
+            d[key] = value
+        yield d
+
+
+def neo4j_entity_to_dict(node, normalized_properties=()):
+    """
+    :param node: Node or relationship
+    :param normalized_properties: Leave out the shadow properties of these properties, see
+        Neo4jDBSessionManager.normalized_properties
+    :return: The properties that were not set by norduniclient
+    :rtype: dict
+    """
+    return {k: v for k, v in node.items() if not helpers.is_internal_property(k, normalized_properties)}
 
 
 def create_node(manager, name, meta_type_label, type_label, handle_id):
@@ -189,12 +307,53 @@ def create_node(manager, name, meta_type_label, type_label, handle_id):
     """
     if meta_type_label not in META_TYPES:
         raise exceptions.MetaLabelNamingError(meta_type_label)
-    q = """
-        CREATE (n:Node:%s:%s { name: { name }, handle_id: { handle_id }})
-        RETURN n
-        """ % (meta_type_label, type_label)
+    props = helpers.normalize_properties({'name': name, 'handle_id': handle_id}, manager.normalized_properties)
+    q = queries.render('create_node', meta_type=meta_type_label, label=type_label)
     with manager.session as s:
-        return neo4j_entity_to_dict(s.run(q, {'name': name, 'handle_id': handle_id}).single()['n'])
+        node = neo4j_entity_to_dict(s.run(q, {'props': props}).single()['n'], manager.normalized_properties)
+    manager.evict_nodes(handle_id)
+    return node
+
+
+def _chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+def create_nodes(manager, nodes, chunk_size=1000):
+    """
+    Creates nodes in bulk. The nodes are grouped by meta type and type label and written with one UNWIND
+    statement per group, using one transaction per chunk of nodes.
+
+    :param manager: Manager to handle sessions and transactions
+    :param nodes: Dicts with the keys name, meta_type_label, type_label and handle_id, as for create_node
+    :param chunk_size: Number of nodes written per transaction
+
+    :type manager: norduniclient.contextmanager.Neo4jDBSessionManager
+    :type nodes: collections.Iterable
+    :type chunk_size: int
+
+    :rtype: list
+    """
+    created = []
+    for chunk in _chunks(nodes, chunk_size):
+        groups = defaultdict(list)
+        for spec in chunk:
+            if spec['meta_type_label'] not in META_TYPES:
+                raise exceptions.MetaLabelNamingError(spec['meta_type_label'])
+            props = helpers.normalize_properties({'name': spec['name'], 'handle_id': spec['handle_id']},
+                                                 manager.normalized_properties)
+            groups[(spec['meta_type_label'], spec['type_label'])].append(props)
+        with manager.transaction as t:
+            for (meta_type_label, type_label), rows in groups.items():
+                q = queries.render('create_nodes', meta_type=meta_type_label, label=type_label)
+                created.extend(neo4j_entity_to_dict(record['n'], manager.normalized_properties)
+                               for record in t.run(q, {'rows': rows}))
+        manager.evict_nodes(*[spec['handle_id'] for spec in chunk])
+    return created
 
 
 def get_node(manager, handle_id):
@@ -207,13 +366,32 @@ def get_node(manager, handle_id):
 
     :rtype: dict|neo4j.v1.types.Node
     """
-    q = 'MATCH (n:Node { handle_id: {handle_id} }) RETURN n'
+    return get_node_bundle(manager, handle_id)['data']
 
-    with manager.session as s:
-        result = s.run(q, {'handle_id': handle_id}).single()
-        if result:
-            return neo4j_entity_to_dict(result['n'])
-    raise exceptions.NodeNotFound(manager, handle_id)
+
+def _get_nodes(manager, handle_ids):
+    q = queries.render('get_nodes')
+    nodes = dict.fromkeys(handle_ids)
+    with manager.read_session as s:
+        for record in s.run(q, {'handle_ids': list(handle_ids)}):
+            nodes[record['n']['handle_id']] = record['n']
+    return nodes
+
+
+def get_nodes(manager, handle_ids):
+    """
+    Fetches all nodes with one query. Handle ids that did not match a node are mapped to None.
+
+    :param manager: Manager to handle sessions and transactions
+    :param handle_ids: Unique ids
+
+    :type manager: norduniclient.contextmanager.Neo4jDBSessionManager
+    :type handle_ids: list
+
+    :rtype: dict
+    """
+    return {handle_id: neo4j_entity_to_dict(node, manager.normalized_properties) if node is not None else None
+            for handle_id, node in _get_nodes(manager, handle_ids).items()}
 
 
 def get_node_bundle(manager, handle_id=None, node=None):
@@ -225,15 +403,20 @@ def get_node_bundle(manager, handle_id=None, node=None):
     :type node: neo4j.v1.types.Node
     :return: dict
     """
+    cache = manager.node_cache
     if not node:
-        q = 'MATCH (n:Node { handle_id: {handle_id} }) RETURN n'
-        with manager.session as s:
+        if cache is not None:
+            d = cache.get(handle_id)
+            if d is not None:
+                return {'data': dict(d['data']), 'meta_type': d.get('meta_type'), 'labels': list(d['labels'])}
+        q = queries.render('get_node')
+        with manager.read_session as s:
             result = s.run(q, {'handle_id': handle_id}).single()
             if not result:
                 raise exceptions.NodeNotFound(manager, handle_id)
             node = result['n']
     d = {
-        'data': neo4j_entity_to_dict(node)
+        'data': neo4j_entity_to_dict(node, manager.normalized_properties)
     }
     labels = list(node.labels)
     labels.remove('Node')  # All nodes have this label for indexing
@@ -242,6 +425,9 @@ def get_node_bundle(manager, handle_id=None, node=None):
             d['meta_type'] = label
             labels.remove(label)
     d['labels'] = labels
+    if cache is not None:
+        cache.set(d['data']['handle_id'], {'data': dict(d['data']), 'meta_type': d.get('meta_type'),
+                                           'labels': list(labels)})
     return d
 
 
@@ -254,13 +440,18 @@ def delete_node(manager, handle_id):
 
     :rtype: bool
     """
-    q = """
-        MATCH (n:Node {handle_id: {handle_id}})
-        OPTIONAL MATCH (n)-[r]-()
-        DELETE n,r
-        """
-    with manager.session as s:
-        s.run(q, {'handle_id': handle_id})
+    with manager.unit_of_work():
+        dependencies = []
+        if manager.materialize_dependents:
+            q = queries.render('get_dependencies_closure')
+            with manager.session as s:
+                dependencies = s.run(q, {'handle_ids': [handle_id]}).single()['handle_ids']
+        q = queries.render('delete_node')
+        with manager.session as s:
+            s.run(q, {'handle_id': handle_id})
+        if dependencies:
+            refresh_dependents(manager, dependencies)
+    manager.evict_nodes(handle_id)
     return True
 
 
@@ -274,12 +465,8 @@ def get_relationship(manager, relationship_id):
 
     :rtype int|neo4j.v1.types.Relationship
     """
-    q = """
-        MATCH ()-[r]->()
-        WHERE ID(r) = {relationship_id}
-        RETURN r
-        """
-    with manager.session as s:
+    q = queries.render('get_relationship')
+    with manager.read_session as s:
         record = s.run(q, {'relationship_id': int(relationship_id)}).single()
         if record:
             return neo4j_entity_to_dict(record['r'])
@@ -295,13 +482,8 @@ def get_relationship_bundle(manager, relationship_id=None):
 
     :rtype: dictionary
     """
-    q = """
-        MATCH (start)-[r]->(end)
-        WHERE ID(r) = {relationship_id}
-        RETURN start, r, end
-        """
-
-    with manager.session as s:
+    q = queries.render('get_relationship_bundle')
+    with manager.read_session as s:
         record = s.run(q, {'relationship_id': int(relationship_id)}).single()
     if record is None:
         raise exceptions.RelationshipNotFound(manager, int(relationship_id))
@@ -310,8 +492,8 @@ def get_relationship_bundle(manager, relationship_id=None):
         'type': record['r'].type,
         'id': int(relationship_id),
         'data': neo4j_entity_to_dict(record['r']),
-        'start': neo4j_entity_to_dict(record['start']),
-        'end': neo4j_entity_to_dict(record['end']),
+        'start': neo4j_entity_to_dict(record['start'], manager.normalized_properties),
+        'end': neo4j_entity_to_dict(record['end'], manager.normalized_properties),
     }
 
 
@@ -323,13 +505,14 @@ def delete_relationship(manager, relationship_id):
     :param relationship_id: Internal Neo4j relationship id
     :return: bool
     """
-    q = """
-        MATCH ()-[r]->()
-        WHERE ID(r) = {relationship_id}
-        DELETE r
-        """
-    with manager.session as s:
-        s.run(q, {'relationship_id': int(relationship_id)})
+    q = queries.render('delete_relationship')
+    with manager.unit_of_work():
+        with manager.session as s:
+            record = s.run(q, {'relationship_id': int(relationship_id)}).single()
+        if record and manager.materialize_dependents:
+            refresh_dependents(manager, [record['end']])
+    if record:
+        manager.relationships_changed(record['start'], record['end'])
     return True
 
 
@@ -347,8 +530,49 @@ def get_node_meta_type(manager, handle_id):
     return node['meta_type']
 
 
+def create_resume_token(node):
+    """
+    Returns an opaque token that resumes a paginated node iteration after the supplied node.
+
+    :param node: Node or node dict
+    :type node: dict|neo4j.v1.types.Node
+    :rtype: str
+    """
+    return base64.urlsafe_b64encode(json.dumps(node['handle_id']).encode('utf-8')).decode('ascii')
+
+
+def _decode_resume_token(token):
+    return json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+
+
+def _iterate_nodes(manager, template, identifiers, params, page_size=None, token=None):
+    """
+    Runs the query template and yields n from every record. With a page_size the nodes are fetched ordered by
+    handle_id with the _first_page and _page variants of the template, one page per session, continuing after the
+    node the token was created from.
+    """
+    if page_size is None:
+        q = queries.render(template, **identifiers)
+        with manager.read_session as s:
+            for result in s.run(q, params):
+                yield result['n']
+        return
+    params = dict(params, limit=page_size)
+    if token:
+        params['after'] = _decode_resume_token(token)
+    while True:
+        q = queries.render(template + ('_page' if 'after' in params else '_first_page'), **identifiers)
+        with manager.read_session as s:
+            page = [result['n'] for result in s.run(q, params)]
+        for node in page:
+            yield node
+        if len(page) < page_size:
+            return
+        params['after'] = page[-1]['handle_id']
+
+
 # TODO: Try out elasticsearch
-def get_nodes_by_value(manager, value, prop, node_type='Node'):
+def get_nodes_by_value(manager, value, prop, node_type='Node', page_size=None, resume_token=None):
     """
     Traverses all nodes or nodes of specified label and compares the property/properties of the node
     with the supplied string.
@@ -357,86 +581,89 @@ def get_nodes_by_value(manager, value, prop, node_type='Node'):
     :param value: Value to search for
     :param prop: Which property to look for value in
     :param node_type:
+    :param page_size: Fetch the nodes ordered by handle_id in pages of this size, one session per page
+    :param resume_token: Token from norduniclient.core.create_resume_token to continue after
 
     :type value: str|list|bool|int
     :type prop: str
     :type node_type: str
+    :type page_size: int
+    :type resume_token: str
     :return: dicts
     """
-    q = """
-        MATCH (n:{label})
-        WHERE n.{prop} = {{value}}
-        RETURN distinct n
-        """.format(label=node_type, prop=prop)
-
-    with manager.session as s:
-        for result in s.run(q, {'value': value}):
-            yield neo4j_entity_to_dict(result['n'])
+    for node in _iterate_nodes(manager, 'nodes_by_value', {'label': node_type, 'prop': prop}, {'value': value},
+                               page_size, resume_token):
+        yield neo4j_entity_to_dict(node, manager.normalized_properties)
 
 
-def get_node_by_type(manager, node_type):
-    q = """
-        MATCH (n:{label})
-        RETURN distinct n
-        """.format(label=node_type)
-    with manager.session as s:
-        for result in s.run(q):
-            yield neo4j_entity_to_dict(result['n'])
+def get_node_by_type(manager, node_type, page_size=None, resume_token=None):
+    for node in _iterate_nodes(manager, 'nodes_by_label', {'label': node_type}, {}, page_size, resume_token):
+        yield neo4j_entity_to_dict(node, manager.normalized_properties)
 
 
-def search_nodes_by_value(manager, value, prop=None, node_type='Node'):
+def search_nodes_by_value(manager, value, prop=None, node_type='Node', page_size=None, resume_token=None,
+                          literal=False):
     """
     Traverses all nodes or nodes of specified label and fuzzy compares the property/properties of the node
-    with the supplied string.
+    with the supplied string. Value is a case insensitive regular expression matched anywhere in the property, pass
+    literal=True to match it as a plain substring instead. Properties kept by norduniclient, like the materialized
+    dependents, are not searched.
+
+    If the manager has a norduniclient.search.SearchIndex the nodes are looked up in it instead, for literal searches
+    and for values without regular expression characters.
 
     :param manager: Neo4jDBSessionManager
     :param value: Value to search for
     :param prop: Which property to look for value in
     :param node_type:
+    :param page_size: Fetch the nodes ordered by handle_id in pages of this size, one session per page
+    :param resume_token: Token from norduniclient.core.create_resume_token to continue after
+    :param literal: Match value as a substring, not as a regular expression
 
     :type value: str
     :type prop: str
     :type node_type: str
+    :type page_size: int
+    :type resume_token: str
+    :type literal: bool
     :return: dicts
     """
-    if prop:
-        q = """
-            MATCH (n:{label})
-            WHERE n.{prop} =~ "(?i).*{value}.*" OR any(x IN n.{prop} WHERE x =~ "(?i).*{value}.*")
-            RETURN distinct n
-            """.format(label=node_type, prop=prop, value=value)
+    if literal:
+        params = {'regex': '(?i).*' + re.escape(value) + '.*'}
     else:
-        q = """
-            MATCH (n:{label})
-            WITH n, keys(n) as props
-            WHERE any(prop in props WHERE n[prop] =~ "(?i).*{value}.*") OR
-              any(prop in props WHERE any(x IN n[prop] WHERE x =~ "(?i).*{value}.*"))
-            RETURN distinct n
-            """.format(label=node_type, value=value)
-
-    with manager.session as s:
-        for result in s.run(q):
-            yield result['n']
+        params = {'regex': '(?i).*' + value + '.*'}
+    if manager.search_index is not None and (literal or not REGEX_CHARACTERS.search(value)):
+        nodes = manager.search_index.search_nodes(manager, value, prop, node_type, page_size, resume_token)
+    elif prop:
+        nodes = _iterate_nodes(manager, 'search_nodes_by_property', {'label': node_type, 'prop': prop}, params,
+                               page_size, resume_token)
+    else:
+        nodes = _iterate_nodes(manager, 'search_nodes', {'label': node_type}, params, page_size, resume_token)
+    for node in nodes:
+        yield node
 
 
 # TODO: Try out elasticsearch
-def get_nodes_by_type(manager, node_type):
-    q = """
-        MATCH (n:{label})
-        RETURN n
-        """.format(label=node_type)
-    with manager.session as s:
-        for result in s.run(q):
-            yield result['n']
+def get_nodes_by_type(manager, node_type, page_size=None, resume_token=None):
+    """
+    :param manager: Neo4jDBSessionManager
+    :param node_type: Label
+    :param page_size: Fetch the nodes ordered by handle_id in pages of this size, one session per page
+    :param resume_token: Token from norduniclient.core.create_resume_token to continue after
+
+    :type node_type: str
+    :type page_size: int
+    :type resume_token: str
+    :return: Nodes
+    """
+    for node in _iterate_nodes(manager, 'nodes_by_label', {'label': node_type}, {}, page_size, resume_token):
+        yield node
 
 
 # TODO: Try out elasticsearch
 def get_nodes_by_name(manager, name):
-    q = """
-        MATCH (n:Node {name: {name}})
-        RETURN n
-        """
-    with manager.session as s:
+    q = queries.render('get_nodes_by_name')
+    with manager.read_session as s:
         for result in s.run(q, {'name': name}):
             yield result['n']
 
@@ -452,7 +679,7 @@ def create_index(manager, prop, node_type='Node'):
     :type node_type: str
     """
     with manager.session as s:
-        s.run('CREATE INDEX ON :{node_type}({prop})'.format(node_type=node_type, prop=prop))
+        s.run(queries.render('create_index', label=node_type, prop=prop))
 
 
 def get_indexed_node(manager, prop, value, node_type='Node', lookup_func='CONTAINS'):
@@ -472,14 +699,93 @@ def get_indexed_node(manager, prop, value, node_type='Node', lookup_func='CONTAI
     :return: Dict or Node object
     :rtype: dict|Node
     """
-    q = """
-        MATCH (n:{label})
-        WHERE LOWER(n.{prop}) {lookup_func} LOWER({{value}})
-        RETURN n
-        """.format(label=node_type, prop=prop, lookup_func=lookup_func)
-    with manager.session as s:
+    if prop in manager.normalized_properties:
+        # Compare with the lower cased shadow property so the index on it can be used
+        q = queries.render('get_normalized_node', label=node_type, shadow_prop=helpers.shadow_property(prop),
+                           lookup_func=lookup_func)
+        value = value.lower()
+    else:
+        q = queries.render('get_indexed_node', label=node_type, prop=prop, lookup_func=lookup_func)
+    with manager.read_session as s:
         for result in s.run(q, {'value': value}):
-            yield neo4j_entity_to_dict(result['n'])
+            yield neo4j_entity_to_dict(result['n'], manager.normalized_properties)
+
+
+def backfill_normalized_properties(manager, props=None, labels=('Node',), chunk_size=1000):
+    """
+    Sets the lower cased shadow properties of existing nodes and creates the indexes on them. Run it after adding
+    properties to Neo4jDBSessionManager.normalized_properties.
+
+    :param manager: Neo4jDBSessionManager
+    :param props: Properties to normalize, defaults to manager.normalized_properties
+    :param labels: Labels to index the shadow properties for
+    :param chunk_size: Number of nodes updated per transaction
+
+    :type props: list
+    :type labels: list
+    :type chunk_size: int
+
+    :return: Number of updated nodes
+    :rtype: int
+    """
+    props = manager.normalized_properties if props is None else props
+    schema.ensure_schema(manager, [schema.Index(label, helpers.shadow_property(prop))
+                                   for label in labels for prop in props])
+    updated = 0
+    for prop in props:
+        q = queries.render('backfill_normalized_property', prop=prop, shadow_prop=helpers.shadow_property(prop))
+        while True:
+            with manager.transaction as t:
+                count = t.run(q, {'limit': chunk_size}).single()['count']
+            updated += count
+            if count < chunk_size:
+                break
+    return updated
+
+
+def refresh_dependents(manager, handle_ids):
+    """
+    Updates the materialized dependents of the nodes and of the nodes they depend on, directly or transitively
+    through Depends_on and Part_of relationships. The dependents are the handle ids of the nodes that depend on a node
+    through up to 20 Depends_on and Part_of relationships, kept in a hidden property on the node.
+
+    Writes made through norduniclient refresh the dependents in the transaction of the write when
+    Neo4jDBSessionManager.materialize_dependents is set.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_ids: Unique ids of the nodes with changed dependencies or dependents
+    :type handle_ids: collections.Iterable
+
+    :return: Number of updated nodes
+    :rtype: int
+    """
+    q = queries.render('set_dependents')
+    with manager.session as s:
+        return s.run(q, {'handle_ids': list(handle_ids)}).single()['count']
+
+
+def rebuild_dependents(manager, chunk_size=1000):
+    """
+    Sets the materialized dependents of all nodes, see refresh_dependents. Run it before setting
+    Neo4jDBSessionManager.materialize_dependents, or to repair the dependents after writes made outside
+    norduniclient.
+
+    :param manager: Neo4jDBSessionManager
+    :param chunk_size: Number of nodes updated per transaction
+    :type chunk_size: int
+
+    :return: Number of updated nodes
+    :rtype: int
+    """
+    q = queries.render('set_dependents_first_page')
+    updated, after = 0, None
+    while True:
+        with manager.transaction as t:
+            record = t.run(q, {'after': after, 'limit': chunk_size}).single()
+        updated += record['count']
+        if record['count'] < chunk_size:
+            return updated
+        q, after = queries.render('set_dependents_page'), record['last']
 
 
 def get_unique_node_by_name(manager, node_name, node_type):
@@ -491,13 +797,8 @@ def get_unique_node_by_name(manager, node_name, node_type):
     :param node_type: str|unicode
     :return: norduniclient node model or None
     """
-    q = """
-        MATCH (n:Node { name: {name} })
-        WHERE {label} IN labels(n)
-        RETURN n.handle_id as handle_id
-        """
-
-    with manager.session as s:
+    q = queries.render('get_unique_node_by_name')
+    with manager.read_session as s:
         result = list(s.run(q, {'name': node_name, 'label': node_type}))
 
     if result:
@@ -521,15 +822,63 @@ def _create_relationship(manager, handle_id, other_handle_id, rel_type):
 
     :rtype: int relationship_id
     """
+    q = queries.render('create_relationship', rel_type=rel_type)
+    with manager.unit_of_work():
+        with manager.session as s:
+            relationship_id = s.run(q, {'start': handle_id, 'end': other_handle_id}).single()['r'].id
+        if manager.materialize_dependents and rel_type in DEPENDENCY_RELATIONSHIP_TYPES:
+            refresh_dependents(manager, [other_handle_id])
+    manager.relationships_changed(handle_id, other_handle_id)
+    return relationship_id
 
-    q = """
-        MATCH (a:Node {handle_id: {start}}),(b:Node {handle_id: {end}})
-        CREATE (a)-[r:%s]->(b)
-        RETURN r
-        """ % rel_type
 
-    with manager.session as s:
-        return s.run(q, {'start': handle_id, 'end': other_handle_id}).single()['r'].id
+def _create_validated_relationship(manager, handle_id, other_handle_id, rel_type, meta_type=None):
+    """
+    Resolves the meta types of both nodes, checks them against RELATIONSHIP_RULES and creates the
+    relationship in a single statement.
+
+    :param manager: Context manager to handle transactions
+    :param handle_id: Node handle id
+    :param other_handle_id: Other node handle id
+    :param rel_type: Relationship type
+    :param meta_type: Meta type to use for the start node instead of the one stored in the database
+
+    :type manager: Neo4jDBSessionManager
+    :type handle_id: str|unicode
+    :type other_handle_id: str|unicode
+    :type rel_type: str|unicode
+    :type meta_type: str|unicode|None
+
+    :rtype: int relationship_id
+    """
+    q = queries.render('create_validated_relationship', rel_type=rel_type)
+    params = {
+        'start': handle_id,
+        'end': other_handle_id,
+        'rel_type': rel_type,
+        'meta_type': meta_type,
+        'meta_types': META_TYPES,
+        'possible': POSSIBLE_RELATIONSHIPS,
+    }
+    with manager.unit_of_work():
+        with manager.session as s:
+            record = s.run(q, params).single()
+        if record['id'] is not None and manager.materialize_dependents and \
+                rel_type in DEPENDENCY_RELATIONSHIP_TYPES:
+            refresh_dependents(manager, [other_handle_id])
+    if not record['start_found']:
+        raise exceptions.NodeNotFound(manager, handle_id)
+    if record['start_meta'] is None:
+        raise exceptions.NoMetaLabelFound(handle_id)
+    if not record['end_found']:
+        raise exceptions.NodeNotFound(manager, other_handle_id)
+    if record['end_meta'] is None:
+        raise exceptions.NoMetaLabelFound(other_handle_id)
+    if record['id'] is None:
+        raise exceptions.NoRelationshipPossible(handle_id, record['start_meta'], other_handle_id,
+                                                record['end_meta'], rel_type)
+    manager.relationships_changed(handle_id, other_handle_id)
+    return record['id']
 
 
 def create_location_relationship(manager, location_handle_id, other_handle_id, rel_type):
@@ -538,10 +887,7 @@ def create_location_relationship(manager, location_handle_id, other_handle_id, r
     If a relationship is not possible NoRelationshipPossible exception is
     raised.
     """
-    other_meta_type = get_node_meta_type(manager, other_handle_id)
-    if other_meta_type == 'Location' and rel_type == 'Has':
-        return _create_relationship(manager, location_handle_id, other_handle_id, rel_type)
-    raise exceptions.NoRelationshipPossible(location_handle_id, 'Location', other_handle_id, other_meta_type, rel_type)
+    return _create_validated_relationship(manager, location_handle_id, other_handle_id, rel_type, 'Location')
 
 
 def create_logical_relationship(manager, logical_handle_id, other_handle_id, rel_type):
@@ -550,14 +896,7 @@ def create_logical_relationship(manager, logical_handle_id, other_handle_id, rel
     If a relationship is not possible NoRelationshipPossible exception is
     raised.
     """
-    other_meta_type = get_node_meta_type(manager, other_handle_id)
-    if rel_type == 'Depends_on':
-        if other_meta_type == 'Logical' or other_meta_type == 'Physical':
-            return _create_relationship(manager, logical_handle_id, other_handle_id, rel_type)
-    elif rel_type == 'Part_of':
-        if other_meta_type == 'Physical':
-            return _create_relationship(manager, logical_handle_id, other_handle_id, rel_type)
-    raise exceptions.NoRelationshipPossible(logical_handle_id, 'Logical', other_handle_id, other_meta_type, rel_type)
+    return _create_validated_relationship(manager, logical_handle_id, other_handle_id, rel_type, 'Logical')
 
 
 def create_relation_relationship(manager, relation_handle_id, other_handle_id, rel_type):
@@ -566,16 +905,7 @@ def create_relation_relationship(manager, relation_handle_id, other_handle_id, r
     If a relationship is not possible NoRelationshipPossible exception is
     raised.
     """
-    other_meta_type = get_node_meta_type(manager, other_handle_id)
-    if other_meta_type == 'Logical':
-        if rel_type in ['Uses', 'Provides']:
-            return _create_relationship(manager, relation_handle_id, other_handle_id, rel_type)
-    elif other_meta_type == 'Location' and rel_type == 'Responsible_for':
-        return _create_relationship(manager, relation_handle_id, other_handle_id, rel_type)
-    elif other_meta_type == 'Physical':
-        if rel_type in ['Owns', 'Provides']:
-            return _create_relationship(manager, relation_handle_id, other_handle_id, rel_type)
-    raise exceptions.NoRelationshipPossible(relation_handle_id, 'Relation', other_handle_id, other_meta_type, rel_type)
+    return _create_validated_relationship(manager, relation_handle_id, other_handle_id, rel_type, 'Relation')
 
 
 def create_physical_relationship(manager, physical_handle_id, other_handle_id, rel_type):
@@ -584,13 +914,7 @@ def create_physical_relationship(manager, physical_handle_id, other_handle_id, r
     If a relationship is not possible NoRelationshipPossible exception is
     raised.
     """
-    other_meta_type = get_node_meta_type(manager, other_handle_id)
-    if other_meta_type == 'Physical':
-        if rel_type == 'Has' or rel_type == 'Connected_to':
-            return _create_relationship(manager, physical_handle_id, other_handle_id, rel_type)
-    elif other_meta_type == 'Location' and rel_type == 'Located_in':
-        return _create_relationship(manager, physical_handle_id, other_handle_id, rel_type)
-    raise exceptions.NoRelationshipPossible(physical_handle_id, 'Physical', other_handle_id, other_meta_type, rel_type)
+    return _create_validated_relationship(manager, physical_handle_id, other_handle_id, rel_type, 'Physical')
 
 
 def create_relationship(manager, handle_id, other_handle_id, rel_type):
@@ -599,17 +923,67 @@ def create_relationship(manager, handle_id, other_handle_id, rel_type):
     meta_type the nodes are. Returns the relationship or raises
     NoRelationshipPossible exception.
     """
-    meta_type = get_node_meta_type(manager, handle_id)
-    if meta_type == 'Location':
-        return create_location_relationship(manager, handle_id, other_handle_id, rel_type)
-    elif meta_type == 'Logical':
-        return create_logical_relationship(manager, handle_id, other_handle_id, rel_type)
-    elif meta_type == 'Relation':
-        return create_relation_relationship(manager, handle_id, other_handle_id, rel_type)
-    elif meta_type == 'Physical':
-        return create_physical_relationship(manager, handle_id, other_handle_id, rel_type)
-    other_meta_type = get_node_meta_type(manager, other_handle_id)
-    raise exceptions.NoRelationshipPossible(handle_id, meta_type, other_handle_id, other_meta_type, rel_type)
+    return _create_validated_relationship(manager, handle_id, other_handle_id, rel_type)
+
+
+def create_relationships(manager, relationships, chunk_size=1000):
+    """
+    Creates relationships in bulk. The meta types of all nodes are resolved with one query and every
+    relationship is checked against RELATIONSHIP_RULES. The possible relationships are written with one UNWIND
+    statement per relationship type, using one transaction per chunk of relationships.
+
+    :param manager: Context manager to handle transactions
+    :param relationships: Tuples of (handle_id, other_handle_id, rel_type)
+    :param chunk_size: Number of relationships written per transaction
+
+    :type manager: Neo4jDBSessionManager
+    :type relationships: collections.Iterable
+    :type chunk_size: int
+
+    :return: Relationship id or the exception explaining why the relationship could not be created, per row
+    :rtype: list
+    """
+    relationships = list(relationships)
+    q = queries.render('get_meta_types')
+    handle_ids = list(set([h for handle_id, other_handle_id, rel_type in relationships
+                           for h in (handle_id, other_handle_id)]))
+    with manager.read_session as s:
+        meta_types = {record['handle_id']: record['meta_type']
+                      for record in s.run(q, {'handle_ids': handle_ids, 'meta_types': META_TYPES})}
+
+    results = [None] * len(relationships)
+    possible = []
+    for index, (handle_id, other_handle_id, rel_type) in enumerate(relationships):
+        if handle_id not in meta_types:
+            results[index] = exceptions.NodeNotFound(manager, handle_id)
+        elif meta_types[handle_id] is None:
+            results[index] = exceptions.NoMetaLabelFound(handle_id)
+        elif other_handle_id not in meta_types:
+            results[index] = exceptions.NodeNotFound(manager, other_handle_id)
+        elif meta_types[other_handle_id] is None:
+            results[index] = exceptions.NoMetaLabelFound(other_handle_id)
+        elif rel_type not in RELATIONSHIP_RULES.get(meta_types[handle_id], {}).get(meta_types[other_handle_id], []):
+            results[index] = exceptions.NoRelationshipPossible(handle_id, meta_types[handle_id], other_handle_id,
+                                                               meta_types[other_handle_id], rel_type)
+        else:
+            possible.append({'index': index, 'start': handle_id, 'end': other_handle_id, 'rel_type': rel_type})
+
+    for chunk in _chunks(possible, chunk_size):
+        groups = defaultdict(list)
+        for row in chunk:
+            groups[row['rel_type']].append(row)
+        with manager.unit_of_work():
+            with manager.transaction as t:
+                for rel_type, rows in groups.items():
+                    q = queries.render('create_relationships', rel_type=rel_type)
+                    for record in t.run(q, {'rows': rows}):
+                        results[record['index']] = record['id']
+            if manager.materialize_dependents:
+                ends = set([row['end'] for row in chunk if row['rel_type'] in DEPENDENCY_RELATIONSHIP_TYPES])
+                if ends:
+                    refresh_dependents(manager, ends)
+        manager.relationships_changed(*set([h for row in chunk for h in (row['start'], row['end'])]))
+    return results
 
 
 def get_relationships(manager, handle_id1, handle_id2, rel_type=None):
@@ -619,39 +993,26 @@ def get_relationships(manager, handle_id1, handle_id2, rel_type=None):
     Returns the relationships between the nodes or an empty list.
     """
     if rel_type:
-        q = """
-        MATCH (a:Node {{handle_id: {{handle_id1}}}})-[r:{rel_type}]-(b:Node {{handle_id: {{handle_id2}}}})
-        RETURN collect(r) as relationships
-        """.format(rel_type=rel_type)
+        q = queries.render('get_relationships_by_type', rel_type=rel_type)
     else:
-        q = """
-            MATCH (a:Node {handle_id: {handle_id1}})-[r]-(b:Node {handle_id: {handle_id2}})
-            RETURN collect(r) as relationships
-            """
-    with manager.session as s:
+        q = queries.render('get_relationships')
+    with manager.read_session as s:
         return s.run(q, {'handle_id1': handle_id1, 'handle_id2': handle_id2}).single()['relationships']
 
 
 def set_node_properties(manager, handle_id, new_properties):
-    new_properties['handle_id'] = handle_id  # Make sure the handle_id can't be changed
+    props = dict(new_properties, handle_id=handle_id)  # Make sure the handle_id can't be changed
+    helpers.normalize_properties(props, manager.normalized_properties)
 
-    q = """
-        MATCH (n:Node {handle_id: {props}.handle_id})
-        SET n = {props}
-        RETURN n
-        """
+    q = queries.render('set_node_properties')
     with manager.session as s:
-        return neo4j_entity_to_dict(s.run(q, {'handle_id': handle_id, 'props': new_properties}).single()['n'])
+        node = s.run(q, {'handle_id': handle_id, 'props': props}).single()['n']
+    manager.evict_nodes(handle_id)
+    return neo4j_entity_to_dict(node, manager.normalized_properties)
 
 
 def set_relationship_properties(manager, relationship_id, new_properties):
-
-    q = """
-        MATCH ()-[r]->()
-        WHERE ID(r) = {relationship_id}
-        SET r = {props}
-        RETURN r
-        """
+    q = queries.render('set_relationship_properties')
     with manager.session as s:
         return s.run(q, {'relationship_id': int(relationship_id), 'props': new_properties}).single()
 
@@ -668,23 +1029,22 @@ def get_node_model(manager, handle_id=None, node=None):
     :rtype: models.BaseNodeModel or sub class of models.BaseNodeModel
     """
     bundle = get_node_bundle(manager, handle_id, node)
-    for label in bundle.get('labels'):
-        try:
-            classname = '{meta_type}{base}Model'.format(meta_type=bundle.get('meta_type'), base=label).replace('_', '')
-            return getattr(models, classname)(manager).load(bundle)
-        except AttributeError:
-            pass
-    for label in bundle.get('labels'):
-        try:
-            classname = '{base}Model'.format(base=label).replace('_', '')
-            return getattr(models, classname)(manager).load(bundle)
-        except AttributeError:
-            pass
-    try:
-        classname = '{base}Model'.format(base=bundle.get('meta_type'))
-        return getattr(models, classname)(manager).load(bundle)
-    except AttributeError:
-        return models.BaseNodeModel(manager).load(bundle)
+    return models.get_model_class(bundle.get('meta_type'), bundle.get('labels'))(manager).load(bundle)
+
+
+def get_node_models(manager, handle_ids):
+    """
+    Fetches all nodes with one query. Handle ids that did not match a node are mapped to None.
+
+    :param manager: Context manager to handle transactions
+    :type manager: Neo4jDBSessionManager
+    :param handle_ids: Nodes handle ids
+    :type handle_ids: list
+    :return: Node models keyed on handle id
+    :rtype: dict
+    """
+    return {handle_id: get_node_model(manager, node=node) if node is not None else None
+            for handle_id, node in _get_nodes(manager, handle_ids).items()}
 
 
 def get_relationship_model(manager, relationship_id):
@@ -114,3 +114,14 @@ class RelationshipNotFound(Exception):
 
     def __str__(self):
         return self.message
+
+
+class InvalidIdentifier(Exception):
+    """
+    A label, relationship type, property key or lookup function that can not be used in a query.
+    """
+    def __init__(self, identifier):
+        self.identifier = identifier
+
+    def __str__(self):
+        return '{identifier!r} is not a valid identifier.'.format(identifier=self.identifier)
@@ -1,15 +1,58 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import inspect
+
 __author__ = 'lundberg'
 
 
-def update_item_properties(item_properties, new_properties):
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+def update_item_properties(item_properties, new_properties, normalized_properties=None):
     for key, value in new_properties.items():
         if value or value is 0:
             item_properties[key] = value
         elif key in item_properties.keys():
             del item_properties[key]
+    if normalized_properties:
+        normalize_properties(item_properties, normalized_properties)
+    return item_properties
+
+
+def shadow_property(prop):
+    """
+    Returns the name of the lower cased shadow property kept for prop, eg. _name_lc for name.
+    """
+    return '_{!s}_lc'.format(prop)
+
+
+# Handle ids of the nodes that depend on a node, see norduniclient.core.refresh_dependents
+DEPENDENTS_PROPERTY = '_dependents'
+
+
+def is_internal_property(key, normalized_properties=()):
+    """
+    Returns True for properties maintained by norduniclient, the shadow properties of normalized_properties and the
+    materialized dependents.
+    """
+    return key == DEPENDENTS_PROPERTY or any(key == shadow_property(prop) for prop in normalized_properties)
+
+
+def normalize_properties(item_properties, normalized_properties):
+    """
+    Sets the lower cased shadow property for every property in normalized_properties that has a string value and
+    removes the shadow property for the others.
+    """
+    for prop in normalized_properties:
+        value = item_properties.get(prop)
+        if isinstance(value, string_types):
+            item_properties[shadow_property(prop)] = value.lower()
+        else:
+            item_properties.pop(shadow_property(prop), None)
     return item_properties
 
 
@@ -41,3 +84,18 @@ def merge_list(existing_value, new_value):
     """
     new_set = set(existing_value + new_value)
     return list(new_set)
+
+
+def required_arguments(method):
+    """
+    :param method: Bound method
+    :return: Names of the arguments without a default value, not counting self or *args and **kwargs
+    :rtype: list
+    """
+    try:
+        signature = inspect.signature(method)
+    except AttributeError:  # Python 2
+        spec = inspect.getargspec(method)
+        return spec.args[1:len(spec.args) - len(spec.defaults or ())]
+    return [p.name for p in signature.parameters.values()
+            if p.default is p.empty and p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)]
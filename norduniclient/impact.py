@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Client side snapshot of the dependency graph for transitive impact queries.
+
+DependencyGraph loads the Depends_on, Part_of, Has and Connected_to relationships once into adjacency lists indexed
+by integer node ids, and answers get_dependent_as_types and get_dependencies_as_types with a breadth first search
+instead of variable length expansions in Neo4j. Only the nodes in the answer are fetched, with one query.
+
+It sets itself as dependency_graph on the manager, which makes the model methods use it, and follows the writes made
+through the manager as a node and relationship listener. The relationships of changed nodes are fetched again before
+the next lookup.
+
+    graph = DependencyGraph(manager)
+    graph.build()
+    core.get_node_model(manager, handle_id).get_dependent_as_types()
+
+Like the Cypher it replaces, the search does not follow a relationship twice in the same path. Undirected
+Connected_to expansions only return the node they start from if it is reached from another start node.
+"""
+
+from __future__ import absolute_import
+
+from threading import RLock
+
+from norduniclient import core
+from norduniclient import queries
+
+__author__ = 'lundberg'
+
+DEPENDENCY_TYPES = ('Depends_on', 'Part_of', 'Has', 'Connected_to')
+
+# Labels the results are grouped by, as bit flags
+SERVICE, OPTICAL_PATH, OPTICAL_MULTIPLEX_SECTION, OPTICAL_LINK, CABLE, HOST_SERVICE = 1, 2, 4, 8, 16, 32
+LABEL_FLAGS = {
+    'Service': SERVICE,
+    'Optical_Path': OPTICAL_PATH,
+    'Optical_Multiplex_Section': OPTICAL_MULTIPLEX_SECTION,
+    'Optical_Link': OPTICAL_LINK,
+    'Cable': CABLE,
+    'Host_Service': HOST_SERVICE,
+}
+TYPE_GROUPS = (('services', SERVICE), ('paths', OPTICAL_PATH), ('oms', OPTICAL_MULTIPLEX_SECTION),
+               ('links', OPTICAL_LINK))
+
+
+def _flags(labels):
+    flags = 0
+    for label in labels:
+        flags |= LABEL_FLAGS.get(label, 0)
+    return flags
+
+
+class DependencyGraph(object):
+    """
+    Adjacency of the dependency relationships of all nodes.
+
+    :param manager: Neo4jDBSessionManager
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._lock = RLock()
+        self._dirty = set()
+        self._clear()
+        manager.node_listeners.append(self)
+        manager.relationship_listeners.append(self)
+        manager.dependency_graph = self
+
+    def _clear(self):
+        self._index = {}  # handle_id -> node id
+        self._handle_ids = []  # node id -> handle_id, None for deleted nodes
+        self._flags = []  # node id -> LABEL_FLAGS of the node
+        self._out = {rel_type: [] for rel_type in DEPENDENCY_TYPES}  # type -> node id -> end node ids
+        self._in = {rel_type: [] for rel_type in DEPENDENCY_TYPES}  # type -> node id -> start node ids
+        self._edges = {}  # relationship id -> (start node id, type, end node id)
+        self._incident = []  # node id -> relationship ids
+
+    def __len__(self):
+        return len(self._index)
+
+    def _add_node(self, handle_id, labels=()):
+        i = self._index.get(handle_id)
+        if i is None:
+            i = self._index[handle_id] = len(self._handle_ids)
+            self._handle_ids.append(handle_id)
+            self._flags.append(0)
+            self._incident.append(set())
+            for rel_type in DEPENDENCY_TYPES:
+                self._out[rel_type].append([])
+                self._in[rel_type].append([])
+        self._flags[i] = _flags(labels)
+        return i
+
+    def _add_edge(self, relationship_id, start, rel_type, end):
+        if relationship_id in self._edges:
+            return
+        a, b = self._index[start], self._index[end]
+        self._edges[relationship_id] = (a, rel_type, b)
+        self._out[rel_type][a].append(b)
+        self._in[rel_type][b].append(a)
+        self._incident[a].add(relationship_id)
+        self._incident[b].add(relationship_id)
+
+    def _remove_edge(self, relationship_id):
+        a, rel_type, b = self._edges.pop(relationship_id)
+        self._out[rel_type][a].remove(b)
+        self._in[rel_type][b].remove(a)
+        self._incident[a].discard(relationship_id)
+        self._incident[b].discard(relationship_id)
+
+    def _remove_node(self, handle_id):
+        i = self._index.pop(handle_id)
+        for relationship_id in list(self._incident[i]):
+            self._remove_edge(relationship_id)
+        self._handle_ids[i] = None
+        self._flags[i] = 0
+
+    def build(self):
+        """
+        Loads the dependency relationships of all nodes.
+        """
+        with self._lock:
+            self._dirty.clear()
+            self._clear()
+            with self.manager.read_session as s:
+                for record in s.run(queries.render('get_dependency_nodes')):
+                    self._add_node(record['handle_id'], record['labels'])
+                for record in s.run(queries.render('get_dependency_edges')):
+                    self._add_edge(record['id'], record['start'], record['type'], record['end'])
+
+    def close(self):
+        """
+        Stops following writes made through the manager.
+        """
+        for listeners in (self.manager.node_listeners, self.manager.relationship_listeners):
+            if self in listeners:
+                listeners.remove(self)
+        if self.manager.dependency_graph is self:
+            self.manager.dependency_graph = None
+
+    def invalidate(self, *handle_ids):
+        with self._lock:
+            self._dirty.update(handle_ids)
+
+    def refresh(self):
+        """
+        Fetches the labels and dependency relationships of the nodes changed since the last refresh.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            try:
+                with self.manager.read_session as s:
+                    params = {'handle_ids': list(dirty)}
+                    edges = list(s.run(queries.render('get_dependency_edges_by_handle_ids'), params))
+                    unknown = set(h for edge in edges for h in (edge['start'], edge['end']) if h not in self._index)
+                    params = {'handle_ids': list(dirty | unknown)}
+                    nodes = list(s.run(queries.render('get_dependency_nodes_by_handle_ids'), params))
+            except Exception:
+                self._dirty.update(dirty)
+                raise
+            found = set(record['handle_id'] for record in nodes)
+            for handle_id in dirty:
+                if handle_id not in self._index:
+                    continue
+                if handle_id in found:
+                    for relationship_id in list(self._incident[self._index[handle_id]]):
+                        self._remove_edge(relationship_id)
+                else:
+                    self._remove_node(handle_id)
+            for record in nodes:
+                self._add_node(record['handle_id'], record['labels'])
+            for edge in edges:
+                self._add_edge(edge['id'], edge['start'], edge['type'], edge['end'])
+
+    @staticmethod
+    def _expand(sources, adjacencies, max_depth, undirected=False):
+        """
+        :param sources: Node ids to start from
+        :param adjacencies: Adjacency lists to follow
+        :param max_depth: Maximum number of relationships to follow
+        :param undirected: The adjacency lists hold both directions of the same relationships
+        :return: Node ids reachable from any of the sources by following 1 to max_depth relationships
+        :rtype: set
+        """
+        depth = dict.fromkeys(sources, 0)
+        origin = {i: i for i in depth}
+        reached = set()
+        frontier = list(depth)
+        for level in range(1, max_depth + 1):
+            if not frontier:
+                break
+            next_frontier = []
+            for i in frontier:
+                for adjacency in adjacencies:
+                    for j in adjacency[i]:
+                        if j not in depth:
+                            depth[j] = level
+                            origin[j] = origin[i]
+                            reached.add(j)
+                            next_frontier.append(j)
+                        elif depth[j] == 0 and not (undirected and origin[i] == j):
+                            reached.add(j)  # A source reached from another source, or by a directed cycle
+            frontier = next_frontier
+        return reached
+
+    def _nodes(self, *groups):
+        handle_ids = set(self._handle_ids[i] for group in groups for i in group)
+        nodes = core._get_nodes(self.manager, list(handle_ids))
+        return [[nodes[self._handle_ids[i]] for i in sorted(group) if nodes[self._handle_ids[i]] is not None]
+                for group in groups]
+
+    def _as_types(self, deps, direct=None, cables=None):
+        groups = [set(i for i in deps if self._flags[i] & flag) for key, flag in TYPE_GROUPS]
+        keys = [key for key, flag in TYPE_GROUPS]
+        if direct is not None:
+            groups.insert(0, direct)
+            keys.insert(0, 'direct')
+        if cables is not None:
+            groups.append(set(i for i in cables if self._flags[i] & CABLE))
+            keys.append('cables')
+        return dict(zip(keys, self._nodes(*groups)))
+
+    def _node_id(self, handle_id):
+        self.refresh()
+        return self._index.get(handle_id)
+
+    def get_common_dependent_as_types(self, handle_id):
+        """
+        Same as norduniclient.models.CommonQueries.get_dependent_as_types.
+        """
+        with self._lock:
+            i = self._node_id(handle_id)
+            if i is None:
+                return {}
+            deps = self._expand([i], [self._in['Part_of'], self._in['Depends_on']], 20)
+            if not deps:
+                return {}
+            return self._as_types(deps, direct=set(self._in['Depends_on'][i]))
+
+    def get_host_dependent_as_types(self, handle_id):
+        """
+        Same as norduniclient.models.HostModel.get_dependent_as_types.
+        """
+        with self._lock:
+            i = self._node_id(handle_id)
+            if i is None:
+                return {}
+            deps = self._expand([i], [self._in['Depends_on']], 20)
+            if not deps:
+                return {}
+            direct = set(j for j in self._in['Depends_on'][i] if not self._flags[j] & HOST_SERVICE)
+            return self._as_types(deps, direct=direct)
+
+    def get_equipment_dependent_as_types(self, handle_id):
+        """
+        Same as norduniclient.models.EquipmentModel.get_dependent_as_types.
+        """
+        with self._lock:
+            i = self._node_id(handle_id)
+            if i is None:
+                return {}
+            direct = set(self._in['Depends_on'][i])
+            parts = self._expand([i], [self._out['Has']], 20)
+            deps = self._expand(parts, [self._in['Part_of'], self._in['Depends_on']], 20)
+            # (part)<-[:Connected_to]-(cable)-[:Connected_to]->(other end)
+            other_ends = set()
+            for part in parts:
+                for cable in self._in['Connected_to'][part]:
+                    ends = list(self._out['Connected_to'][cable])
+                    ends.remove(part)
+                    other_ends.update(ends)
+            deps |= self._expand(other_ends, [self._in['Depends_on']], 20) | direct
+            if not deps:
+                return {}
+            return self._as_types(deps, direct=direct)
+
+    def get_cable_dependent_as_types(self, handle_id):
+        """
+        Same as norduniclient.models.CableModel.get_dependent_as_types.
+        """
+        with self._lock:
+            i = self._node_id(handle_id)
+            if i is None:
+                return self._as_types(set())
+            equipment = self._expand([i], [self._out['Connected_to'], self._in['Connected_to']], 20, undirected=True)
+            return self._as_types(self._expand(equipment, [self._in['Part_of'], self._in['Depends_on']], 10))
+
+    def get_dependencies_as_types(self, handle_id):
+        """
+        Same as norduniclient.models.CommonQueries.get_dependencies_as_types.
+        """
+        with self._lock:
+            i = self._node_id(handle_id)
+            if i is None:
+                return {}
+            deps = self._expand([i], [self._out['Depends_on']], 20)
+            if not deps:
+                return {}
+            cables = self._expand(deps, [self._out['Connected_to'], self._in['Connected_to']], 50, undirected=True)
+            return self._as_types(deps, direct=set(self._out['Depends_on'][i]), cables=cables)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Per query metrics for the queries run through a Neo4jDBSessionManager.
+
+Set an object with a record(event) method as Neo4jDBSessionManager.instrumentation and every query run in the
+sessions and transactions of the manager is reported as a QueryEvent when its result has been consumed. QueryMetrics
+keeps the recent events per calling function and query and computes percentiles from them.
+
+    metrics = QueryMetrics()
+    manager.instrumentation = metrics
+    ...
+    metrics.summary()  # {'norduniclient.models.RouterModel.get_ports': {'count': 12, 'p50': 0.003, ...}, ...}
+
+Without instrumentation the sessions are not wrapped at all.
+"""
+
+from __future__ import absolute_import
+
+import json
+import math
+import sys
+import time
+from collections import defaultdict, deque, namedtuple
+from threading import Lock
+
+from norduniclient import queries
+
+__author__ = 'lundberg'
+
+try:
+    perf_counter = time.perf_counter
+except AttributeError:  # Python 2
+    perf_counter = time.time
+
+
+QueryEvent = namedtuple('QueryEvent', ['function', 'query_id', 'wall_time', 'first_record_time', 'records', 'error',
+                                       'query', 'parameters'])
+
+# Functions that only pass queries on, the function calling them is reported instead
+_PASS_THROUGH = frozenset([
+    'query_to_dict', 'query_to_list', 'query_to_iterator', 'read_query_to_dict', 'read_query_to_list',
+    'read_query_to_iterator', '_records_to_dict', '_records_to_list', '_records_to_iterator', '_iterate_nodes',
+    '_basic_read_query_to_dict', '_basic_write_query_to_dict',
+])
+
+
+def calling_function(depth=2):
+    """
+    :return: module.Class.function of the first caller outside the session machinery
+    :rtype: str
+    """
+    frame = sys._getframe(depth)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        name = frame.f_code.co_name
+        if module in ('contextlib', __name__) or (module.startswith('norduniclient') and name in _PASS_THROUGH):
+            frame = frame.f_back
+            continue
+        instance = frame.f_locals.get('self')
+        if instance is not None and frame.f_code.co_varnames[:1] == ('self',):
+            return '{!s}.{!s}.{!s}'.format(module, instance.__class__.__name__, name)
+        return '{!s}.{!s}'.format(module, name)
+    return 'unknown'
+
+
+class InstrumentedResult(object):
+    """
+    Wraps a driver result and reports a QueryEvent once the result is consumed, or when the session is closed.
+    """
+
+    def __init__(self, session, result, function, query_id, start, query, parameters):
+        self._session = session
+        self._result = result
+        self._function = function
+        self._query_id = query_id
+        self._start = start
+        self._query = query
+        self._parameters = parameters
+        self._first_record = None
+        self._records = 0
+        self._reported = False
+
+    def __getattr__(self, item):
+        return getattr(self._result, item)
+
+    def __iter__(self):
+        try:
+            for record in self._result:
+                if self._first_record is None:
+                    self._first_record = perf_counter()
+                self._records += 1
+                yield record
+        except Exception as e:
+            self.report(e)
+            raise
+        self.report()
+
+    def single(self):
+        try:
+            record = self._result.single()
+        except Exception as e:
+            self.report(e)
+            raise
+        if record is not None:
+            self._first_record = perf_counter()
+            self._records = 1
+        self.report()
+        return record
+
+    def consume(self):
+        try:
+            summary = self._result.consume()
+        except Exception as e:
+            self.report(e)
+            raise
+        self.report()
+        return summary
+
+    def report(self, error=None):
+        if self._reported:
+            return
+        self._reported = True
+        now = perf_counter()
+        first_record_time = self._first_record - self._start if self._first_record is not None else None
+        self._session.record(QueryEvent(self._function, self._query_id, now - self._start, first_record_time,
+                                        self._records, type(error).__name__ if error is not None else None,
+                                        self._query, self._parameters))
+
+
+class InstrumentedSession(object):
+    """
+    Wraps a driver session or transaction and instruments the queries run in it.
+    """
+
+    def __init__(self, session, instrumentation):
+        self.__dict__['_session'] = session
+        self.__dict__['_instrumentation'] = instrumentation
+        self.__dict__['_results'] = []
+
+    def __getattr__(self, item):
+        return getattr(self._session, item)
+
+    def __setattr__(self, key, value):
+        setattr(self._session, key, value)
+
+    def run(self, statement, parameters=None, **kwparameters):
+        function = calling_function()
+        query_id = queries.query_id(statement)
+        start = perf_counter()
+        try:
+            result = self._session.run(statement, parameters, **kwparameters)
+        except Exception as e:
+            self.record(QueryEvent(function, query_id, perf_counter() - start, None, 0, type(e).__name__,
+                                   statement, parameters))
+            raise
+        result = InstrumentedResult(self, result, function, query_id, start, statement, parameters)
+        self._results.append(result)
+        return result
+
+    def record(self, event):
+        try:
+            self._instrumentation.record(event)
+        except Exception:
+            pass  # Metrics must never break a query
+
+    def finish(self):
+        """
+        Reports the results that were not consumed to the end.
+        """
+        for result in self._results:
+            result.report()
+        del self._results[:]
+
+
+def _percentile(samples, percent):
+    """
+    Nearest rank percentile of sorted samples.
+    """
+    if not samples:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(samples))) - 1
+    return samples[min(max(rank, 0), len(samples) - 1)]
+
+
+class QueryMetrics(object):
+    """
+    Keeps the last max_samples wall times per key, and counters for calls, records and errors.
+
+    :param key: Event fields to group by, function and/or query_id
+    :param max_samples: Samples kept per key for the percentiles
+    :param callback: Called with every QueryEvent, eg. to forward it to a metrics system
+    """
+
+    def __init__(self, key=('function',), max_samples=1000, callback=None):
+        self.key = tuple(key)
+        self.max_samples = max_samples
+        self.callback = callback
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._wall_times = defaultdict(lambda: deque(maxlen=self.max_samples))
+            self._first_record_times = defaultdict(lambda: deque(maxlen=self.max_samples))
+            self._counts = defaultdict(lambda: {'count': 0, 'records': 0, 'errors': 0})
+
+    def _key(self, event):
+        if len(self.key) == 1:
+            return getattr(event, self.key[0])
+        return ' '.join(str(getattr(event, field)) for field in self.key)
+
+    def record(self, event):
+        key = self._key(event)
+        with self._lock:
+            counts = self._counts[key]
+            counts['count'] += 1
+            counts['records'] += event.records
+            if event.error:
+                counts['errors'] += 1
+            self._wall_times[key].append(event.wall_time)
+            if event.first_record_time is not None:
+                self._first_record_times[key].append(event.first_record_time)
+        if self.callback is not None:
+            self.callback(event)
+
+    def summary(self, percentiles=(50, 95, 99)):
+        """
+        :return: Counters and wall time percentiles, in seconds, per key
+        :rtype: dict
+        """
+        with self._lock:
+            summary = {}
+            for key, counts in self._counts.items():
+                wall_times = sorted(self._wall_times[key])
+                first_record_times = sorted(self._first_record_times[key])
+                item = dict(counts)
+                for percent in percentiles:
+                    item['p{!s}'.format(percent)] = _percentile(wall_times, percent)
+                    item['first_record_p{!s}'.format(percent)] = _percentile(first_record_times, percent)
+                summary[key] = item
+            return summary
+
+    def export(self, fp=None):
+        """
+        Writes the summary as JSON to fp, or returns it as a string.
+        """
+        if fp is None:
+            return json.dumps(self.summary(), sort_keys=True, indent=2)
+        json.dump(self.summary(), fp, sort_keys=True, indent=2)
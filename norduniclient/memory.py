@@ -0,0 +1,1789 @@
+# -*- coding: utf-8 -*-
+"""
+In-process, in-memory graph backend with the driver interface norduniclient uses.
+
+norduniclient.core.get_db_driver returns a MemoryDriver for memory:// uris, every uri with the same name shares one
+graph. Queries are not parsed, each query template in norduniclient.queries has a native Python implementation
+registered with @handler, so all of norduniclient.core and norduniclient.models works against it. CREATE statements
+of node and relationship patterns with literal properties, like test fixtures, are parsed. Other queries raise
+UnsupportedQuery.
+
+    manager = init_db('memory://testing')
+
+A transaction keeps its changes apart from the graph until it commits. The commit applies only the properties,
+labels and relationships the transaction changed to the graph, so it keeps the changes other transactions committed
+in the meantime, and fails with a transient error if another transaction deleted a node or relationship it changed.
+"""
+
+from __future__ import absolute_import
+
+import copy
+import re
+from threading import RLock
+
+try:
+    from neo4j.exceptions import CypherError
+except ImportError:
+    from neo4j.v1.api import CypherError  # Backwards compatability with version <1.2
+
+from norduniclient import helpers
+from norduniclient import queries
+
+__author__ = 'lundberg'
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class UnsupportedQuery(RuntimeError):
+    """
+    The query has no implementation in the in-memory backend.
+    """
+    def __init__(self, query):
+        self.query_id = queries.query_id(query)
+
+    def __str__(self):
+        return 'The in-memory backend has no implementation for query {!s}.'.format(self.query_id)
+
+
+class _Entity(object):
+
+    def __init__(self, id, properties):
+        self.id = id
+        self.properties = dict(properties)
+
+    def __getitem__(self, key):
+        return self.properties[key]
+
+    def __contains__(self, key):
+        return key in self.properties
+
+    def __iter__(self):
+        return iter(self.properties)
+
+    def __len__(self):
+        return len(self.properties)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.id == other.id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self), self.id))
+
+    def get(self, key, default=None):
+        return self.properties.get(key, default)
+
+    def keys(self):
+        return list(self.properties.keys())
+
+    def values(self):
+        return list(self.properties.values())
+
+    def items(self):
+        return list(self.properties.items())
+
+
+class Node(_Entity):
+
+    def __init__(self, id, labels, properties):
+        super(Node, self).__init__(id, properties)
+        self.label_list = []  # In the order the labels were added, as returned by labels(n)
+        for label in labels:
+            if label not in self.label_list:
+                self.label_list.append(label)
+
+    @property
+    def labels(self):
+        return frozenset(self.label_list)
+
+    def __repr__(self):
+        return '<Node id={!r} labels={!r} properties={!r}>'.format(self.id, self.label_list, self.properties)
+
+
+class Relationship(_Entity):
+
+    def __init__(self, id, type, start, end, properties):
+        super(Relationship, self).__init__(id, properties)
+        self.type = type
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return '<Relationship id={!r} start={!r} end={!r} type={!r} properties={!r}>'.format(
+            self.id, self.start, self.end, self.type, self.properties)
+
+
+class Record(object):
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self._data.values())[key]
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data.values())
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def values(self):
+        return list(self._data.values())
+
+    def items(self):
+        return list(self._data.items())
+
+    def data(self):
+        return dict(self._data)
+
+
+class Summary(object):
+    plan = None
+    profile = None
+    notifications = []
+
+    def __init__(self, statement, parameters):
+        self.statement = statement
+        self.parameters = parameters
+
+
+class Result(object):
+
+    def __init__(self, statement, parameters, records):
+        self._summary = Summary(statement, parameters)
+        self._records = [Record(record) for record in records]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def keys(self):
+        return self._records[0].keys() if self._records else []
+
+    def records(self):
+        return iter(self._records)
+
+    def data(self):
+        return [record.data() for record in self._records]
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+    def peek(self):
+        return self.single()
+
+    def summary(self):
+        return self._summary
+
+    def consume(self):
+        return self._summary
+
+
+class GraphState(object):
+    """
+    The committed nodes, relationships and schema of a graph. Committed entities are never changed, a commit replaces
+    them, so transactions can hold on to the entities they read.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.relationships = {}
+        self.handle_ids = {}  # handle_id -> node id
+        self.adjacency = {}  # node id -> set of relationship ids
+        self.indexes = set()  # (label, prop)
+        self.constraints = set()  # (label, prop)
+
+    def clear(self):
+        self.nodes.clear()
+        self.relationships.clear()
+        self.handle_ids.clear()
+        self.adjacency.clear()
+
+
+class _Layer(object):
+    """
+    Mapping of the entries changed and deleted in a transaction on top of a committed mapping.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.changed = {}
+        self.deleted = set()
+
+    def __getitem__(self, key):
+        if key in self.changed:
+            return self.changed[key]
+        if key in self.deleted:
+            raise KeyError(key)
+        return self.base[key]
+
+    def __contains__(self, key):
+        return key in self.changed or (key not in self.deleted and key in self.base)
+
+    def __setitem__(self, key, value):
+        self.changed[key] = value
+        self.deleted.discard(key)
+
+    def __delitem__(self, key):
+        self.changed.pop(key, None)
+        if key in self.base:
+            self.deleted.add(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = [key for key in self.base if key not in self.deleted]
+        return keys + [key for key in self.changed if key not in self.base]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+
+def _conflict(message):
+    return CypherError.hydrate(message=message, code='Neo.TransientError.Transaction.Outdated')
+
+
+def _merged_properties(current, original, changed):
+    """
+    :return: The properties of current with the changes from original to changed applied
+    """
+    properties = dict(current)
+    for key in set(original) | set(changed):
+        if key not in changed:
+            properties.pop(key, None)
+        elif key not in original or original[key] != changed[key]:
+            properties[key] = changed[key]
+    return properties
+
+
+class TransactionState(object):
+    """
+    The changes of a transaction on top of the committed state of a graph.
+
+    Entities are copied the first time a transaction changes them. On commit only the properties, labels and
+    relationships the transaction changed are applied to the committed entities, so changes committed by other
+    transactions in the meantime are kept.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.committed = graph.state
+        self.nodes = _Layer(self.committed.nodes)
+        self.relationships = _Layer(self.committed.relationships)
+        self.handle_ids = _Layer(self.committed.handle_ids)
+        self._added = {}  # node id -> relationship ids added
+        self._removed = {}  # node id -> relationship ids removed
+        self._originals = {}  # (type, id) -> committed entity the first change was made on
+        self._indexes = set()
+        self._constraints = set()
+
+    @property
+    def indexes(self):
+        return self.committed.indexes | self._indexes
+
+    @property
+    def constraints(self):
+        return self.committed.constraints | self._constraints
+
+    def node(self, node_id):
+        return copy.deepcopy(self.nodes[node_id])
+
+    def relationship(self, relationship_id):
+        return copy.deepcopy(self.relationships[relationship_id])
+
+    def by_handle_id(self, handle_id):
+        try:
+            return self.nodes.get(self.handle_ids.get(handle_id))
+        except TypeError:  # Unhashable handle_id
+            return None
+
+    def with_label(self, label):
+        return [node for node in self.nodes.values() if label in node.labels]
+
+    def adjacent(self, node_id):
+        """
+        :return: Ids of the relationships of the node
+        :rtype: set
+        """
+        relationship_ids = set(self.committed.adjacency.get(node_id, ()))
+        relationship_ids -= self._removed.get(node_id, set())
+        return relationship_ids | self._added.get(node_id, set())
+
+    def relationships_between(self, node, other):
+        return [self.relationships[r] for r in sorted(self.adjacent(node.id))
+                if {self.relationships[r].start, self.relationships[r].end} == {node.id, other.id}]
+
+    def _writable(self, layer, kind, entity_id):
+        if entity_id not in layer.changed:
+            entity = layer[entity_id]
+            if entity_id in layer.base:
+                self._originals[(kind, entity_id)] = entity
+            layer[entity_id] = copy.deepcopy(entity)
+        return layer.changed[entity_id]
+
+    def _check_unique(self, node):
+        if ('Node', 'handle_id') not in self.constraints or 'Node' not in node.labels:
+            return
+        handle_id = node.properties.get('handle_id')
+        other = self.handle_ids.get(handle_id) if handle_id is not None else None
+        if other is not None and other != node.id:
+            raise CypherError.hydrate(
+                message='Node({!s}) already exists with label `Node` and property `handle_id` = {!r}'.format(
+                    other, handle_id),
+                code='Neo.ClientError.Schema.ConstraintValidationFailed')
+
+    def _index_handle_id(self, node, old_handle_id):
+        new_handle_id = node.properties.get('handle_id')
+        if old_handle_id == new_handle_id:
+            return
+        if old_handle_id is not None and self.handle_ids.get(old_handle_id) == node.id:
+            del self.handle_ids[old_handle_id]
+        if new_handle_id is not None:
+            self.handle_ids[new_handle_id] = node.id
+
+    def create_node(self, labels, properties):
+        node = Node(self.graph.next_id(), labels, {k: v for k, v in properties.items() if v is not None})
+        self._check_unique(node)
+        self.nodes[node.id] = node
+        self._index_handle_id(node, None)
+        return node
+
+    def set_properties(self, node, properties):
+        """
+        Replaces the properties of the node, properties set to None are removed.
+        """
+        node = self._writable(self.nodes, 'node', node.id)
+        old_handle_id = node.properties.get('handle_id')
+        candidate = Node(node.id, node.label_list, {k: v for k, v in properties.items() if v is not None})
+        self._check_unique(candidate)
+        node.properties = candidate.properties
+        self._index_handle_id(node, old_handle_id)
+        return node
+
+    def set_property(self, node, key, value):
+        properties = dict(self.nodes[node.id].properties)
+        properties[key] = value
+        return self.set_properties(node, properties)
+
+    def add_label(self, node, label):
+        node = self._writable(self.nodes, 'node', node.id)
+        if label not in node.label_list:
+            node.label_list.append(label)
+            self._check_unique(node)
+        return node
+
+    def remove_label(self, node, label):
+        node = self._writable(self.nodes, 'node', node.id)
+        if label in node.label_list:
+            node.label_list.remove(label)
+        return node
+
+    def delete_node(self, node):
+        for relationship_id in self.adjacent(node.id):
+            self.delete_relationship(self.relationships[relationship_id])
+        handle_id = node.properties.get('handle_id')
+        if handle_id is not None and self.handle_ids.get(handle_id) == node.id:
+            del self.handle_ids[handle_id]
+        del self.nodes[node.id]
+
+    def create_relationship(self, rel_type, start, end, properties=None):
+        properties = {k: v for k, v in (properties or {}).items() if v is not None}
+        relationship = Relationship(self.graph.next_id(), rel_type, start.id, end.id, properties)
+        self.relationships[relationship.id] = relationship
+        for node_id in (start.id, end.id):
+            self._added.setdefault(node_id, set()).add(relationship.id)
+        return relationship
+
+    def set_relationship_properties(self, relationship, properties):
+        relationship = self._writable(self.relationships, 'relationship', relationship.id)
+        relationship.properties = {k: v for k, v in properties.items() if v is not None}
+        return relationship
+
+    def delete_relationship(self, relationship):
+        for node_id in (relationship.start, relationship.end):
+            if relationship.id in self._added.get(node_id, ()):
+                self._added[node_id].discard(relationship.id)
+            else:
+                self._removed.setdefault(node_id, set()).add(relationship.id)
+        del self.relationships[relationship.id]
+
+    def create_index(self, label, prop):
+        self._indexes.add((label, prop))
+
+    def create_unique_constraint(self, label, prop):
+        self._constraints.add((label, prop))
+
+    def _validate(self):
+        committed = self.committed
+        for (kind, entity_id) in self._originals:
+            entities = committed.nodes if kind == 'node' else committed.relationships
+            if entity_id not in entities:
+                raise _conflict('The {!s} {!s} was deleted by another transaction.'.format(kind, entity_id))
+        for node_id in self.nodes.deleted:
+            if committed.adjacency.get(node_id, set()) - self._removed.get(node_id, set()):
+                raise _conflict('The node {!s} got relationships from another transaction.'.format(node_id))
+        for relationship in self.relationships.changed.values():
+            for node_id in (relationship.start, relationship.end):
+                if node_id not in committed.nodes and node_id not in self.nodes.changed:
+                    raise _conflict('The node {!s} was deleted by another transaction.'.format(node_id))
+        if ('Node', 'handle_id') not in self.constraints:
+            return
+        for node in self.nodes.changed.values():
+            handle_id = node.properties.get('handle_id')
+            other = committed.handle_ids.get(handle_id) if handle_id is not None else None
+            if other is None or other == node.id or other in self.nodes.deleted or 'Node' not in node.labels:
+                continue
+            if other in self.nodes.changed and self.nodes.changed[other].properties.get('handle_id') != handle_id:
+                continue
+            raise CypherError.hydrate(
+                message='Node({!s}) already exists with label `Node` and property `handle_id` = {!r}'.format(
+                    other, handle_id),
+                code='Neo.ClientError.Schema.ConstraintValidationFailed')
+
+    def commit(self):
+        """
+        Applies the changes to the committed state. Call it with the graph lock held.
+        """
+        self._validate()
+        committed = self.committed
+        for node_id in self.nodes.deleted:
+            node = committed.nodes.pop(node_id, None)
+            if node is not None and committed.handle_ids.get(node.properties.get('handle_id')) == node_id:
+                del committed.handle_ids[node.properties['handle_id']]
+            committed.adjacency.pop(node_id, None)
+        for node_id, node in self.nodes.changed.items():
+            current = committed.nodes.get(node_id)
+            original = self._originals.get(('node', node_id))
+            if original is not None:
+                labels = [label for label in current.label_list
+                          if label in node.labels or label not in original.labels]
+                labels += [label for label in node.label_list if label not in original.labels]
+                node = Node(node_id, labels, _merged_properties(current.properties, original.properties,
+                                                                node.properties))
+                old_handle_id = current.properties.get('handle_id')
+                if old_handle_id is not None and committed.handle_ids.get(old_handle_id) == node_id:
+                    del committed.handle_ids[old_handle_id]
+            committed.nodes[node_id] = node
+            committed.adjacency.setdefault(node_id, set())
+            if node.properties.get('handle_id') is not None:
+                committed.handle_ids[node.properties['handle_id']] = node_id
+        for relationship_id in self.relationships.deleted:
+            committed.relationships.pop(relationship_id, None)
+        for relationship_id, relationship in self.relationships.changed.items():
+            original = self._originals.get(('relationship', relationship_id))
+            if original is not None:
+                current = committed.relationships[relationship_id]
+                relationship = Relationship(relationship_id, current.type, current.start, current.end,
+                                            _merged_properties(current.properties, original.properties,
+                                                               relationship.properties))
+            committed.relationships[relationship_id] = relationship
+        for node_id, relationship_ids in self._removed.items():
+            committed.adjacency.get(node_id, set()).difference_update(relationship_ids)
+        for node_id, relationship_ids in self._added.items():
+            if node_id in committed.nodes:
+                committed.adjacency[node_id].update(relationship_ids)
+        committed.indexes.update(self._indexes)
+        committed.constraints.update(self._constraints)
+
+
+class Graph(object):
+
+    def __init__(self):
+        self.state = GraphState()
+        self.lock = RLock()
+        self._last_id = 0
+
+    def next_id(self):
+        with self.lock:
+            self._last_id += 1
+            return self._last_id
+
+    def clear(self):
+        """
+        Deletes all nodes and relationships, the indexes and constraints are kept.
+        """
+        with self.lock:
+            self.state.clear()
+
+    def begin(self):
+        return TransactionState(self)
+
+    def commit(self, state):
+        with self.lock:
+            state.commit()
+
+    def run(self, state, statement, parameters):
+        rendered = queries.rendered_from(statement)
+        if rendered is None and _CREATE_RE.match(statement):
+            with self.lock:
+                records = _CreateParser(state, statement).parse()
+            return Result(statement, parameters, records)
+        if rendered is None or rendered[0] not in HANDLERS:
+            raise UnsupportedQuery(statement)
+        name, identifiers = rendered
+        with self.lock:
+            records = HANDLERS[name](state, parameters or {}, **identifiers)
+        return Result(statement, parameters, records)
+
+
+_graphs = {}
+_graphs_lock = RLock()
+
+
+def get_graph(name):
+    with _graphs_lock:
+        if name not in _graphs:
+            _graphs[name] = Graph()
+        return _graphs[name]
+
+
+class MemoryTransaction(object):
+
+    def __init__(self, session):
+        self._session = session
+        self._graph = session.graph
+        self._state = self._graph.begin()
+        self._closed = False
+        self.success = None
+
+    def run(self, statement, parameters=None, **kwparameters):
+        return self._graph.run(self._state, statement, dict(parameters or {}, **kwparameters))
+
+    def commit(self):
+        self.success = True
+        self.close()
+
+    def rollback(self):
+        self.success = False
+        self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._session._transaction = None
+        if self.success:
+            self._graph.commit(self._state)
+
+    def closed(self):
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.success is None:
+            self.success = not bool(exc_type)
+        self.close()
+
+
+class MemorySession(object):
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._transaction = None
+        self._closed = False
+
+    def run(self, statement, parameters=None, **kwparameters):
+        state = self.graph.begin()
+        result = self.graph.run(state, statement, dict(parameters or {}, **kwparameters))
+        self.graph.commit(state)
+        return result
+
+    def begin_transaction(self, bookmark=None):
+        self._transaction = MemoryTransaction(self)
+        return self._transaction
+
+    def last_bookmark(self):
+        return None
+
+    def close(self):
+        if self._transaction is not None:
+            self._transaction.close()
+        self._closed = True
+
+    def closed(self):
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MemoryDriver(object):
+    """
+    Driver for the in-memory graph named by the uri, memory://name.
+    """
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.graph = get_graph(uri.split('://', 1)[-1])
+
+    def session(self, access_mode=None, bookmark=None, **kwargs):
+        return MemorySession(self.graph)
+
+    def close(self):
+        pass
+
+
+HANDLERS = {}
+
+
+def handler(name):
+    """
+    Registers the implementation of a query template. It is called with the graph state, the query parameters and
+    the identifiers of the rendered template and returns the records as dicts.
+    """
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def _meta_type(node, meta_types):
+    for label in node.labels:
+        if label in meta_types:
+            return label
+
+
+def _regex_match(regex, value):
+    if isinstance(value, string_types):
+        return re.match(regex + '\\Z', value) is not None  # Cypher =~ matches the whole string
+    if isinstance(value, (list, tuple)):
+        return any(_regex_match(regex, x) for x in value)
+    return False
+
+
+def _page(nodes, params):
+    after = params.get('after')
+    nodes = sorted(nodes, key=lambda n: n.properties.get('handle_id'))
+    if after is not None:
+        nodes = [n for n in nodes if n.properties.get('handle_id') is not None and n.properties['handle_id'] > after]
+    return nodes[:params['limit']]
+
+
+def _lookup(lookup_func, value, other):
+    if lookup_func == 'STARTS WITH':
+        return value.startswith(other)
+    if lookup_func == 'ENDS WITH':
+        return value.endswith(other)
+    return other in value
+
+
+@handler('create_node')
+def _create_node(state, params, meta_type, label):
+    return [{'n': state.node(state.create_node(['Node', meta_type, label], params['props']).id)}]
+
+
+@handler('create_nodes')
+def _create_nodes(state, params, meta_type, label):
+    return [{'n': state.node(state.create_node(['Node', meta_type, label], row).id)} for row in params['rows']]
+
+
+@handler('get_node')
+def _get_node(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    return [{'n': state.node(node.id)}] if node is not None else []
+
+
+@handler('get_nodes')
+def _get_nodes(state, params):
+    nodes = [state.by_handle_id(handle_id) for handle_id in params['handle_ids']]
+    return [{'n': state.node(node.id)} for node in nodes if node is not None]
+
+
+@handler('delete_node')
+def _delete_node(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is not None:
+        state.delete_node(node)
+    return []
+
+
+@handler('delete_nodes_by_handle_id_prefix')
+def _delete_nodes_by_handle_id_prefix(state, params):
+    nodes = [node for node in state.with_label('Node')
+             if isinstance(node.get('handle_id'), string_types) and node.get('handle_id').startswith(params['prefix'])]
+    for node in nodes[:params['limit']]:
+        state.delete_node(node)
+    return [{'count': len(nodes[:params['limit']])}]
+
+
+@handler('set_node_properties')
+def _set_node_properties(state, params):
+    node = state.by_handle_id(params['props']['handle_id'])
+    if node is None:
+        return []
+    properties = {k: v for k, v in params['props'].items() if v is not None}
+    if '_dependents' in node:
+        properties['_dependents'] = node['_dependents']
+    state.set_properties(node, properties)
+    return [{'n': state.node(node.id)}]
+
+
+@handler('get_nodes_by_name')
+def _get_nodes_by_name(state, params):
+    return [{'n': state.node(node.id)} for node in state.with_label('Node') if node.get('name') == params['name']]
+
+
+@handler('get_unique_node_by_name')
+def _get_unique_node_by_name(state, params):
+    return [{'handle_id': node.get('handle_id')} for node in state.with_label('Node')
+            if node.get('name') == params['name'] and params['label'] in node.labels]
+
+
+@handler('get_meta_types')
+def _get_meta_types(state, params):
+    nodes = [state.by_handle_id(handle_id) for handle_id in params['handle_ids']]
+    return [{'handle_id': node.get('handle_id'), 'meta_type': _meta_type(node, params['meta_types'])}
+            for node in nodes if node is not None]
+
+
+@handler('nodes_by_label')
+def _nodes_by_label(state, params, label):
+    return [{'n': state.node(node.id)} for node in state.with_label(label)]
+
+
+@handler('nodes_by_label_first_page')
+@handler('nodes_by_label_page')
+def _nodes_by_label_page(state, params, label):
+    nodes = [node for node in state.with_label(label) if 'Node' in node.labels]
+    return [{'n': state.node(node.id)} for node in _page(nodes, params)]
+
+
+def _nodes_by_value(state, params, label, prop):
+    return [node for node in state.with_label(label) if prop in node and node[prop] == params['value']]
+
+
+@handler('nodes_by_value')
+def _nodes_by_value_all(state, params, label, prop):
+    return [{'n': state.node(node.id)} for node in _nodes_by_value(state, params, label, prop)]
+
+
+@handler('nodes_by_value_first_page')
+@handler('nodes_by_value_page')
+def _nodes_by_value_page(state, params, label, prop):
+    nodes = [node for node in _nodes_by_value(state, params, label, prop) if 'Node' in node.labels]
+    return [{'n': state.node(node.id)} for node in _page(nodes, params)]
+
+
+def _search_nodes(state, params, label, prop=None):
+    nodes = []
+    for node in state.with_label(label):
+        values = [node.get(prop)] if prop else [v for k, v in node.items() if not helpers.is_internal_property(k)]
+        if any(_regex_match(params['regex'], value) for value in values):
+            nodes.append(node)
+    return nodes
+
+
+@handler('search_nodes_by_property')
+def _search_nodes_by_property(state, params, label, prop):
+    return [{'n': state.node(node.id)} for node in _search_nodes(state, params, label, prop)]
+
+
+@handler('search_nodes_by_property_first_page')
+@handler('search_nodes_by_property_page')
+def _search_nodes_by_property_page(state, params, label, prop):
+    nodes = [node for node in _search_nodes(state, params, label, prop) if 'Node' in node.labels]
+    return [{'n': state.node(node.id)} for node in _page(nodes, params)]
+
+
+@handler('search_nodes')
+def _search_all_nodes(state, params, label):
+    return [{'n': state.node(node.id)} for node in _search_nodes(state, params, label)]
+
+
+@handler('search_nodes_first_page')
+@handler('search_nodes_page')
+def _search_all_nodes_page(state, params, label):
+    nodes = [node for node in _search_nodes(state, params, label) if 'Node' in node.labels]
+    return [{'n': state.node(node.id)} for node in _page(nodes, params)]
+
+
+@handler('get_indexed_node')
+def _get_indexed_node(state, params, label, prop, lookup_func):
+    value = params['value'].lower()
+    return [{'n': state.node(node.id)} for node in state.with_label(label)
+            if isinstance(node.get(prop), string_types) and _lookup(lookup_func, node[prop].lower(), value)]
+
+
+@handler('get_normalized_node')
+def _get_normalized_node(state, params, label, shadow_prop, lookup_func):
+    return [{'n': state.node(node.id)} for node in state.with_label(label)
+            if 'Node' in node.labels and isinstance(node.get(shadow_prop), string_types) and
+            _lookup(lookup_func, node[shadow_prop], params['value'])]
+
+
+@handler('backfill_normalized_property')
+def _backfill_normalized_property(state, params, prop, shadow_prop):
+    count = 0
+    for node in state.with_label('Node'):
+        if count == params['limit']:
+            break
+        value = node.get(prop)
+        expected = value.lower() if isinstance(value, string_types) else None
+        if node.get(shadow_prop) != expected:
+            state.set_property(node, shadow_prop, expected)
+            count += 1
+    return [{'count': count}]
+
+
+@handler('create_index')
+def _create_index(state, params, label, prop):
+    state.create_index(label, prop)
+    return []
+
+
+@handler('create_unique_constraint')
+def _create_unique_constraint(state, params, label, prop):
+    state.create_unique_constraint(label, prop)
+    return []
+
+
+@handler('db_indexes')
+def _db_indexes(state, params):
+    records = [{'description': 'INDEX ON :{!s}({!s})'.format(label, prop), 'state': 'online',
+                'type': 'node_label_property'} for label, prop in sorted(state.indexes)]
+    records += [{'description': 'INDEX ON :{!s}({!s})'.format(label, prop), 'state': 'online',
+                 'type': 'node_unique_property'} for label, prop in sorted(state.constraints)]
+    return records
+
+
+@handler('get_relationship')
+def _get_relationship(state, params):
+    if params['relationship_id'] not in state.relationships:
+        return []
+    return [{'r': state.relationship(params['relationship_id'])}]
+
+
+@handler('get_relationship_bundle')
+def _get_relationship_bundle(state, params):
+    relationship = state.relationships.get(params['relationship_id'])
+    if relationship is None:
+        return []
+    return [{'start': state.node(relationship.start), 'r': state.relationship(relationship.id),
+             'end': state.node(relationship.end)}]
+
+
+@handler('delete_relationship')
+def _delete_relationship(state, params):
+    relationship = state.relationships.get(params['relationship_id'])
+    if relationship is None:
+        return []
+    state.delete_relationship(relationship)
+    return [{'start': state.nodes[relationship.start].get('handle_id'),
+             'end': state.nodes[relationship.end].get('handle_id')}]
+
+
+@handler('set_relationship_properties')
+def _set_relationship_properties(state, params):
+    relationship = state.relationships.get(params['relationship_id'])
+    if relationship is None:
+        return []
+    state.set_relationship_properties(relationship, params['props'])
+    return [{'r': state.relationship(relationship.id)}]
+
+
+@handler('get_relationships')
+def _get_relationships(state, params):
+    node, other = state.by_handle_id(params['handle_id1']), state.by_handle_id(params['handle_id2'])
+    if node is None or other is None:
+        return [{'relationships': []}]
+    return [{'relationships': [copy.deepcopy(r) for r in state.relationships_between(node, other)]}]
+
+
+@handler('get_relationships_by_type')
+def _get_relationships_by_type(state, params, rel_type):
+    node, other = state.by_handle_id(params['handle_id1']), state.by_handle_id(params['handle_id2'])
+    if node is None or other is None:
+        return [{'relationships': []}]
+    return [{'relationships': [copy.deepcopy(r) for r in state.relationships_between(node, other)
+                               if r.type == rel_type]}]
+
+
+@handler('create_relationship')
+def _create_relationship(state, params, rel_type):
+    node, other = state.by_handle_id(params['start']), state.by_handle_id(params['end'])
+    if node is None or other is None:
+        return []
+    return [{'r': copy.deepcopy(state.create_relationship(rel_type, node, other))}]
+
+
+@handler('create_validated_relationship')
+def _create_validated_relationship(state, params, rel_type):
+    node, other = state.by_handle_id(params['start']), state.by_handle_id(params['end'])
+    start_meta = params['meta_type'] or (_meta_type(node, params['meta_types']) if node is not None else None)
+    end_meta = _meta_type(other, params['meta_types']) if other is not None else None
+    relationship_id = None
+    if node is not None and other is not None and start_meta and end_meta and \
+            '{!s}:{!s}:{!s}'.format(start_meta, end_meta, params['rel_type']) in params['possible']:
+        relationship_id = state.create_relationship(rel_type, node, other).id
+    return [{'start_found': node is not None, 'end_found': other is not None, 'start_meta': start_meta,
+             'end_meta': end_meta, 'id': relationship_id}]
+
+
+@handler('create_relationships')
+def _create_relationships(state, params, rel_type):
+    records = []
+    for row in params['rows']:
+        node, other = state.by_handle_id(row['start']), state.by_handle_id(row['end'])
+        if node is not None and other is not None:
+            records.append({'index': row['index'], 'id': state.create_relationship(rel_type, node, other).id})
+    return records
+
+
+@handler('add_label')
+def _add_label(state, params, label):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    state.add_label(node, label)
+    return [{'n': state.node(node.id)}]
+
+
+@handler('remove_label')
+def _remove_label(state, params, label):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    state.remove_label(node, label)
+    return [{'n': state.node(node.id)}]
+
+
+DEPENDENCY_TYPES = ('Depends_on', 'Part_of', 'Has', 'Connected_to')
+
+
+def _dependency_edge(state, relationship):
+    return {'id': relationship.id, 'start': state.nodes[relationship.start].get('handle_id'),
+            'type': relationship.type, 'end': state.nodes[relationship.end].get('handle_id')}
+
+
+@handler('get_dependency_nodes')
+def _get_dependency_nodes(state, params):
+    return [{'handle_id': node.get('handle_id'), 'labels': list(node.labels)} for node in state.with_label('Node')]
+
+
+@handler('get_dependency_nodes_by_handle_ids')
+def _get_dependency_nodes_by_handle_ids(state, params):
+    nodes = [state.by_handle_id(handle_id) for handle_id in params['handle_ids']]
+    return [{'handle_id': node.get('handle_id'), 'labels': list(node.labels)} for node in nodes if node is not None]
+
+
+@handler('get_dependency_edges')
+def _get_dependency_edges(state, params):
+    return [_dependency_edge(state, r) for r in state.relationships.values() if r.type in DEPENDENCY_TYPES]
+
+
+@handler('get_dependency_edges_by_handle_ids')
+def _get_dependency_edges_by_handle_ids(state, params):
+    relationship_ids = set()
+    for handle_id in params['handle_ids']:
+        node = state.by_handle_id(handle_id)
+        if node is not None:
+            relationship_ids.update(state.adjacent(node.id))
+    return [_dependency_edge(state, state.relationships[r]) for r in sorted(relationship_ids)
+            if state.relationships[r].type in DEPENDENCY_TYPES]
+
+
+def _dependency_closure(state, node, outgoing, max_depth=20):
+    """
+    Nodes reached from node through 1 to max_depth Depends_on or Part_of relationships.
+    """
+    reached, frontier = set(), [node.id]
+    for _ in range(max_depth):
+        next_frontier = []
+        for node_id in frontier:
+            for relationship_id in state.adjacent(node_id):
+                relationship = state.relationships[relationship_id]
+                if relationship.type not in ('Depends_on', 'Part_of'):
+                    continue
+                if (relationship.start, relationship.end)[not outgoing] != node_id:
+                    continue
+                other = (relationship.end, relationship.start)[not outgoing]
+                if other not in reached:
+                    reached.add(other)
+                    next_frontier.append(other)
+        frontier = next_frontier
+    return reached
+
+
+def _set_dependents(state, node):
+    dependents = _dependency_closure(state, node, outgoing=False)
+    state.set_property(node, '_dependents', sorted(state.nodes[i].get('handle_id') for i in dependents))
+
+
+@handler('get_dependencies_closure')
+def _get_dependencies_closure(state, params):
+    reached = set()
+    for handle_id in params['handle_ids']:
+        node = state.by_handle_id(handle_id)
+        if node is not None:
+            reached |= _dependency_closure(state, node, outgoing=True)
+    return [{'handle_ids': sorted(state.nodes[i].get('handle_id') for i in reached)}]
+
+
+@handler('set_dependents')
+def _set_dependents_of(state, params):
+    targets = set()
+    for handle_id in params['handle_ids']:
+        node = state.by_handle_id(handle_id)
+        if node is not None:
+            targets |= _dependency_closure(state, node, outgoing=True) | {node.id}
+    for node_id in targets:
+        _set_dependents(state, state.nodes[node_id])
+    return [{'count': len(targets)}]
+
+
+@handler('set_dependents_first_page')
+@handler('set_dependents_page')
+def _set_dependents_page(state, params):
+    nodes = _page(state.with_label('Node'), params)
+    for node in nodes:
+        _set_dependents(state, node)
+    return [{'last': nodes[-1].get('handle_id') if nodes else None, 'count': len(nodes)}]
+
+
+def _neighbours(state, node_id, types=None, direction=None):
+    """
+    :param types: Relationship types to follow, or None for all
+    :param direction: 'out', 'in' or None for both
+    :return: (relationship, other node id) for the relationships of the node, in the order they were created
+    """
+    for relationship_id in sorted(state.adjacent(node_id)):
+        relationship = state.relationships[relationship_id]
+        if types is not None and relationship.type not in types:
+            continue
+        if direction in ('out', None) and relationship.start == node_id:
+            yield relationship, relationship.end
+        elif direction in ('in', None) and relationship.end == node_id:
+            yield relationship, relationship.start
+
+
+def _opposite(direction):
+    return {'out': 'in', 'in': 'out'}.get(direction)
+
+
+def _returns_to(state, node_id, types, direction, max_depth, distance):
+    """
+    Whether a path of at most max_depth relationships, without using a relationship twice, leads back to the node.
+    """
+    for relationship, other in _neighbours(state, node_id, types, _opposite(direction)):
+        if other == node_id:
+            return True
+        if direction is not None:
+            if distance.get(other, max_depth) <= max_depth - 1:
+                return True
+            continue
+        # Undirected, the path back must not use the relationship it ends with
+        reached, frontier = {other}, [other]
+        for _ in range(max_depth - 1):
+            next_frontier = []
+            for current in frontier:
+                for r, n in _neighbours(state, current, types):
+                    if r.id == relationship.id or n in reached:
+                        continue
+                    if n == node_id:
+                        return True
+                    reached.add(n)
+                    next_frontier.append(n)
+            frontier = next_frontier
+    return False
+
+
+def _expand(state, node_id, types, direction, max_depth):
+    """
+    Same nodes as (n)-[:types*1..max_depth]-(m) in Cypher, which does not use a relationship twice in a path.
+
+    :return: Ids of the nodes in the order they were reached
+    :rtype: list
+    """
+    distance, reached, frontier = {node_id: 0}, [], [node_id]
+    for depth in range(1, max_depth + 1):
+        next_frontier = []
+        for current in frontier:
+            for relationship, other in _neighbours(state, current, types, direction):
+                if other not in distance:
+                    distance[other] = depth
+                    reached.append(other)
+                    next_frontier.append(other)
+        frontier = next_frontier
+    if _returns_to(state, node_id, types, direction, max_depth, distance):
+        reached.append(node_id)
+    return reached
+
+
+def _trails(state, node_id, types, direction, min_length=0, max_length=None):
+    """
+    Same paths as p=(n)-[:types*min_length..max_length]-() in Cypher, depth first.
+
+    :return: (node ids, relationship ids) of every path from the node
+    :rtype: list
+    """
+    trails = []
+
+    def visit(nodes, relationships):
+        if len(relationships) >= min_length:
+            trails.append((nodes, relationships))
+        if max_length is not None and len(relationships) == max_length:
+            return
+        for relationship, other in _neighbours(state, nodes[-1], types, direction):
+            if relationship.id not in relationships:
+                visit(nodes + [other], relationships + [relationship.id])
+    visit([node_id], [])
+    return trails
+
+
+def _distinct(node_ids):
+    seen = set()
+    return [i for i in node_ids if not (i in seen or seen.add(i))]
+
+
+def _nodes(state, node_ids):
+    return [state.node(i) for i in node_ids]
+
+
+def _optional(state, node_id):
+    return state.node(node_id) if node_id is not None else None
+
+
+def _nulls_last(value):
+    return value is None, value
+
+
+def _has_label(state, node_id, label):
+    return label is None or label in state.nodes[node_id].labels
+
+
+def _related(state, params, types, direction, label=None, other_handle_id=None, **properties):
+    """
+    Records of r and node for MATCH (n:Node {handle_id: {handle_id}})-[r:types]-(node:label) with an optional
+    handle_id of the other node and relationship properties.
+    """
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    records = []
+    for relationship, other in _neighbours(state, node.id, types, direction):
+        if not _has_label(state, other, label):
+            continue
+        if other_handle_id is not None and state.nodes[other].get('handle_id') != params[other_handle_id]:
+            continue
+        if any(params[param] is None or relationship.get(key) != params[param] for key, param in properties.items()):
+            continue
+        records.append({'r': state.relationship(relationship.id), 'node': state.node(other)})
+    return records
+
+
+@handler('get_incoming')
+def _get_incoming(state, params):
+    return _related(state, params, None, 'in')
+
+
+@handler('get_outgoing')
+def _get_outgoing(state, params):
+    return _related(state, params, None, 'out')
+
+
+@handler('get_neighbours')
+def _get_neighbours(state, params):
+    return _related(state, params, None, None)
+
+
+@handler('get_incoming_by_type')
+def _get_incoming_by_type(state, params, rel_type):
+    return _related(state, params, [rel_type], 'in')
+
+
+@handler('get_outgoing_by_type')
+def _get_outgoing_by_type(state, params, rel_type):
+    return _related(state, params, [rel_type], 'out')
+
+
+@handler('get_incoming_by_type_and_label')
+def _get_incoming_by_type_and_label(state, params, rel_type, label):
+    return _related(state, params, [rel_type], 'in', label)
+
+
+@handler('get_outgoing_by_type_and_label')
+def _get_outgoing_by_type_and_label(state, params, rel_type, label):
+    return _related(state, params, [rel_type], 'out', label)
+
+
+@handler('get_relations')
+def _get_relations(state, params):
+    return _related(state, params, ['Owns', 'Uses', 'Provides', 'Responsible_for'], 'in')
+
+
+@handler('get_customers')
+def _get_customers(state, params):
+    return [dict(record, key='customers') for record in _related(state, params, ['Owns', 'Uses'], 'in', 'Customer')]
+
+
+@handler('get_port')
+def _get_port(state, params):
+    return [record for record in _related(state, params, ['Has'], 'out', 'Port')
+            if params['port_name'] is not None and record['node'].get('name') == params['port_name']]
+
+
+@handler('get_unit')
+def _get_unit(state, params):
+    return [record for record in _related(state, params, ['Part_of'], 'in', 'Unit')
+            if params['unit_name'] is not None and record['node'].get('name') == params['unit_name']]
+
+
+@handler('get_host_service')
+def _get_host_service(state, params):
+    return _related(state, params, ['Depends_on'], 'in', other_handle_id='service_handle_id',
+                    ip_address='ip_address', port='port', protocol='protocol')
+
+
+@handler('get_peering_group')
+def _get_peering_group(state, params):
+    return _related(state, params, ['Uses'], 'out', other_handle_id='group_handle_id', ip_address='ip_address')
+
+
+@handler('get_group_dependency')
+def _get_group_dependency(state, params):
+    return _related(state, params, ['Depends_on'], 'out', other_handle_id='dependency_handle_id',
+                    ip_address='ip_address')
+
+
+def _merge(state, params, rel_type, direction, other_handle_id, label=None):
+    node, other = state.by_handle_id(params['handle_id']), state.by_handle_id(params[other_handle_id])
+    if node is None or other is None or not _has_label(state, other.id, label):
+        return []
+    existing = [r for r, i in _neighbours(state, node.id, [rel_type], direction) if i == other.id]
+    if existing:
+        return [{'created': False, 'r': state.relationship(r.id), 'node': state.node(other.id)} for r in existing]
+    start, end = (node, other) if direction == 'out' else (other, node)
+    relationship = state.create_relationship(rel_type, start, end)
+    return [{'created': True, 'r': state.relationship(relationship.id), 'node': state.node(other.id)}]
+
+
+@handler('merge_incoming')
+def _merge_incoming(state, params, rel_type):
+    return _merge(state, params, rel_type, 'in', 'other_handle_id')
+
+
+@handler('merge_outgoing')
+def _merge_outgoing(state, params, rel_type):
+    return _merge(state, params, rel_type, 'out', 'other_handle_id')
+
+
+@handler('set_part_of')
+def _set_part_of(state, params):
+    return _merge(state, params, 'Part_of', 'in', 'part_handle_id', 'Logical')
+
+
+def _create(state, params, rel_type, direction, other_handle_id, *properties):
+    node, other = state.by_handle_id(params['handle_id']), state.by_handle_id(params[other_handle_id])
+    if node is None or other is None:
+        return []
+    start, end = (node, other) if direction == 'out' else (other, node)
+    relationship = state.create_relationship(rel_type, start, end, {key: params[key] for key in properties})
+    return [{'created': True, 'r': state.relationship(relationship.id), 'node': state.node(other.id)}]
+
+
+@handler('set_host_service')
+def _set_host_service(state, params):
+    return _create(state, params, 'Depends_on', 'in', 'service_handle_id', 'ip_address', 'port', 'protocol')
+
+
+@handler('set_peering_group')
+def _set_peering_group(state, params):
+    return _create(state, params, 'Uses', 'out', 'group_handle_id', 'ip_address')
+
+
+@handler('set_group_dependency')
+def _set_group_dependency(state, params):
+    return _create(state, params, 'Depends_on', 'out', 'dependency_handle_id', 'ip_address')
+
+
+def _child_form_data(state, child_id):
+    child = state.nodes[child_id]
+    return {'handle_id': child.get('handle_id'), 'labels': list(child.label_list), 'name': child.get('name'),
+            'description': child.get('description')}
+
+
+def _child_form_data_rows(state, params, label=None):
+    parent = state.by_handle_id(params['handle_id'])
+    if parent is None:
+        return []
+    records = []
+    for relationship, child_id in _neighbours(state, parent.id):
+        between = state.relationships_between(parent, state.nodes[child_id])
+        has = any(r.type == 'Has' and r.start == parent.id and r.end == child_id for r in between)
+        part = any(r.type in ('Located_in', 'Part_of') and r.start == child_id and r.end == parent.id for r in between)
+        if has or (part and _has_label(state, child_id, label)):
+            records.append(_child_form_data(state, child_id))
+    return records
+
+
+@handler('get_child_form_data')
+def _get_child_form_data(state, params):
+    return _child_form_data_rows(state, params)
+
+
+@handler('get_child_form_data_by_label')
+def _get_child_form_data_by_label(state, params, label):
+    return _child_form_data_rows(state, params, label)
+
+
+@handler('get_child_form_data_has')
+def _get_child_form_data_has(state, params, label):
+    parent = state.by_handle_id(params['handle_id'])
+    if parent is None:
+        return []
+    records = [_child_form_data(state, nodes[-1]) for nodes, _ in _trails(state, parent.id, ['Has'], 'out', 1)
+               if _has_label(state, nodes[-1], label)]
+    return sorted(records, key=lambda record: _nulls_last(record['name']))
+
+
+def _as_types(state, direct, deps):
+    def having(label):
+        return _nodes(state, [i for i in deps if label in state.nodes[i].labels])
+    return {'direct': _nodes(state, direct), 'services': having('Service'), 'paths': having('Optical_Path'),
+            'oms': having('Optical_Multiplex_Section'), 'links': having('Optical_Link')}
+
+
+def _direct(state, node, direction):
+    return _distinct(i for _, i in _neighbours(state, node.id, ['Depends_on'], direction))
+
+
+@handler('get_dependent_as_types')
+def _get_dependent_as_types(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    deps = _expand(state, node.id, ('Part_of', 'Depends_on'), 'in', 20) if node is not None else []
+    return [_as_types(state, _direct(state, node, 'in'), deps)] if deps else []
+
+
+@handler('get_dependent_as_types_materialized')
+def _get_dependent_as_types_materialized(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    deps = [state.by_handle_id(handle_id) for handle_id in node.get('_dependents') or []]
+    deps = _distinct(dep.id for dep in deps if dep is not None and 'Node' in dep.labels)
+    return [_as_types(state, _direct(state, node, 'in'), deps)] if deps else []
+
+
+@handler('get_equipment_dependent_as_types')
+def _get_equipment_dependent_as_types(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    direct = _direct(state, node, 'in')
+    parts = _expand(state, node.id, ['Has'], 'out', 20)
+    deps, cable_deps = [], []
+    for part in parts:
+        deps.extend(_expand(state, part, ('Part_of', 'Depends_on'), 'in', 20))
+        for r0, cable in _neighbours(state, part, ['Connected_to'], 'in'):
+            for r1, other in _neighbours(state, cable, ['Connected_to'], 'out'):
+                if r1.id != r0.id:
+                    cable_deps.extend(_expand(state, other, ['Depends_on'], 'in', 20))
+    deps = _distinct(_distinct(deps) + _distinct(cable_deps) + direct)
+    return [_as_types(state, direct, deps)] if deps else []
+
+
+@handler('get_host_dependent_as_types')
+def _get_host_dependent_as_types(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    deps = _expand(state, node.id, ['Depends_on'], 'in', 20) if node is not None else []
+    if not deps:
+        return []
+    direct = [i for i in _direct(state, node, 'in') if 'Host_Service' not in state.nodes[i].labels]
+    return [_as_types(state, direct, deps)]
+
+
+@handler('get_cable_dependent_as_types')
+def _get_cable_dependent_as_types(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    deps = []
+    for equip in (_expand(state, node.id, ['Connected_to'], None, 20) if node is not None else []):
+        deps.extend(_expand(state, equip, ('Part_of', 'Depends_on'), 'in', 10))
+    record = _as_types(state, [], _distinct(deps))
+    del record['direct']
+    return [record]
+
+
+@handler('get_dependencies_as_types')
+def _get_dependencies_as_types(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    deps = _expand(state, node.id, ['Depends_on'], 'out', 20) if node is not None else []
+    if not deps:
+        return []
+    record = _as_types(state, _direct(state, node, 'out'), deps)
+    cables = []
+    for dep in deps:
+        cables.extend(i for i in _expand(state, dep, ['Connected_to'], None, 50) if 'Cable' in state.nodes[i].labels)
+    record['cables'] = _nodes(state, _distinct(cables))
+    return [record]
+
+
+@handler('get_ports')
+def _get_ports(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    records = []
+    for relationship, port in _neighbours(state, node.id, ['Connected_to', 'Depends_on']):
+        if not _has_label(state, port, 'Port'):
+            continue
+        parents = [nodes[-1] for nodes, _ in _trails(state, port, ['Has'], 'in', 1)] or [None]
+        records.extend({'port': state.node(port), 'relationship': state.relationship(relationship.id),
+                        'parent': _optional(state, parent)} for parent in parents)
+    return sorted(records, key=lambda record: _nulls_last(record['parent'] and record['parent'].get('name')))
+
+
+def _has_paths_to(state, node_id):
+    """
+    :return: (node ids, relationship ids) of the paths of 0 to 20 Has relationships ending in the node
+    """
+    return [(nodes[::-1], relationships) for nodes, relationships in _trails(state, node_id, ['Has'], 'in', 0, 20)]
+
+
+def _longest_paths(state, paths, key):
+    if not paths:
+        return []
+    longest = max(len(nodes) for nodes in paths)
+    return [{key: _nodes(state, nodes)} for nodes in paths if len(nodes) == longest]
+
+
+def _paths(state, params, rel_type, direction, key):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    paths = [nodes for _, end in _neighbours(state, node.id, [rel_type], direction)
+             for nodes, _ in _has_paths_to(state, end)]
+    return _longest_paths(state, paths, key)
+
+
+def _location_paths(state, params, rel_type, direction):
+    """
+    Longest paths of ()-[:Has*0..20]->(r)<-[:Located_in]-()-[:Has*0..20]->(parent)
+    """
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    paths = []
+    for _, parent in _neighbours(state, node.id, [rel_type], direction):
+        for equipment_path, equipment_relationships in _has_paths_to(state, parent):
+            for _, location in _neighbours(state, equipment_path[0], ['Located_in'], 'out'):
+                for location_path, location_relationships in _has_paths_to(state, location):
+                    if not set(location_relationships) & set(equipment_relationships):
+                        paths.append(location_path + equipment_path)
+    return _longest_paths(state, paths, 'location_path')
+
+
+@handler('get_location_path')
+def _get_location_path(state, params):
+    return _paths(state, params, 'Located_in', 'out', 'location_path')
+
+
+@handler('get_location_path_location')
+def _get_location_path_location(state, params):
+    return _paths(state, params, 'Has', 'in', 'location_path')
+
+
+@handler('get_location_path_sub_equipment')
+def _get_location_path_sub_equipment(state, params):
+    return _location_paths(state, params, 'Has', 'in')
+
+
+@handler('get_location_path_unit')
+def _get_location_path_unit(state, params):
+    return _location_paths(state, params, 'Part_of', 'out')
+
+
+@handler('get_placement_path')
+def _get_placement_path(state, params):
+    return _paths(state, params, 'Has', 'in', 'placement_path')
+
+
+@handler('get_placement_path_unit')
+def _get_placement_path_unit(state, params):
+    return _paths(state, params, 'Part_of', 'out', 'placement_path')
+
+
+@handler('with_same_name')
+def _with_same_name(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None or params['name'] is None or node.get('handle_id') is None:
+        return [{'ids': []}]
+    return [{'ids': [other.get('handle_id') for other in state.with_label('Relation')
+                     if 'Node' in other.labels and other.get('name') == params['name'] and
+                     other.get('handle_id') is not None and other.get('handle_id') != node.get('handle_id')]}]
+
+
+def _end(state, port):
+    """
+    :return: Id of the last node of the paths of 1 to 10 Has relationships ending in the port, or None
+    """
+    ends = [nodes[-1] for nodes, _ in _trails(state, port, ['Has'], 'in', 1, 10)] if port is not None else []
+    return ends[-1] if ends else None
+
+
+def _end_locations(state, end):
+    """
+    :return: (end, location, site) for the locations of the end node and the sites that have them
+    """
+    rows = []
+    locations = [i for _, i in _neighbours(state, end, ['Located_in'], 'out')] if end is not None else []
+    for location in locations or [None]:
+        sites = [i for _, i in _neighbours(state, location, ['Has'], 'in')] if location is not None else []
+        rows.extend((end, location, site) for site in sites or [None])
+    return rows
+
+
+def _connection_records(state, groups):
+    records = []
+    for porta, r0, cable, portb, r1 in groups:
+        for end, location, site in _end_locations(state, _end(state, portb)):
+            records.append({
+                'porta': _optional(state, porta),
+                'r0': state.relationship(r0.id) if r0 is not None else None,
+                'cable': _optional(state, cable),
+                'r1': state.relationship(r1.id) if r1 is not None else None,
+                'portb': _optional(state, portb),
+                'end': _optional(state, end),
+                'location': _optional(state, location),
+                'site': _optional(state, site),
+            })
+    return records
+
+
+@handler('get_connections')
+def _get_connections(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    groups = []
+    portas = _distinct(nodes[-1] for nodes, _ in _trails(state, node.id, ['Has'], 'out', 1, 10))
+    for porta in [i for i in portas if _has_label(state, i, 'Port')]:
+        cables = list(_neighbours(state, porta, ['Connected_to'], 'in'))
+        if not cables:
+            groups.append((porta, None, None, None, None))
+        for r0, cable in cables:
+            ports = [(r1, portb) for r1, portb in _neighbours(state, cable, ['Connected_to'], 'out')
+                     if r1.id != r0.id and _has_label(state, portb, 'Port')]
+            if not ports:
+                groups.append((porta, r0, cable, None, None))
+            groups.extend((porta, r0, cable, portb, r1) for r1, portb in ports)
+    return _connection_records(state, groups)
+
+
+@handler('get_connections_sub_equipment')
+def _get_connections_sub_equipment(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    groups = []
+    for r0, cable in _neighbours(state, node.id, ['Connected_to'], 'in'):
+        ports = [(r1, portb) for r1, portb in _neighbours(state, cable, ['Connected_to'], 'out') if r1.id != r0.id]
+        if not ports:
+            groups.append((node.id, r0, cable, None, None))
+        groups.extend((node.id, r0, cable, portb, r1) for r1, portb in ports)
+    return _connection_records(state, groups)
+
+
+@handler('get_connected_equipment')
+def _get_connected_equipment(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    records = []
+    for relationship, port in _neighbours(state, node.id, ['Connected_to'], 'out'):
+        for end, location, site in _end_locations(state, _end(state, port)):
+            records.append({'rel_id': relationship.id, 'rel': state.relationship(relationship.id),
+                            'port': state.node(port), 'end': _optional(state, end),
+                            'location': _optional(state, location), 'site': _optional(state, site)})
+    return sorted(records, key=lambda record: (_nulls_last(record['end'] and record['end'].get('name')),
+                                               _nulls_last(record['port'].get('name'))))
+
+
+@handler('get_services')
+def _get_services(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    services = []
+    for equip in _expand(state, node.id, ['Connected_to'], None, 20):
+        services.extend(i for i in _expand(state, equip, ['Depends_on'], 'in', 10)
+                        if 'Service' in state.nodes[i].labels)
+    return [{'service': state.node(service),
+             'users': _nodes(state, [i for _, i in _neighbours(state, service, ['Uses'], 'in')])}
+            for service in _distinct(services)]
+
+
+def _connection_path(state, node, label, ports, max_depth):
+    if node is None or label not in node.labels:
+        return []
+    longest = None
+    for port in _distinct(ports):
+        for nodes, _ in _trails(state, port, ['Connected_to'], None, 1):
+            if longest is None or len(nodes) > len(longest):
+                longest = nodes
+    records = []
+    for part in longest or []:
+        parents = [nodes[-1] for nodes, _ in _trails(state, part, ['Has'], 'in', 1, max_depth)
+                   if not list(_neighbours(state, nodes[-1], ['Has'], 'in'))]
+        records.extend({'part': state.node(part), 'parent': _optional(state, parent)} for parent in parents or [None])
+    return records
+
+
+@handler('get_connection_path_port')
+def _get_connection_path_port(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    ports = [node.id] + [i for i in _expand(state, node.id, ['Connected_to'], None, 20) if _has_label(state, i, 'Port')]
+    return _connection_path(state, node, 'Port', ports, 20)
+
+
+@handler('get_connection_path_cable')
+def _get_connection_path_cable(state, params):
+    node = state.by_handle_id(params['handle_id'])
+    if node is None:
+        return []
+    ports = [i for i in _expand(state, node.id, ['Connected_to'], None, 10) if _has_label(state, i, 'Port')]
+    return _connection_path(state, node, 'Cable', ports, 10)
+
+
+_CREATE_RE = re.compile(r'(\s|//[^\n]*)*CREATE\b', re.IGNORECASE)
+_TOKEN_RE = re.compile(r"""\s+|//[^\n]*|'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?|\w+|<-|->|[()\[\]{}:,-]""")
+
+
+def _tokenize(statement):
+    tokens, position = [], 0
+    while position < len(statement):
+        match = _TOKEN_RE.match(statement, position)
+        if match is None:
+            raise UnsupportedQuery(statement)
+        token = match.group()
+        if not token.isspace() and not token.startswith('//'):
+            tokens.append(token)
+        position = match.end()
+    return tokens
+
+
+class _CreateParser(object):
+    """
+    Parses a CREATE statement of node and relationship patterns with literal properties, eg. a test fixture like
+
+        CREATE (router1:Node:Physical:Router {name:'Router1', handle_id:'1'}),
+               (router1)-[:Has]->(port1:Node:Physical:Port {name:'Port1', handle_id:'2'})
+
+    and creates the nodes and relationships in the order they appear.
+    """
+
+    def __init__(self, state, statement):
+        self.state = state
+        self.statement = statement
+        self.tokens = _tokenize(statement)
+        self.position = 0
+        self.variables = {}
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            raise UnsupportedQuery(self.statement)
+        self.position += 1
+        return token
+
+    def literal(self):
+        token = self.take()
+        if token[0] in '\'"':
+            return re.sub(r'\\(.)', r'\1', token[1:-1])
+        if re.match(r'-?\d', token):
+            return float(token) if '.' in token else int(token)
+        literals = {'true': True, 'false': False, 'null': None}
+        if token.lower() not in literals:
+            raise UnsupportedQuery(self.statement)
+        return literals[token.lower()]
+
+    def properties(self):
+        properties = {}
+        if self.peek() != '{':
+            return properties
+        self.take('{')
+        while self.peek() != '}':
+            key = self.take()
+            self.take(':')
+            properties[key] = self.literal()
+            if self.peek() == ',':
+                self.take(',')
+        self.take('}')
+        return properties
+
+    def node(self):
+        self.take('(')
+        variable = self.take() if self.peek() not in (':', '{', ')') else None
+        labels = []
+        while self.peek() == ':':
+            self.take(':')
+            labels.append(self.take())
+        properties = self.properties()
+        self.take(')')
+        if variable in self.variables and not labels and not properties:
+            return self.variables[variable]
+        if variable in self.variables:
+            raise UnsupportedQuery(self.statement)
+        node = self.state.create_node(labels, properties)
+        if variable is not None:
+            self.variables[variable] = node
+        return node
+
+    def relationship(self):
+        incoming = self.take() == '<-'
+        self.take('[')
+        if self.peek() != ':':
+            self.take()
+        self.take(':')
+        rel_type = self.take()
+        properties = self.properties()
+        self.take(']')
+        self.take('->' if not incoming else '-')
+        return incoming, rel_type, properties
+
+    def pattern(self):
+        start = self.node()
+        while self.peek() in ('-', '<-'):
+            incoming, rel_type, properties = self.relationship()
+            end = self.node()
+            if incoming:
+                self.state.create_relationship(rel_type, end, start, properties)
+            else:
+                self.state.create_relationship(rel_type, start, end, properties)
+            start = end
+
+    def parse(self):
+        if self.take().upper() != 'CREATE':
+            raise UnsupportedQuery(self.statement)
+        self.pattern()
+        while self.peek() == ',':
+            self.take(',')
+            self.pattern()
+        if self.peek() is not None:
+            raise UnsupportedQuery(self.statement)
+        return []
@@ -0,0 +1,787 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of the Cypher query templates used by norduniclient.core and norduniclient.models.
+
+Neo4j can not take identifiers as parameters, so templates that need labels, relationship types or property keys
+have $identifier slots that are validated and filled in when the query is rendered, while all values are passed as
+query parameters. Every rendered query text is memoized, so the number of distinct query texts, and plans in the
+server plan cache, is bounded by the identifiers in use.
+
+    q = queries.render('create_node', meta_type='Logical', label='Service')
+    s.run(q, {'props': props})
+
+Identifiers have to match IDENTIFIER_RE and lookup functions have to be one of LOOKUP_FUNCTIONS, anything else raises
+norduniclient.exceptions.InvalidIdentifier.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import re
+from string import Template
+
+from norduniclient import exceptions
+
+__author__ = 'lundberg'
+
+IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*\Z')
+LOOKUP_FUNCTIONS = ('STARTS WITH', 'CONTAINS', 'ENDS WITH')
+
+
+def validate_identifier(identifier):
+    """
+    :param identifier: Label, relationship type or property key
+    :return: identifier
+    :raises norduniclient.exceptions.InvalidIdentifier: If identifier can not be used in a query text
+    """
+    try:
+        valid = IDENTIFIER_RE.match(identifier) is not None
+    except TypeError:
+        valid = False
+    if not valid:
+        raise exceptions.InvalidIdentifier(identifier)
+    return identifier
+
+
+def validate_lookup_func(lookup_func):
+    if lookup_func not in LOOKUP_FUNCTIONS:
+        raise exceptions.InvalidIdentifier(lookup_func)
+    return lookup_func
+
+
+class QueryTemplate(object):
+
+    def __init__(self, name, text):
+        self.name = name
+        self.template = Template(text)
+        self.slots = tuple(sorted(set(m.group('named') or m.group('braced')
+                                      for m in Template.pattern.finditer(text)
+                                      if m.group('named') or m.group('braced'))))
+        self._rendered = {}
+
+    def __len__(self):
+        return len(self._rendered)
+
+    def render(self, **identifiers):
+        """
+        :return: The query text with the identifiers filled in
+        :rtype: str
+        """
+        key = tuple(identifiers.get(slot) for slot in self.slots)
+        q = self._rendered.get(key)
+        if q is None:
+            validated = {}
+            for slot in self.slots:
+                if slot == 'lookup_func':
+                    validated[slot] = validate_lookup_func(identifiers[slot])
+                else:
+                    validated[slot] = validate_identifier(identifiers[slot])
+            q = self._rendered[key] = self.template.substitute(validated)
+            _rendered_from[q] = (self.name, validated)
+        return q
+
+
+TEMPLATES = {}
+_rendered_from = {}  # Rendered query text -> (template name, identifiers)
+
+
+def register(name, text):
+    """
+    Adds a query template to the registry.
+
+    :param name: Template name
+    :param text: Cypher with $identifier slots
+    :rtype: QueryTemplate
+    """
+    TEMPLATES[name] = QueryTemplate(name, text)
+    return TEMPLATES[name]
+
+
+def render(name, **identifiers):
+    return TEMPLATES[name].render(**identifiers)
+
+
+def query_id(query):
+    """
+    :param query: Query text
+    :return: The name of the template the query was rendered from, or a hash of the query text
+    :rtype: str
+    """
+    try:
+        return _rendered_from[query][0]
+    except (KeyError, TypeError):
+        pass
+    text = ' '.join(query.split())
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return 'sha1:{!s}'.format(hashlib.sha1(text).hexdigest()[:12])
+
+
+def rendered_from(query):
+    """
+    :param query: Query text
+    :return: (template name, identifiers) the query was rendered from, or None
+    :rtype: tuple|None
+    """
+    try:
+        return _rendered_from.get(query)
+    except TypeError:
+        return None
+
+
+def rendered_count():
+    """
+    :return: Number of distinct query texts rendered from the registry
+    :rtype: int
+    """
+    return sum(len(template) for template in TEMPLATES.values())
+
+
+register('create_node', """
+    CREATE (n:Node:$meta_type:$label { props })
+    RETURN n
+    """)
+
+register('create_nodes', """
+    UNWIND {rows} AS row
+    CREATE (n:Node:$meta_type:$label)
+    SET n = row
+    RETURN n
+    """)
+
+register('get_node', """
+    MATCH (n:Node { handle_id: {handle_id} })
+    RETURN n
+    """)
+
+register('get_nodes', """
+    MATCH (n:Node)
+    WHERE n.handle_id IN {handle_ids}
+    RETURN n
+    """)
+
+register('delete_node', """
+    MATCH (n:Node {handle_id: {handle_id}})
+    OPTIONAL MATCH (n)-[r]-()
+    DELETE n,r
+    """)
+
+register('delete_nodes_by_handle_id_prefix', """
+    MATCH (n:Node)
+    WHERE n.handle_id STARTS WITH {prefix}
+    WITH n LIMIT {limit}
+    DETACH DELETE n
+    RETURN count(*) AS count
+    """)
+
+register('set_node_properties', """
+    MATCH (n:Node {handle_id: {props}.handle_id})
+    WITH n, n._dependents AS dependents
+    SET n = {props}
+    SET n._dependents = dependents
+    RETURN n
+    """)
+
+register('get_nodes_by_name', """
+    MATCH (n:Node {name: {name}})
+    RETURN n
+    """)
+
+register('get_unique_node_by_name', """
+    MATCH (n:Node { name: {name} })
+    WHERE {label} IN labels(n)
+    RETURN n.handle_id as handle_id
+    """)
+
+register('get_meta_types', """
+    MATCH (n:Node)
+    WHERE n.handle_id IN {handle_ids}
+    RETURN n.handle_id AS handle_id, head([l IN labels(n) WHERE l IN {meta_types}]) AS meta_type
+    """)
+
+# Node iteration, the _page variants return the nodes after {after}, or from the start if it is null, in pages
+register('nodes_by_label', """
+    MATCH (n:$label)
+    RETURN distinct n
+    """)
+
+# The _first_page and _page variants match :Node as well so the pages are read with a seek on the handle_id index
+register('nodes_by_label_first_page', """
+    MATCH (n:Node:$label)
+    RETURN distinct n ORDER BY n.handle_id LIMIT {limit}
+    """)
+
+register('nodes_by_label_page', """
+    MATCH (n:Node:$label)
+    WHERE n.handle_id > {after}
+    RETURN distinct n ORDER BY n.handle_id LIMIT {limit}
+    """)
+
+register('nodes_by_value', """
+    MATCH (n:$label)
+    WHERE n.$prop = {value}
+    RETURN distinct n
+    """)
+
+register('nodes_by_value_first_page', """
+    MATCH (n:Node:$label)
+    WHERE n.$prop = {value}
+    RETURN distinct n ORDER BY n.handle_id LIMIT {limit}
+    """)
+
+register('nodes_by_value_page', """
+    MATCH (n:Node:$label)
+    WHERE n.handle_id > {after} AND n.$prop = {value}
+    RETURN distinct n ORDER BY n.handle_id LIMIT {limit}
+    """)
+
+register('search_nodes_by_property', """
+    MATCH (n:$label)
+    WHERE n.$prop =~ {regex} OR any(x IN n.$prop WHERE x =~ {regex})
+    RETURN distinct n
+    """)
+
+register('search_nodes_by_property_first_page', """
+    MATCH (n:Node:$label)
+    WHERE n.$prop =~ {regex} OR any(x IN n.$prop WHERE x =~ {regex})
+    RETURN distinct n ORDER BY n.handle_id LIMIT {limit}
+    """)
+
+register('search_nodes_by_property_page', """
+    MATCH (n:Node:$label)
+    WHERE n.handle_id > {after} AND (n.$prop =~ {regex} OR any(x IN n.$prop WHERE x =~ {regex}))
+    RETURN distinct n ORDER BY n.handle_id LIMIT {limit}
+    """)
+
+# Properties starting with _ are kept by norduniclient, eg. the materialized dependents, and are not searched
+register('search_nodes', """
+    MATCH (n:$label)
+    WHERE any(prop in keys(n) WHERE NOT prop STARTS WITH '_' AND n[prop] =~ {regex})
+        OR any(prop in keys(n) WHERE NOT prop STARTS WITH '_' AND any(x IN n[prop] WHERE x =~ {regex}))
+    RETURN distinct n
+    """)
+
+register('search_nodes_first_page', """
+    MATCH (n:Node:$label)
+    WHERE any(prop in keys(n) WHERE NOT prop STARTS WITH '_' AND n[prop] =~ {regex})
+        OR any(prop in keys(n) WHERE NOT prop STARTS WITH '_' AND any(x IN n[prop] WHERE x =~ {regex}))
+    RETURN distinct n ORDER BY n.handle_id LIMIT {limit}
+    """)
+
+register('search_nodes_page', """
+    MATCH (n:Node:$label)
+    WHERE n.handle_id > {after} AND (any(prop in keys(n) WHERE NOT prop STARTS WITH '_' AND n[prop] =~ {regex})
+        OR any(prop in keys(n) WHERE NOT prop STARTS WITH '_' AND any(x IN n[prop] WHERE x =~ {regex})))
+    RETURN distinct n ORDER BY n.handle_id LIMIT {limit}
+    """)
+
+register('db_indexes', 'CALL db.indexes()')
+
+register('create_index', 'CREATE INDEX ON :$label($prop)')
+
+register('create_unique_constraint', 'CREATE CONSTRAINT ON (n:$label) ASSERT n.$prop IS UNIQUE')
+
+register('get_indexed_node', """
+    MATCH (n:$label)
+    WHERE LOWER(n.$prop) $lookup_func LOWER({value})
+    RETURN n
+    """)
+
+# Matches :Node as well so the index on :Node($shadow_prop) that backfill_normalized_properties creates can be used
+register('get_normalized_node', """
+    MATCH (n:Node:$label)
+    WHERE n.$shadow_prop $lookup_func {value}
+    RETURN n
+    """)
+
+# STARTS WITH is null for values that are not strings, they get no shadow property
+register('backfill_normalized_property', """
+    MATCH (n:Node)
+    WITH n, CASE WHEN n.$prop STARTS WITH '' THEN toLower(n.$prop) END AS lc
+    WHERE (lc IS NOT NULL AND (NOT exists(n.$shadow_prop) OR n.$shadow_prop <> lc))
+        OR (lc IS NULL AND exists(n.$shadow_prop))
+    WITH n, lc LIMIT {limit}
+    SET n.$shadow_prop = lc
+    RETURN count(n) AS count
+    """)
+
+register('create_relationship', """
+    MATCH (a:Node {handle_id: {start}}),(b:Node {handle_id: {end}})
+    CREATE (a)-[r:$rel_type]->(b)
+    RETURN r
+    """)
+
+_validated_relationship_match = """
+    OPTIONAL MATCH (a:Node {handle_id: {start}})
+    OPTIONAL MATCH (b:Node {handle_id: {end}})
+    WITH a, b, coalesce({meta_type}, head([l IN labels(a) WHERE l IN {meta_types}])) AS start_meta,
+         head([l IN labels(b) WHERE l IN {meta_types}]) AS end_meta
+    WITH a, b, start_meta, end_meta,
+         coalesce(a IS NOT NULL AND b IS NOT NULL AND
+                  start_meta + ':' + end_meta + ':' + {rel_type} IN {possible}, false) AS possible
+    """
+
+register('create_validated_relationship', _validated_relationship_match + """
+    UNWIND CASE WHEN possible THEN [a] ELSE [] END AS start_node
+    CREATE (start_node)-[r:$rel_type]->(b)
+    RETURN a IS NOT NULL AS start_found, b IS NOT NULL AS end_found, start_meta, end_meta, ID(r) AS id
+    UNION ALL
+    """ + _validated_relationship_match + """
+    WITH a, b, start_meta, end_meta, possible
+    WHERE NOT possible
+    RETURN a IS NOT NULL AS start_found, b IS NOT NULL AS end_found, start_meta, end_meta, null AS id
+    """)
+
+register('create_relationships', """
+    UNWIND {rows} AS row
+    MATCH (a:Node {handle_id: row.start}), (b:Node {handle_id: row.end})
+    CREATE (a)-[r:$rel_type]->(b)
+    RETURN row.index AS index, ID(r) AS id
+    """)
+
+register('get_relationship', """
+    MATCH ()-[r]->()
+    WHERE ID(r) = {relationship_id}
+    RETURN r
+    """)
+
+register('get_relationship_bundle', """
+    MATCH (start)-[r]->(end)
+    WHERE ID(r) = {relationship_id}
+    RETURN start, r, end
+    """)
+
+register('delete_relationship', """
+    MATCH (a)-[r]->(b)
+    WHERE ID(r) = {relationship_id}
+    DELETE r
+    RETURN a.handle_id AS start, b.handle_id AS end
+    """)
+
+register('set_relationship_properties', """
+    MATCH ()-[r]->()
+    WHERE ID(r) = {relationship_id}
+    SET r = {props}
+    RETURN r
+    """)
+
+register('get_relationships', """
+    MATCH (a:Node {handle_id: {handle_id1}})-[r]-(b:Node {handle_id: {handle_id2}})
+    RETURN collect(r) as relationships
+    """)
+
+register('get_relationships_by_type', """
+    MATCH (a:Node {handle_id: {handle_id1}})-[r:$rel_type]-(b:Node {handle_id: {handle_id2}})
+    RETURN collect(r) as relationships
+    """)
+
+register('add_label', """
+    MATCH (n:Node {handle_id: {handle_id}})
+    SET n:$label
+    RETURN n
+    """)
+
+register('remove_label', """
+    MATCH (n:Node {handle_id: {handle_id}})
+    REMOVE n:$label
+    RETURN n
+    """)
+
+# Adjacency of the relationships followed by dependency queries, see norduniclient.impact
+register('get_dependency_nodes', """
+    MATCH (n:Node)
+    RETURN n.handle_id AS handle_id, labels(n) AS labels
+    """)
+
+register('get_dependency_nodes_by_handle_ids', """
+    MATCH (n:Node)
+    WHERE n.handle_id IN {handle_ids}
+    RETURN n.handle_id AS handle_id, labels(n) AS labels
+    """)
+
+register('get_dependency_edges', """
+    MATCH (a:Node)-[r:Depends_on|Part_of|Has|Connected_to]->(b:Node)
+    RETURN ID(r) AS id, a.handle_id AS start, type(r) AS type, b.handle_id AS end
+    """)
+
+register('get_dependency_edges_by_handle_ids', """
+    MATCH (a:Node)-[r:Depends_on|Part_of|Has|Connected_to]-(b:Node)
+    WHERE a.handle_id IN {handle_ids}
+    RETURN DISTINCT ID(r) AS id, startNode(r).handle_id AS start, type(r) AS type, endNode(r).handle_id AS end
+    """)
+
+# Materialized dependents, the handle ids of the nodes that depend on a node through Depends_on or Part_of
+register('get_dependencies_closure', """
+    MATCH (n:Node)-[:Part_of|Depends_on*1..20]->(t)
+    WHERE n.handle_id IN {handle_ids}
+    RETURN collect(DISTINCT t.handle_id) AS handle_ids
+    """)
+
+register('set_dependents', """
+    MATCH (n:Node)
+    WHERE n.handle_id IN {handle_ids}
+    MATCH (n)-[:Part_of|Depends_on*0..20]->(t)
+    WITH DISTINCT t
+    OPTIONAL MATCH (t)<-[:Part_of|Depends_on*1..20]-(dep)
+    WITH t, collect(DISTINCT dep.handle_id) AS dependents
+    SET t._dependents = dependents
+    RETURN count(t) AS count
+    """)
+
+# set_dependents_first_page and set_dependents_page update the nodes in handle_id order, the nodes after {after}
+register('set_dependents_first_page', """
+    MATCH (t:Node)
+    WITH t ORDER BY t.handle_id LIMIT {limit}
+    OPTIONAL MATCH (t)<-[:Part_of|Depends_on*1..20]-(dep)
+    WITH t, collect(DISTINCT dep.handle_id) AS dependents
+    SET t._dependents = dependents
+    RETURN max(t.handle_id) AS last, count(t) AS count
+    """)
+
+register('set_dependents_page', """
+    MATCH (t:Node)
+    WHERE t.handle_id > {after}
+    WITH t ORDER BY t.handle_id LIMIT {limit}
+    OPTIONAL MATCH (t)<-[:Part_of|Depends_on*1..20]-(dep)
+    WITH t, collect(DISTINCT dep.handle_id) AS dependents
+    SET t._dependents = dependents
+    RETURN max(t.handle_id) AS last, count(t) AS count
+    """)
+
+# Node models, see norduniclient.models. Read queries return r and node, or a key to group the nodes by, and merge
+# queries also return whether the relationship was created.
+register('get_incoming', """
+    MATCH (n:Node {handle_id: {handle_id}})<-[r]-(node)
+    RETURN r, node
+    """)
+
+register('get_outgoing', """
+    MATCH (n:Node {handle_id: {handle_id}})-[r]->(node)
+    RETURN r, node
+    """)
+
+register('get_neighbours', """
+    MATCH (n:Node {handle_id: {handle_id}})-[r]-(node)
+    RETURN r, node
+    """)
+
+register('get_incoming_by_type', """
+    MATCH (n:Node {handle_id: {handle_id}})<-[r:$rel_type]-(node)
+    RETURN r, node
+    """)
+
+register('get_outgoing_by_type', """
+    MATCH (n:Node {handle_id: {handle_id}})-[r:$rel_type]->(node)
+    RETURN r, node
+    """)
+
+register('get_incoming_by_type_and_label', """
+    MATCH (n:Node {handle_id: {handle_id}})<-[r:$rel_type]-(node:$label)
+    RETURN r, node
+    """)
+
+register('get_outgoing_by_type_and_label', """
+    MATCH (n:Node {handle_id: {handle_id}})-[r:$rel_type]->(node:$label)
+    RETURN r, node
+    """)
+
+register('merge_incoming', """
+    MATCH (n:Node {handle_id: {handle_id}}), (node:Node {handle_id: {other_handle_id}})
+    WITH n, node, NOT EXISTS((n)<-[:$rel_type]-(node)) as created
+    MERGE (n)<-[r:$rel_type]-(node)
+    RETURN created, r, node
+    """)
+
+register('merge_outgoing', """
+    MATCH (n:Node {handle_id: {handle_id}}), (node:Node {handle_id: {other_handle_id}})
+    WITH n, node, NOT EXISTS((n)-[:$rel_type]->(node)) as created
+    MERGE (n)-[r:$rel_type]->(node)
+    RETURN created, r, node
+    """)
+
+register('get_relations', """
+    MATCH (n:Node {handle_id: {handle_id}})<-[r:Owns|Uses|Provides|Responsible_for]-(node)
+    RETURN r, node
+    """)
+
+register('get_customers', """
+    MATCH (n:Node {handle_id: {handle_id}})<-[r:Owns|Uses]-(customer:Customer)
+    RETURN "customers" as key, r, customer as node
+    """)
+
+register('get_port', """
+    MATCH (n:Node {handle_id: {handle_id}})-[r:Has]->(port:Port)
+    WHERE port.name = {port_name}
+    RETURN r, port as node
+    """)
+
+register('get_unit', """
+    MATCH (n:Node {handle_id: {handle_id}})<-[r:Part_of]-(unit:Unit)
+    WHERE unit.name = {unit_name}
+    RETURN r, unit as node
+    """)
+
+register('get_host_service', """
+    MATCH (n:Node {handle_id: {handle_id}})<-[r:Depends_on]-(host_service:Node {handle_id: {service_handle_id}})
+    WHERE r.ip_address={ip_address} AND r.port={port} AND r.protocol={protocol}
+    RETURN r, host_service as node
+    """)
+
+register('get_peering_group', """
+    MATCH (n:Node {handle_id: {handle_id}})-[r:Uses]->(group:Node {handle_id: {group_handle_id}})
+    WHERE r.ip_address={ip_address}
+    RETURN r, group as node
+    """)
+
+register('get_group_dependency', """
+    MATCH (n:Node {handle_id: {handle_id}})-[r:Depends_on]->(dependency:Node {handle_id: {dependency_handle_id}})
+    WHERE r.ip_address={ip_address}
+    RETURN r, dependency as node
+    """)
+
+register('set_part_of', """
+    MATCH (n:Node {handle_id: {handle_id}}), (part:Node:Logical {handle_id: {part_handle_id}})
+    WITH n, part, NOT EXISTS((n)<-[:Part_of]-(part)) as created
+    MERGE (n)<-[r:Part_of]-(part)
+    RETURN created, r, part as node
+    """)
+
+register('set_host_service', """
+    MATCH (n:Node {handle_id: {handle_id}}), (host_service:Node {handle_id: {service_handle_id}})
+    CREATE (n)<-[r:Depends_on {ip_address:{ip_address}, port:{port}, protocol:{protocol}}]-(host_service)
+    RETURN true as created, r, host_service as node
+    """)
+
+register('set_peering_group', """
+    MATCH (n:Node {handle_id: {handle_id}}), (group:Node {handle_id: {group_handle_id}})
+    CREATE (n)-[r:Uses {ip_address:{ip_address}}]->(group)
+    RETURN true as created, r, group as node
+    """)
+
+register('set_group_dependency', """
+    MATCH (n:Node {handle_id: {handle_id}}), (dependency:Node {handle_id: {dependency_handle_id}})
+    CREATE (n)-[r:Depends_on {ip_address:{ip_address}}]->(dependency)
+    RETURN true as created, r, dependency as node
+    """)
+
+_child_form_data_match = """
+    MATCH (parent:Node {handle_id:{handle_id}})
+    MATCH (parent)--(child)
+    """
+
+_child_form_data_return = """
+    RETURN child.handle_id as handle_id, labels(child) as labels, child.name as name,
+           child.description as description
+    """
+
+register('get_child_form_data', _child_form_data_match + """
+    WHERE (parent)-[:Has]->(child) or (parent)<-[:Located_in|Part_of]-(child)
+    """ + _child_form_data_return)
+
+# AND binds harder than OR, so children with a Has relationship match regardless of label
+register('get_child_form_data_by_label', _child_form_data_match + """
+    WHERE (parent)-[:Has]->(child) or (parent)<-[:Located_in|Part_of]-(child) and (child):$label
+    """ + _child_form_data_return)
+
+register('get_child_form_data_has', """
+    MATCH (parent:Node {handle_id:{handle_id}})
+    MATCH (parent)-[:Has*]->(child:$label)
+    """ + _child_form_data_return + """
+    ORDER BY child.name
+    """)
+
+_as_types = """
+    WITH direct, deps, filter(n in deps WHERE n:Service) as services
+    WITH direct, deps, services, filter(n in deps WHERE n:Optical_Path) as paths
+    WITH direct, deps, services, paths, filter(n in deps WHERE n:Optical_Multiplex_Section) as oms
+    WITH direct, deps, services, paths, oms, filter(n in deps WHERE n:Optical_Link) as links
+    RETURN direct, services, paths, oms, links
+    """
+
+register('get_dependent_as_types', """
+    MATCH (node:Node {handle_id: {handle_id}})
+    OPTIONAL MATCH (node)<-[:Depends_on]-(d)
+    WITH node, collect(DISTINCT d) as direct
+    MATCH (node)<-[:Part_of|Depends_on*1..20]-(dep)
+    WITH direct, collect(DISTINCT dep) as deps
+    """ + _as_types)
+
+register('get_dependent_as_types_materialized', """
+    MATCH (node:Node {handle_id: {handle_id}})
+    OPTIONAL MATCH (node)<-[:Depends_on]-(d)
+    WITH node, collect(DISTINCT d) as direct
+    MATCH (dep:Node)
+    WHERE dep.handle_id IN node._dependents
+    WITH direct, collect(DISTINCT dep) as deps
+    """ + _as_types)
+
+# The + [null] is to handle both dep lists being emtpy since UNWIND gives 0 rows on unwind
+register('get_equipment_dependent_as_types', """
+    MATCH (node:Node {handle_id: {handle_id}})
+    OPTIONAL MATCH (node)<-[:Depends_on]-(d)
+    WITH node, collect(DISTINCT d) as direct
+    OPTIONAL MATCH (node)-[:Has*1..20]->()<-[:Part_of|Depends_on*1..20]-(dep)
+    OPTIONAL MATCH (node)-[:Has*1..20]->()<-[:Connected_to]-()-[:Connected_to]->()<-[:Depends_on*1..20]-(cable_dep)
+    WITH direct, collect(DISTINCT dep) + collect(DISTINCT cable_dep) + direct as coll
+    UNWIND coll AS x
+    WITH direct, collect(DISTINCT x) as deps
+    """ + _as_types)
+
+# Does not return Host_Service as a direct dependent
+register('get_host_dependent_as_types', """
+    MATCH (node:Node {handle_id: {handle_id}})
+    OPTIONAL MATCH (node)<-[:Depends_on]-(d)
+    WITH node, filter(n in collect(DISTINCT d) WHERE NOT(n:Host_Service)) as direct
+    MATCH (node)<-[:Depends_on*1..20]-(dep)
+    WITH direct, collect(DISTINCT dep) as deps
+    """ + _as_types)
+
+register('get_cable_dependent_as_types', """
+    MATCH (n:Node {handle_id: {handle_id}})-[:Connected_to*1..20]-(equip)
+    WITH DISTINCT equip
+    MATCH (equip)<-[:Part_of|Depends_on*1..10]-(dep)
+    WITH collect(DISTINCT dep) as deps
+    WITH deps, filter(n in deps WHERE n:Service) as services
+    WITH deps, services, filter(n in deps WHERE n:Optical_Path) as paths
+    WITH deps, services, paths, filter(n in deps WHERE n:Optical_Multiplex_Section) as oms
+    WITH deps, services, paths, oms, filter(n in deps WHERE n:Optical_Link) as links
+    RETURN services, paths, oms, links
+    """)
+
+register('get_dependencies_as_types', """
+    MATCH (node:Node {handle_id: {handle_id}})
+    OPTIONAL MATCH (node)-[:Depends_on]->(d)
+    WITH node, collect(DISTINCT d) as direct
+    MATCH (node)-[:Depends_on*1..20]->(dep)
+    WITH node, direct, collect(DISTINCT dep) as deps
+    WITH node, direct, deps, filter(n in deps WHERE n:Service) as services
+    WITH node, direct, deps, services, filter(n in deps WHERE n:Optical_Path) as paths
+    WITH node, direct, deps, services, paths, filter(n in deps WHERE n:Optical_Multiplex_Section) as oms
+    WITH node, direct, deps, services, paths, oms, filter(n in deps WHERE n:Optical_Link) as links
+    WITH node, direct, services, paths, oms, links
+    OPTIONAL MATCH (node)-[:Depends_on*1..20]->()-[:Connected_to*1..50]-(cable)
+    RETURN direct, services, paths, oms, links, filter(n in collect(DISTINCT cable) WHERE n:Cable) as cables
+    """)
+
+register('get_ports', """
+    MATCH (node:Node {handle_id: {handle_id}})-[r:Connected_to|Depends_on]-(port:Port)
+    WITH port, r
+    OPTIONAL MATCH p=(port)<-[:Has*1..]-(parent)
+    RETURN port, r as relationship, LAST(nodes(p)) as parent
+    ORDER BY parent.name
+    """)
+
+
+def _longest_paths(key):
+    """
+    :return: The end of a query returning the longest of the paths p, ending in a node matched as r or parent, as key
+    """
+    return """
+    WITH COLLECT(nodes(p)) as paths, MAX(length(nodes(p))) AS maxLength
+    WITH FILTER(path IN paths WHERE length(path)=maxLength) AS longestPaths
+    UNWIND(longestPaths) as """ + key + """
+    RETURN """ + key + """
+    """
+
+
+register('get_location_path', """
+    MATCH (n:Node {handle_id: {handle_id}})-[:Located_in]->(r)
+    MATCH p=()-[:Has*0..20]->(r)
+    """ + _longest_paths('location_path'))
+
+register('get_location_path_location', """
+    MATCH (n:Node {handle_id: {handle_id}})<-[:Has]-(r)
+    MATCH p=()-[:Has*0..20]->(r)
+    """ + _longest_paths('location_path'))
+
+register('get_location_path_sub_equipment', """
+    MATCH (n:Node {handle_id: {handle_id}})<-[:Has]-(parent)
+    OPTIONAL MATCH p=()-[:Has*0..20]->(r)<-[:Located_in]-()-[:Has*0..20]->(parent)
+    """ + _longest_paths('location_path'))
+
+register('get_location_path_unit', """
+    MATCH (n:Node {handle_id: {handle_id}})-[:Part_of]->(parent)
+    OPTIONAL MATCH p=()-[:Has*0..20]->(r)<-[:Located_in]-()-[:Has*0..20]->(parent)
+    """ + _longest_paths('location_path'))
+
+register('get_placement_path', """
+    MATCH (n:Node {handle_id: {handle_id}})<-[:Has]-(parent)
+    OPTIONAL MATCH p=()-[:Has*0..20]->(parent)
+    """ + _longest_paths('placement_path'))
+
+register('get_placement_path_unit', """
+    MATCH (n:Node {handle_id: {handle_id}})-[:Part_of]->(parent)
+    OPTIONAL MATCH p=()-[:Has*0..20]->(parent)
+    """ + _longest_paths('placement_path'))
+
+register('with_same_name', """
+    MATCH (n:Node {handle_id: {handle_id}}), (other:Node:Relation {name: {name}})
+    WHERE other.handle_id <> n.handle_id
+    RETURN COLLECT(other.handle_id) as ids
+    """)
+
+_connections = """
+    OPTIONAL MATCH (portb)<-[:Has*1..10]-(end)
+    WITH porta, r0, cable, portb, r1, last(collect(end)) as end
+    OPTIONAL MATCH (end)-[:Located_in]->(location)
+    OPTIONAL MATCH (location)<-[:Has]-(site)
+    RETURN porta, r0, cable, r1, portb, end, location, site
+    """
+
+register('get_connections', """
+    MATCH (n:Node {handle_id: {handle_id}})-[:Has*1..10]->(porta:Port)
+    OPTIONAL MATCH (porta)<-[r0:Connected_to]-(cable)
+    OPTIONAL MATCH (cable)-[r1:Connected_to]->(portb:Port)
+    WHERE ID(r1) <> ID(r0)
+    """ + _connections)
+
+register('get_connections_sub_equipment', """
+    MATCH (porta:Node {handle_id: {handle_id}})<-[r0:Connected_to]-(cable)
+    OPTIONAL MATCH (porta)<-[r0:Connected_to]-(cable)-[r1:Connected_to]->(portb)
+    """ + _connections)
+
+register('get_connected_equipment', """
+    MATCH (n:Node {handle_id: {handle_id}})-[rel:Connected_to]->(port)
+    OPTIONAL MATCH (port)<-[:Has*1..10]-(end)
+    WITH  rel, port, last(collect(end)) as end
+    OPTIONAL MATCH (end)-[:Located_in]->(location)
+    OPTIONAL MATCH (location)<-[:Has]-(site)
+    RETURN id(rel) as rel_id, rel, port, end, location, site
+    ORDER BY end.name, port.name
+    """)
+
+register('get_services', """
+    MATCH (n:Node {handle_id: {handle_id}})
+    MATCH (n)-[:Connected_to*1..20]-(equip)
+    WITH equip
+    MATCH (equip)<-[:Depends_on*1..10]-(service)
+    WHERE service:Service
+    WITH distinct service
+    OPTIONAL MATCH (service)<-[:Uses]-(user)
+    RETURN service, collect(user) as users
+    """)
+
+# The longest path of Connected_to relationships from the ports connected to the node and the top parents of its parts
+register('get_connection_path_port', """
+    MATCH (n:Port {handle_id: {handle_id}})-[:Connected_to*0..20]-(port:Port)
+    OPTIONAL MATCH path=(port)-[:Connected_to*]-()
+    WITH nodes(path) AS parts, length(path) AS len
+    ORDER BY len DESC
+    LIMIT 1
+    UNWIND parts AS part
+    OPTIONAL MATCH (part)<-[:Has*1..20]-(parent)
+    WHERE NOT (parent)<-[:Has]-()
+    RETURN part, parent
+    """)
+
+register('get_connection_path_cable', """
+    MATCH (n:Cable {handle_id: {handle_id}})-[:Connected_to*1..10]-(port:Port)
+    OPTIONAL MATCH path=(port)-[:Connected_to*]-()
+    WITH nodes(path) AS parts, length(path) AS len
+    ORDER BY len DESC
+    LIMIT 1
+    UNWIND parts AS part
+    OPTIONAL MATCH (part)<-[:Has*1..10]-(parent)
+    WHERE NOT (parent)<-[:Has]-()
+    RETURN part, parent
+    """)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Declarative schema for the constraints and indexes the norduniclient models rely on.
+
+ensure_schema compares SCHEMA with the live schema using one call to db.indexes(), creates what is missing and
+remembers the verified database so later calls for the same uri do nothing.
+
+Neo4j 3.x only supports indexes on node properties, relationship properties like ip_address can not be indexed.
+"""
+
+from __future__ import absolute_import
+
+import re
+from collections import namedtuple
+
+from norduniclient import queries
+
+import logging
+logger = logging.getLogger(__name__)
+
+__author__ = 'lundberg'
+
+
+class Constraint(namedtuple('Constraint', ['label', 'prop'])):
+    """
+    Unique property constraint, also backed by an index.
+    """
+
+    def create_statement(self):
+        return queries.render('create_unique_constraint', label=self.label, prop=self.prop)
+
+
+class Index(namedtuple('Index', ['label', 'prop'])):
+
+    def create_statement(self):
+        return queries.render('create_index', label=self.label, prop=self.prop)
+
+
+SCHEMA = [
+    Constraint('Node', 'handle_id'),
+    Index('Node', 'name'),
+    Index('Port', 'name'),
+    Index('Unit', 'name'),
+    Index('Relation', 'name'),
+]
+
+_DESCRIPTION_RE = re.compile(r':`?(\w+)`?\(`?(\w+)`?\)')
+
+# (uri, schema) pairs that have been verified in this process
+_verified = set()
+
+
+def get_live_schema(manager):
+    """
+    :param manager: Neo4jDBSessionManager
+    :return: The constraints and indexes in the database
+    :rtype: set
+    """
+    live = set()
+    with manager.session as s:
+        for record in s.run(queries.render('db_indexes')):
+            match = _DESCRIPTION_RE.search(record['description'])
+            if not match:
+                continue
+            if record['type'] == 'node_unique_property':
+                live.add(Constraint(*match.groups()))
+            else:
+                live.add(Index(*match.groups()))
+    return live
+
+
+def ensure_schema(manager, schema=None, force=False):
+    """
+    Creates the constraints and indexes in schema that are missing in the database.
+
+    :param manager: Neo4jDBSessionManager
+    :param schema: Constraints and indexes, defaults to SCHEMA
+    :param force: Check the database even if it has been verified before
+
+    :type schema: list
+    :type force: bool
+
+    :return: The created constraints and indexes
+    :rtype: list
+    """
+    schema = tuple(SCHEMA if schema is None else schema)
+    key = (manager.uri, schema)
+    if key in _verified and not force:
+        return []
+    live = get_live_schema(manager)
+    missing = [item for item in schema if item not in live]
+    with manager.session as s:
+        for item in missing:
+            logger.info('Creating {!r} in Neo4j database: {!s}'.format(item, manager.uri))
+            s.run(item.create_statement()).consume()
+    _verified.add(key)
+    return missing
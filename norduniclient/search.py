@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Client side full text search for norduniclient.core.search_nodes_by_value.
+
+SearchIndex is a trigram inverted index over the string properties of all nodes. It is built by streaming the nodes
+once and then kept up to date from the write paths of norduniclient, as every write already evicts the changed nodes
+through Neo4jDBSessionManager.evict_nodes. The evicted nodes are fetched again, with one query, before the next search.
+
+    index = SearchIndex()
+    index.build(manager)
+    manager.search_index = index
+    for node in core.search_nodes_by_value(manager, 'value', node_type='Port'):
+        ...
+
+The searched value is matched as a case insensitive substring, not as a regular expression. search_nodes_by_value
+only uses the index for literal searches and for values without regular expression characters.
+"""
+
+from __future__ import absolute_import
+
+from collections import defaultdict
+from threading import RLock
+
+from norduniclient import core
+from norduniclient import helpers
+
+__author__ = 'lundberg'
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+def trigrams(value):
+    """
+    :param value: Lower case string
+    :return: All three character substrings of value
+    :rtype: set
+    """
+    return set(value[i:i + 3] for i in range(len(value) - 2))
+
+
+def _string_values(value):
+    if isinstance(value, string_types):
+        return [value.lower()]
+    if isinstance(value, (list, tuple)):
+        return [x.lower() for x in value if isinstance(x, string_types)]
+    return []
+
+
+class SearchIndex(object):
+    """
+    Maps every trigram to the handle ids of the nodes with a string property, or string list property, containing it.
+    For each node the labels and the lower cased string properties are kept to verify the candidates.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(set)
+        self._documents = {}
+        self._dirty = set()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, handle_id):
+        return handle_id in self._documents
+
+    def build(self, manager, page_size=1000):
+        """
+        Indexes all nodes, fetched in pages of page_size.
+
+        :param manager: Neo4jDBSessionManager
+        :param page_size: Nodes fetched per session
+        :type page_size: int
+        """
+        with self._lock:
+            self.clear()
+            for node in core.get_nodes_by_type(manager, 'Node', page_size=page_size):
+                self.add(node, manager.normalized_properties)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._dirty.clear()
+
+    def add(self, node, normalized_properties=()):
+        """
+        Indexes the node, replacing an earlier version of it. The properties kept by norduniclient, the materialized
+        dependents and the shadow properties of normalized_properties, are not indexed.
+
+        :param node: Node object
+        :param normalized_properties: See Neo4jDBSessionManager.normalized_properties
+        :type node: neo4j.v1.types.Node
+        :type normalized_properties: tuple
+        """
+        properties = {}
+        for key, value in node.items():
+            if helpers.is_internal_property(key, normalized_properties):
+                continue
+            values = _string_values(value)
+            if values:
+                properties[key] = values
+        handle_id = node['handle_id']
+        with self._lock:
+            self.remove(handle_id)
+            self._documents[handle_id] = (frozenset(node.labels), properties)
+            for values in properties.values():
+                for value in values:
+                    for trigram in trigrams(value):
+                        self._postings[trigram].add(handle_id)
+
+    def remove(self, handle_id):
+        with self._lock:
+            document = self._documents.pop(handle_id, None)
+            if document is None:
+                return
+            for values in document[1].values():
+                for value in values:
+                    for trigram in trigrams(value):
+                        posting = self._postings.get(trigram)
+                        if posting is not None:
+                            posting.discard(handle_id)
+                            if not posting:
+                                del self._postings[trigram]
+
+    def invalidate(self, *handle_ids):
+        """
+        Marks nodes as changed, they are fetched again before the next search.
+        """
+        with self._lock:
+            self._dirty.update(handle_ids)
+
+    def refresh(self, manager):
+        """
+        Fetches the nodes changed since the last refresh and updates the index.
+
+        :param manager: Neo4jDBSessionManager
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            try:
+                nodes = core._get_nodes(manager, list(dirty))
+            except Exception:
+                self._dirty.update(dirty)
+                raise
+            for handle_id, node in nodes.items():
+                if node is None:
+                    self.remove(handle_id)
+                else:
+                    self.add(node, manager.normalized_properties)
+
+    def _candidates(self, value):
+        grams = trigrams(value)
+        if not grams:  # Shorter than a trigram, verify every node
+            return set(self._documents)
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, manager, value, prop=None, node_type='Node'):
+        """
+        :param manager: Neo4jDBSessionManager
+        :param value: Value to search for
+        :param prop: Which property to look for value in
+        :param node_type: Label the nodes must have
+
+        :type value: str
+        :type prop: str
+        :type node_type: str
+
+        :return: Handle ids of the matching nodes, sorted
+        :rtype: list
+        """
+        self.refresh(manager)
+        value = value.lower()
+        matches = []
+        with self._lock:
+            for handle_id in self._candidates(value):
+                labels, properties = self._documents[handle_id]
+                if node_type not in labels:
+                    continue
+                if prop:
+                    values = properties.get(prop, [])
+                else:
+                    values = [x for prop_values in properties.values() for x in prop_values]
+                if any(value in x for x in values):
+                    matches.append(handle_id)
+        return sorted(matches)
+
+    def search_nodes(self, manager, value, prop=None, node_type='Node', page_size=None, resume_token=None):
+        """
+        Yields the matching nodes ordered by handle_id, fetched page_size at a time.
+
+        :rtype: collections.Iterable[neo4j.v1.types.Node]
+        """
+        handle_ids = self.search(manager, value, prop, node_type)
+        if resume_token:
+            after = core._decode_resume_token(resume_token)
+            handle_ids = [handle_id for handle_id in handle_ids if handle_id > after]
+        for chunk in core._chunks(handle_ids, page_size or 1000):
+            nodes = core._get_nodes(manager, chunk)
+            for handle_id in chunk:
+                if nodes[handle_id] is not None:
+                    yield nodes[handle_id]
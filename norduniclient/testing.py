@@ -23,6 +23,12 @@ __author__ = 'lundberg'
 
 # Run tests with different Neo4j docker image versions using environment variables
 NEO4J_VERSION = environ.get('NEO4J_VERSION', 'latest')
+# NEO4J_BACKEND=memory runs the tests against norduniclient.memory instead of a Neo4j docker image
+NEO4J_BACKEND = environ.get('NEO4J_BACKEND', 'docker')
+
+# Marks tests asserting the semantics of the Cypher statements themselves. norduniclient.memory only emulates them, so
+# these tests are skipped there and need a run against a Neo4j docker image to pass.
+cypher_only = unittest.skipIf(NEO4J_BACKEND == 'memory', 'Asserts Cypher semantics, needs a Neo4j server')
 
 
 class Neo4jTemporaryInstance(object):
@@ -151,14 +157,91 @@ class Neo4jTemporaryInstance(object):
             self._process = None
 
 
+class MemoryTemporaryInstance(object):
+    """
+    Singleton to manage a temporary in-memory graph, see norduniclient.memory.
+
+    Queries without an implementation in norduniclient.memory, like EXPLAIN and PROFILE, raise
+    norduniclient.memory.UnsupportedQuery.
+    """
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, name='testing'):
+        self._db = init_db('memory://{!s}'.format(name))
+
+    @property
+    def db(self):
+        return self._db
+
+    def purge_db(self):
+        self.db.driver.graph.clear()
+
+    def shutdown(self):
+        pass
+
+
+TEMPORARY_INSTANCES = {
+    'docker': Neo4jTemporaryInstance,
+    'memory': MemoryTemporaryInstance,
+}
+
+
 class Neo4jTestCase(unittest.TestCase):
     """
-    Base test case that sets up a temporary Neo4j instance
+    Base test case that sets up a temporary Neo4j instance, or an in-memory graph if NEO4J_BACKEND is memory
+
+    Override load_fixture to create data shared by the tests of the class. The database is purged after every test
+    and the fixture is loaded again before the next one.
+
+    Set transactional to True to instead load the fixture once per class and run every test in a unit of work that
+    is rolled back when the test ends. Work done in other threads or through other managers, like
+    Neo4jDBSessionManager.gather, does not see the changes made by the test.
     """
 
-    neo4j_instance = Neo4jTemporaryInstance.get_instance()
+    neo4j_instance = TEMPORARY_INSTANCES[NEO4J_BACKEND].get_instance()
     neo4jdb = neo4j_instance.db
+    transactional = False
+
+    @classmethod
+    def load_fixture(cls):
+        pass
+
+    @classmethod
+    def setUpClass(cls):
+        super(Neo4jTestCase, cls).setUpClass()
+        if cls.transactional:
+            cls.load_fixture()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.transactional:
+            cls.neo4j_instance.purge_db()
+        super(Neo4jTestCase, cls).tearDownClass()
+
+    def setUp(self):
+        if self.transactional:
+            unit_of_work = self.neo4jdb.unit_of_work(rollback=True)
+            unit_of_work.__enter__()
+            self.addCleanup(unit_of_work.__exit__, None, None, None)
+        else:
+            self.load_fixture()
 
     def tearDown(self):
-        self.neo4j_instance.purge_db()
+        if not self.transactional:
+            self.neo4j_instance.purge_db()
 
+
+
+def handle_ids(as_types):
+    """
+    :param as_types: Result of get_dependent_as_types or get_dependencies_as_types
+    :return: The sorted handle ids of the nodes per key
+    :rtype: dict
+    """
+    return {key: sorted(node['handle_id'] for node in nodes) for key, nodes in as_types.items()}
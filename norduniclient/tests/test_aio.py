@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import threading
+import unittest
+
+from norduniclient.testing import Neo4jTestCase
+from norduniclient import core
+from norduniclient import models
+
+try:
+    import asyncio
+    from norduniclient import aio
+except (ImportError, SyntaxError):  # Python 2
+    aio = None
+
+__author__ = 'lundberg'
+
+
+@unittest.skipIf(aio is None, 'asyncio is not available')
+class AsyncTests(Neo4jTestCase):
+
+    def setUp(self):
+        super(AsyncTests, self).setUp()
+        core.create_node(self.neo4jdb, name='Test Node 1', meta_type_label='Logical',
+                         type_label='Test_Node', handle_id='1')
+        core.create_node(self.neo4jdb, name='Test Node 2', meta_type_label='Logical',
+                         type_label='Test_Node', handle_id='2')
+        self.manager = aio.AsyncNeo4jDBSessionManager.from_manager(self.neo4jdb)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        super(AsyncTests, self).tearDown()
+
+    def test_get_node(self):
+        node = self.loop.run_until_complete(aio.get_node(self.manager, '1'))
+        self.assertEqual(node.get('name'), 'Test Node 1')
+
+    def test_concurrent_node_models(self):
+        node_models = self.loop.run_until_complete(asyncio.gather(aio.get_node_model(self.manager, '1'),
+                                                                  aio.get_node_model(self.manager, '2')))
+        self.assertEqual([model.handle_id for model in node_models], ['1', '2'])
+        self.assertIsInstance(node_models[0], models.LogicalModel)
+        dependencies = self.loop.run_until_complete(self.manager.run(node_models[0].get_dependencies))
+        self.assertEqual(dependencies, {})
+
+    def test_get_nodes_by_type(self):
+        iterator = aio.get_nodes_by_type(self.manager, 'Test_Node')
+        iterator.batch_size = 1
+        handle_ids = []
+        while True:
+            try:
+                handle_ids.append(self.loop.run_until_complete(iterator.__anext__())['handle_id'])
+            except StopAsyncIteration:
+                break
+        self.assertEqual(sorted(handle_ids), ['1', '2'])
+
+    def consume(self, iterator):
+        items = []
+        while True:
+            try:
+                items.append(self.loop.run_until_complete(iterator.__anext__()))
+            except StopAsyncIteration:
+                return items
+
+    def test_iterator_thread(self):
+        threads = []
+
+        def generator():
+            for handle_id in ['1', '2', '3']:
+                threads.append(threading.current_thread())
+                yield handle_id
+
+        iterator = self.manager.iterate(generator)
+        iterator.batch_size = 1
+        self.assertEqual(self.consume(iterator), ['1', '2', '3'])
+        self.assertEqual(len(set(threads)), 1)
+
+    def test_iterator_aclose(self):
+        closed = []
+
+        def generator():
+            try:
+                for handle_id in ['1', '2', '3']:
+                    yield handle_id
+            finally:
+                closed.append(threading.current_thread())
+
+        iterator = self.manager.iterate(generator)
+        iterator.batch_size = 1
+        self.assertEqual(self.loop.run_until_complete(iterator.__anext__()), '1')
+        self.loop.run_until_complete(iterator.aclose())
+        self.assertEqual(self.consume(iterator), [])
+        self.assertEqual(len(closed), 1)
+        self.assertIsNot(closed[0], threading.current_thread())
+
+    def test_async_node_model(self):
+        core.create_relationship(self.neo4jdb, '1', '2', 'Depends_on')
+        node = self.loop.run_until_complete(aio.get_async_node_model(self.manager, '1'))
+        self.assertEqual(node.handle_id, '1')
+        self.assertIsInstance(node.model, models.LogicalModel)
+        dependencies = self.loop.run_until_complete(node.get_dependencies())
+        self.assertEqual([item['node'].handle_id for item in dependencies['Depends_on']], ['2'])
+        self.assertEqual(list(self.loop.run_until_complete(node.outgoing())), ['Depends_on'])
+
+        node_models = self.loop.run_until_complete(aio.get_async_node_models(self.manager, ['2', '3']))
+        self.assertIsInstance(node_models['2'], aio.AsyncNodeModel)
+        self.assertIsNone(node_models['3'])
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import unittest
+
+from norduniclient.testing import Neo4jTestCase, NEO4J_BACKEND
+from norduniclient import audit
+
+__author__ = 'lundberg'
+
+
+class AuditTests(Neo4jTestCase):
+
+    def setUp(self):
+        super(AuditTests, self).setUp()
+        self.handle_ids = audit.seed(self.neo4jdb)
+
+    def test_var_length_bounds(self):
+        self.assertEqual(audit.var_length_bounds('(a)-[:Has*]->(b)'), [1, None])
+        self.assertEqual(audit.var_length_bounds('(a)-[:Has*2]->(b)'), [2, 2])
+        self.assertEqual(audit.var_length_bounds('(a)-[:Has*1..]->(b)'), [1, None])
+        self.assertEqual(audit.var_length_bounds('(a)-[:Has*..5]->(b)'), [1, 5])
+
+    def test_collect_queries(self):
+        events = audit.collect_queries(self.neo4jdb, ['audit-router'])
+        functions = set(event.function for event in events)
+        self.assertIn('norduniclient.core.get_node_bundle', functions)
+        self.assertIn('norduniclient.models.RouterModel.get_ports', functions)
+        self.assertIn('norduniclient.models.RouterModel.get_child_form_data', functions)
+        self.assertIn('norduniclient.models.RouterModel.get_port', functions)
+        self.assertIsNone(self.neo4jdb.instrumentation)
+
+    @unittest.skipIf(NEO4J_BACKEND == 'memory', 'EXPLAIN and PROFILE need a Neo4j server')
+    def test_audit(self):
+        reports = audit.audit(self.neo4jdb, self.handle_ids)
+        self.assertTrue(reports)
+        reports = {report['key']: report for report in reports}
+        bundle = [report for key, report in reports.items() if key == 'norduniclient.core.get_node_bundle']
+        self.assertEqual(bundle[0]['start_operators'], ['NodeUniqueIndexSeek'])
+        self.assertEqual(bundle[0]['scans'], [])
+        self.assertIsNotNone(bundle[0]['db_hits'])
+        self.assertEqual(audit.find_regressions(list(reports.values()), list(reports.values())), [])
+
+    def test_find_regressions(self):
+        old = {'key': 'f q', 'start_operators': ['NodeUniqueIndexSeek'], 'scans': [], 'unbounded': False,
+               'db_hits': 10}
+        new = {'key': 'f q', 'start_operators': ['NodeByLabelScan'], 'scans': ['NodeByLabelScan'],
+               'unbounded': True, 'db_hits': 100}
+        regressions = audit.find_regressions([new], [old])
+        self.assertEqual(len(regressions), 3)
+        self.assertEqual(audit.find_regressions([old], [old]), [])
+        self.assertEqual(audit.find_regressions([new], []), [('f q', 'is new, it is not in the baseline')])
+        self.assertEqual(audit.find_regressions([], [old]), [('f q', 'is missing, it is in the baseline')])
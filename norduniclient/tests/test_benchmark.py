@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from norduniclient.testing import Neo4jTestCase
+from norduniclient import benchmark
+from norduniclient import core
+
+__author__ = 'lundberg'
+
+
+class BenchmarkTests(Neo4jTestCase):
+
+    def test_generate_topology(self):
+        topology = benchmark.generate_topology(scale=2, seed=1)
+        self.assertEqual(topology, benchmark.generate_topology(scale=2, seed=1))
+        self.assertGreater(len(benchmark.generate_topology(scale=4, seed=1).nodes), len(topology.nodes))
+        meta_types = {node['handle_id']: node['meta_type_label'] for node in topology.nodes}
+        self.assertEqual(len(meta_types), len(topology.nodes))
+        for handle_id, other_handle_id, rel_type in topology.relationships:
+            self.assertIn(rel_type, core.RELATIONSHIP_RULES[meta_types[handle_id]][meta_types[other_handle_id]])
+
+    def test_build_and_delete_topology(self):
+        topology = benchmark.generate_topology(scale=1)
+        benchmark.build_topology(self.neo4jdb, topology)
+        self.assertEqual(len(list(core.get_nodes_by_type(self.neo4jdb, 'Node'))), len(topology.nodes))
+        benchmark.delete_topology(self.neo4jdb)
+        self.assertEqual(list(core.get_nodes_by_type(self.neo4jdb, 'Node')), [])
+
+    def test_run(self):
+        results = benchmark.run(self.neo4jdb, scales=(1,), repeat=1, label='test')
+        self.assertEqual(results['label'], 'test')
+        names = set(r['name'] for r in results['results'])
+        self.assertIn('build_topology', names)
+        self.assertIn('core.get_node_bundle', names)
+        self.assertIn('Router.get_connections', names)
+        self.assertFalse([r for r in results['results'] if 'error' in r])
+        self.assertEqual(benchmark.compare(results, results), [])
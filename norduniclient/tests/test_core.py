@@ -2,15 +2,23 @@
 
 from __future__ import absolute_import
 
+import unittest
+from functools import partial
+
 try:
     from neo4j.exceptions import ConstraintError
 except ImportError:
     from neo4j.v1.api import CypherError as ConstraintError  # Backwards compatability with version <1.2
 
-from norduniclient.testing import Neo4jTestCase
+from norduniclient.testing import Neo4jTestCase, NEO4J_BACKEND, cypher_only
 from norduniclient import core
 from norduniclient import exceptions
 from norduniclient import models
+from norduniclient import queries
+from norduniclient import schema
+from norduniclient.cache import NodeCache
+from norduniclient.contextmanager import Neo4jDBSessionManager
+from norduniclient.instrumentation import QueryMetrics
 
 __author__ = 'lundberg'
 
@@ -38,6 +46,24 @@ class CoreTests(Neo4jTestCase):
         self.assertRaises(exceptions.MetaLabelNamingError, core.create_node, self.neo4jdb, name='Test Node 1',
                           meta_type_label='No_Such_Label', type_label='Test_Node', handle_id='1')
 
+    def test_create_nodes(self):
+        specs = [
+            {'name': 'Test Node 3', 'meta_type_label': 'Logical', 'type_label': 'Test_Node', 'handle_id': '3'},
+            {'name': 'Test Node 4', 'meta_type_label': 'Physical', 'type_label': 'Test_Node', 'handle_id': '4'},
+            {'name': 'Test Node 5', 'meta_type_label': 'Logical', 'type_label': 'Test_Node', 'handle_id': '5'},
+        ]
+        nodes = core.create_nodes(self.neo4jdb, specs, chunk_size=2)
+        self.assertEqual(sorted([node['handle_id'] for node in nodes]), ['3', '4', '5'])
+        self.assertEqual(core.get_node_meta_type(self.neo4jdb, '4'), 'Physical')
+        self.assertEqual(core.get_node(self.neo4jdb, '5').get('name'), 'Test Node 5')
+
+    def test_create_nodes_bad_meta_type(self):
+        specs = [
+            {'name': 'Test Node 3', 'meta_type_label': 'No_Such_Label', 'type_label': 'Test_Node', 'handle_id': '3'},
+        ]
+        self.assertRaises(exceptions.MetaLabelNamingError, core.create_nodes, self.neo4jdb, specs)
+        self.assertRaises(exceptions.NodeNotFound, core.get_node, self.neo4jdb, handle_id='3')
+
     def test_get_node_bundle(self):
         node_bundle = core.get_node_bundle(self.neo4jdb, handle_id='1')
         self.assertIsInstance(node_bundle, dict)
@@ -260,6 +286,45 @@ class CoreTests(Neo4jTestCase):
         self.assertRaises(exceptions.NoRelationshipPossible, core.create_relationship, self.neo4jdb,
                           handle_id='3', other_handle_id='4', rel_type='Has')
 
+    @cypher_only
+    def test_failing_create_relationship_details(self):
+        core.create_node(self.neo4jdb, name='Location Node 1', meta_type_label='Location',
+                         type_label='Test_Node', handle_id='3')
+        try:
+            core.create_relationship(self.neo4jdb, handle_id='3', other_handle_id='1', rel_type='Has')
+        except exceptions.NoRelationshipPossible as e:
+            self.assertEqual(e.meta_type1, 'Location')
+            self.assertEqual(e.meta_type2, 'Logical')
+            self.assertEqual(e.relationship_type, 'Has')
+        else:
+            self.fail('NoRelationshipPossible not raised')
+        self.assertEqual(core.get_relationships(self.neo4jdb, handle_id1='3', handle_id2='1'), [])
+
+    @cypher_only
+    def test_create_relationships(self):
+        core.create_node(self.neo4jdb, name='Physical Node 1', meta_type_label='Physical',
+                         type_label='Test_Node', handle_id='3')
+        core.create_node(self.neo4jdb, name='Location Node 1', meta_type_label='Location',
+                         type_label='Test_Node', handle_id='4')
+        results = core.create_relationships(self.neo4jdb, [
+            ('1', '2', 'Depends_on'),
+            ('1', '3', 'Part_of'),
+            ('3', '4', 'Located_in'),
+            ('4', '3', 'Has'),
+            ('1', '5', 'Depends_on'),
+        ], chunk_size=2)
+        self.assertEqual(len(results), 5)
+        for relationship_id in results[:3]:
+            self.assertIsInstance(relationship_id, int)
+        self.assertEqual(core.get_relationship_bundle(self.neo4jdb, results[2])['type'], 'Located_in')
+        self.assertIsInstance(results[3], exceptions.NoRelationshipPossible)
+        self.assertEqual(results[3].meta_type1, 'Location')
+        self.assertIsInstance(results[4], exceptions.NodeNotFound)
+
+    def test_create_relationship_missing_node(self):
+        self.assertRaises(exceptions.NodeNotFound, core.create_relationship, self.neo4jdb,
+                          handle_id='1', other_handle_id='3', rel_type='Depends_on')
+
     def test_get_relationships(self):
         relationship_id = core.create_relationship(self.neo4jdb, handle_id='1', other_handle_id='2',
                                                    rel_type='Depends_on')
@@ -364,6 +429,48 @@ class CoreTests(Neo4jTestCase):
         node = all_results[0]
         self.assertEqual(node.get('test'), 'hello world')
 
+    def test_search_nodes_by_value_with_quote(self):
+        new_properties = {'test': 'say "hello"'}
+        core.set_node_properties(self.neo4jdb, handle_id='1', new_properties=new_properties)
+
+        all_results = list(core.search_nodes_by_value(self.neo4jdb, value='"hello"', prop='test'))
+        self.assertEqual(len(all_results), 1)
+
+    def test_search_nodes_by_value_regex(self):
+        core.set_node_properties(self.neo4jdb, handle_id='1', new_properties={'test': 'ge-0/0/1.100 (backup)'})
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='ge-0/./1\\.1', prop='test'))
+        self.assertEqual([node['handle_id'] for node in result], ['1'])
+        self.assertEqual(len(list(core.search_nodes_by_value(self.neo4jdb, value='1.1.0'))), 1)
+        self.assertEqual(list(core.search_nodes_by_value(self.neo4jdb, value='^backup', prop='test')), [])
+
+    def test_search_nodes_by_value_literal(self):
+        core.set_node_properties(self.neo4jdb, handle_id='1', new_properties={'test': 'ge-0/0/1.100 (backup)'})
+        self.assertEqual(len(list(core.search_nodes_by_value(self.neo4jdb, value='1.100 (b', literal=True))), 1)
+        self.assertEqual(list(core.search_nodes_by_value(self.neo4jdb, value='1.1.0', literal=True)), [])
+        self.assertEqual(list(core.search_nodes_by_value(self.neo4jdb, value='.*', prop='test', literal=True)), [])
+
+    def test_search_nodes_by_value_template(self):
+        events = []
+        self.neo4jdb.instrumentation = QueryMetrics(callback=events.append)
+        try:
+            list(core.search_nodes_by_value(self.neo4jdb, value='world'))
+            list(core.search_nodes_by_value(self.neo4jdb, value='world', prop='test'))
+        finally:
+            self.neo4jdb.instrumentation = None
+        self.assertEqual([event.query_id for event in events], ['search_nodes', 'search_nodes_by_property'])
+
+    def test_search_nodes_by_value_materialized_dependents(self):
+        self.neo4jdb.materialize_dependents = True
+        try:
+            core.create_relationship(self.neo4jdb, '1', '2', 'Depends_on')
+            # Node 2 keeps ['1'] as its materialized dependents, which is not searched
+            result = list(core.search_nodes_by_value(self.neo4jdb, value='1'))
+            self.assertEqual([node['handle_id'] for node in result], ['1'])
+            result = list(core.search_nodes_by_value(self.neo4jdb, value='1', page_size=1))
+            self.assertEqual([node['handle_id'] for node in result], ['1'])
+        finally:
+            self.neo4jdb.materialize_dependents = False
+
     def test_search_nodes_by_value_and_property(self):
         new_properties = {'test': 'hello world'}
         core.set_node_properties(self.neo4jdb, handle_id='1', new_properties=new_properties)
@@ -401,6 +508,23 @@ class CoreTests(Neo4jTestCase):
         for node in result:
             self.assertIn('Test_Node', node.labels)
 
+    @cypher_only
+    def test_get_nodes_by_type_paginated(self):
+        core.create_node(self.neo4jdb, name='Test Node 3', meta_type_label='Logical',
+                         type_label='Test_Node', handle_id='3')
+        result = core.get_nodes_by_type(self.neo4jdb, 'Test_Node', page_size=2)
+        self.assertEqual([node['handle_id'] for node in result], ['1', '2', '3'])
+
+        token = core.create_resume_token({'handle_id': '1'})
+        result = core.get_nodes_by_type(self.neo4jdb, 'Test_Node', page_size=1, resume_token=token)
+        self.assertEqual([node['handle_id'] for node in result], ['2', '3'])
+
+    def test_get_nodes_by_value_paginated(self):
+        core.create_node(self.neo4jdb, name='Test Node 1', meta_type_label='Logical',
+                         type_label='Test_Node', handle_id='3')
+        result = core.get_nodes_by_value(self.neo4jdb, 'Test Node 1', 'name', 'Test_Node', page_size=1)
+        self.assertEqual([node['handle_id'] for node in result], ['1', '3'])
+
     def test_get_nodes_by_name(self):
         result = core.get_nodes_by_name(self.neo4jdb, 'Test Node 1')
 
@@ -409,6 +533,199 @@ class CoreTests(Neo4jTestCase):
         node = all_results[0]
         self.assertEqual(node['name'], 'Test Node 1')
 
+    def test_get_nodes(self):
+        nodes = core.get_nodes(self.neo4jdb, ['1', '2', '3'])
+        self.assertEqual(set(nodes.keys()), {'1', '2', '3'})
+        self.assertEqual(nodes['1'].get('name'), 'Test Node 1')
+        self.assertEqual(nodes['2'].get('name'), 'Test Node 2')
+        self.assertIsNone(nodes['3'])
+
+    def test_get_node_models(self):
+        node_models = core.get_node_models(self.neo4jdb, ['1', '3'])
+        self.assertIsInstance(node_models['1'], models.LogicalModel)
+        self.assertEqual(node_models['1'].handle_id, '1')
+        self.assertIsNone(node_models['3'])
+
+    def test_identity_map(self):
+        with self.neo4jdb.identity_map:
+            node = core.get_node(self.neo4jdb, '1')
+            self.assertEqual(node.get('name'), 'Test Node 1')
+            with self.neo4jdb.session as s:
+                s.run(queries.render('set_node_properties'), {'props': dict(node, name='Changed outside')})
+            # Served from the identity map
+            self.assertEqual(core.get_node(self.neo4jdb, '1').get('name'), 'Test Node 1')
+            core.set_node_properties(self.neo4jdb, '1', {'name': 'Changed'})
+            self.assertEqual(core.get_node_model(self.neo4jdb, '1').data.get('name'), 'Changed')
+            core.delete_node(self.neo4jdb, '1')
+            self.assertRaises(exceptions.NodeNotFound, core.get_node, self.neo4jdb, handle_id='1')
+        self.assertIsNone(self.neo4jdb.node_cache)
+
+    def test_node_cache(self):
+        self.neo4jdb.node_cache = NodeCache(max_size=1)
+        try:
+            core.get_node(self.neo4jdb, '1')
+            core.get_node(self.neo4jdb, '2')
+            self.assertNotIn('1', self.neo4jdb.node_cache)
+            self.assertIn('2', self.neo4jdb.node_cache)
+            core.set_node_properties(self.neo4jdb, '2', {'name': 'Changed'})
+            self.assertNotIn('2', self.neo4jdb.node_cache)
+        finally:
+            self.neo4jdb.node_cache = None
+
+    def test_unit_of_work_node_cache(self):
+        self.neo4jdb.node_cache = NodeCache()
+        try:
+            with self.neo4jdb.unit_of_work(rollback=True):
+                core.set_node_properties(self.neo4jdb, '1', {'name': 'Changed'})
+                self.assertEqual(core.get_node(self.neo4jdb, '1').get('name'), 'Changed')
+                # Other threads do not see the uncommitted change through the shared cache
+                node = self.neo4jdb.gather(partial(core.get_node, self.neo4jdb, '1'))[0]
+                self.assertEqual(node.get('name'), 'Test Node 1')
+            self.assertEqual(core.get_node(self.neo4jdb, '1').get('name'), 'Test Node 1')
+        finally:
+            self.neo4jdb.node_cache = None
+
+    def test_unit_of_work(self):
+        with self.neo4jdb.unit_of_work():
+            core.set_node_properties(self.neo4jdb, '1', {'name': 'Changed'})
+            core.create_node(self.neo4jdb, name='Test Node 3', meta_type_label='Logical',
+                             type_label='Test_Node', handle_id='3')
+            # Read your own writes
+            self.assertEqual(core.get_node(self.neo4jdb, '1').get('name'), 'Changed')
+            self.assertEqual(core.get_node(self.neo4jdb, '3').get('name'), 'Test Node 3')
+        self.assertEqual(core.get_node(self.neo4jdb, '1').get('name'), 'Changed')
+        self.assertEqual(core.get_node(self.neo4jdb, '3').get('name'), 'Test Node 3')
+
+    def test_failing_unit_of_work(self):
+        try:
+            with self.neo4jdb.unit_of_work():
+                core.set_node_properties(self.neo4jdb, '1', {'name': 'Changed'})
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(core.get_node(self.neo4jdb, '1').get('name'), 'Test Node 1')
+
+    def test_rollback_unit_of_work(self):
+        with self.neo4jdb.unit_of_work(rollback=True):
+            core.set_node_properties(self.neo4jdb, '1', {'name': 'Changed'})
+            self.assertEqual(core.get_node(self.neo4jdb, '1').get('name'), 'Changed')
+        self.assertEqual(core.get_node(self.neo4jdb, '1').get('name'), 'Test Node 1')
+
+    @unittest.skipIf(NEO4J_BACKEND == 'memory', 'Needs a bolt uri')
+    def test_read_uri(self):
+        uri = 'bolt://{!s}:{!s}'.format(self.neo4j_instance.host, self.neo4j_instance.bolt_port)
+        manager = Neo4jDBSessionManager(uri, username='neo4j', password='testing', encrypted=False, read_uri=uri)
+        self.assertIsNot(manager.read_driver, manager.driver)
+        core.set_node_properties(manager, '1', {'name': 'Changed'})
+        self.assertEqual(core.get_node(manager, '1').get('name'), 'Changed')
+        with manager.read_session as s:
+            self.assertEqual(s.run(queries.render('get_node'), {'handle_id': '1'}).single()['n']['name'], 'Changed')
+
+    def test_last_bookmark(self):
+        class ClosedSession(object):
+            def __init__(self, bookmark):
+                self.bookmark = bookmark
+
+            def last_bookmark(self):
+                return self.bookmark
+
+        previous = self.neo4jdb.last_bookmark
+        try:
+            self.neo4jdb.last_bookmark = None
+            self.neo4jdb._advance_bookmark(ClosedSession('neo4j:bookmark:v1:tx10'))
+            self.neo4jdb._advance_bookmark(ClosedSession('neo4j:bookmark:v1:tx9'))
+            self.neo4jdb._advance_bookmark(ClosedSession(None))
+            self.assertEqual(self.neo4jdb.last_bookmark, 'neo4j:bookmark:v1:tx10')
+            self.neo4jdb._advance_bookmark(ClosedSession('neo4j:bookmark:v1:tx11'))
+            self.assertEqual(self.neo4jdb.last_bookmark, 'neo4j:bookmark:v1:tx11')
+        finally:
+            self.neo4jdb.last_bookmark = previous
+
+    def test_ensure_schema(self):
+        live = schema.get_live_schema(self.neo4jdb)
+        for item in schema.SCHEMA:
+            self.assertIn(item, live)
+        self.assertEqual(schema.ensure_schema(self.neo4jdb), [])
+        self.assertEqual(schema.ensure_schema(self.neo4jdb, force=True), [])
+
+        test_index = schema.Index('Test_Node', 'name')
+        self.assertEqual(schema.ensure_schema(self.neo4jdb, schema=[test_index]), [test_index])
+        self.assertIn(test_index, schema.get_live_schema(self.neo4jdb))
+        self.assertEqual(schema.ensure_schema(self.neo4jdb, schema=[test_index], force=True), [])
+
+    def test_get_indexed_node_normalized(self):
+        self.neo4jdb.normalized_properties = ('name',)
+        try:
+            core.create_node(self.neo4jdb, name='Indexed Node', meta_type_label='Logical',
+                             type_label='Test_Node', handle_id='3')
+            node = core.get_node(self.neo4jdb, '3')
+            self.assertNotIn('_name_lc', node)
+            with self.neo4jdb.session as s:
+                stored = s.run(queries.render('get_node'), {'handle_id': '3'}).single()['n']
+            self.assertEqual(stored.get('_name_lc'), 'indexed node')
+
+            self.assertEqual(core.backfill_normalized_properties(self.neo4jdb), 2)
+            self.assertEqual(core.backfill_normalized_properties(self.neo4jdb), 0)
+
+            result = list(core.get_indexed_node(self.neo4jdb, 'name', 'TEST NODE', lookup_func='STARTS WITH'))
+            self.assertEqual(sorted(node['handle_id'] for node in result), ['1', '2'])
+
+            new_properties = {'name': 'Renamed Node'}
+            core.set_node_properties(self.neo4jdb, '3', new_properties)
+            self.assertEqual(new_properties, {'name': 'Renamed Node'})
+            result = list(core.get_indexed_node(self.neo4jdb, 'name', 'renamed'))
+            self.assertEqual([node['handle_id'] for node in result], ['3'])
+            result = list(core.get_indexed_node(self.neo4jdb, 'name', 'NODE', lookup_func='ENDS WITH'))
+            self.assertEqual(len(result), 1)
+        finally:
+            self.neo4jdb.normalized_properties = ()
+
+    @cypher_only
+    def test_normalized_properties_not_strings(self):
+        core.set_node_properties(self.neo4jdb, '1', {'name': 'Test Node 1', 'number': 5, '_note_lc': 'kept'})
+        self.neo4jdb.normalized_properties = ('name', 'number')
+        try:
+            self.assertEqual(core.backfill_normalized_properties(self.neo4jdb), 2)
+            node = core.get_node(self.neo4jdb, '1')
+            self.assertEqual(node.get('number'), 5)
+            self.assertEqual(node.get('_note_lc'), 'kept')
+            self.assertNotIn('_name_lc', node)
+        finally:
+            self.neo4jdb.normalized_properties = ()
+
+    @cypher_only
+    def test_refresh_dependents(self):
+        core.create_node(self.neo4jdb, name='Test Node 3', meta_type_label='Logical', type_label='Test_Node',
+                         handle_id='3')
+        core.create_relationship(self.neo4jdb, '1', '2', 'Depends_on')
+        self.assertEqual(core.rebuild_dependents(self.neo4jdb, chunk_size=2), 3)
+        self.assertNotIn('_dependents', core.get_node(self.neo4jdb, '2'))
+
+        def dependents():
+            with self.neo4jdb.session as s:
+                node = s.run(queries.render('get_node'), {'handle_id': '2'}).single()['n']
+            return sorted(node.get('_dependents'))
+        self.assertEqual(dependents(), ['1'])
+
+        self.neo4jdb.materialize_dependents = True
+        try:
+            core.create_relationship(self.neo4jdb, '3', '1', 'Depends_on')
+            self.assertEqual(dependents(), ['1', '3'])
+            core.set_node_properties(self.neo4jdb, '2', {'name': 'Changed'})
+            self.assertEqual(dependents(), ['1', '3'])
+            core.delete_node(self.neo4jdb, '1')
+            self.assertEqual(dependents(), [])
+        finally:
+            self.neo4jdb.materialize_dependents = False
+
+    def test_star_import(self):
+        namespace = {}
+        exec('from norduniclient import *', namespace)
+        self.assertIn('get_node', namespace)
+        self.assertIn('graphdb', namespace)
+        for name in ['memory', 'queries', 'schema', 'helpers', 're', 'json', 'base64', 'logging']:
+            self.assertNotIn(name, namespace)
+
     def test_get_unique_node_by_name(self):
         node_model = core.get_unique_node_by_name(self.neo4jdb, node_name='Test Node 1', node_type='Test_Node')
         self.assertIsInstance(node_model, models.LogicalModel)
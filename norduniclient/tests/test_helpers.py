@@ -31,4 +31,31 @@ class HelpersTests(unittest.TestCase):
         }
         self.assertEqual(new_props, expected_props)
 
+    def test_update_item_properties_normalized(self):
+        initial_props = {
+            'name': 'Hello World',
+            '_name_lc': 'hello world',
+            'description': 'Old',
+            '_description_lc': 'old'
+        }
+        update_props = {
+            'name': 'Hola El Mundo',
+            'description': ''
+        }
+        new_props = helpers.update_item_properties(initial_props, update_props,
+                                                   normalized_properties=['name', 'description'])
+        expected_props = {
+            'name': 'Hola El Mundo',
+            '_name_lc': 'hola el mundo'
+        }
+        self.assertEqual(new_props, expected_props)
+
+    def test_required_arguments(self):
+        class Model(object):
+            def get_all(self):
+                pass
 
+            def get_child(self, node_type, limit=10, *args, **kwargs):
+                pass
+        self.assertEqual(helpers.required_arguments(Model().get_all), [])
+        self.assertEqual(helpers.required_arguments(Model().get_child), ['node_type'])
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from norduniclient.testing import Neo4jTestCase, handle_ids
+from norduniclient import benchmark
+from norduniclient import core
+from norduniclient import impact
+
+__author__ = 'lundberg'
+
+
+class DependencyGraphTests(Neo4jTestCase):
+
+    transactional = True
+
+    @classmethod
+    def load_fixture(cls):
+        cls.topology = benchmark.generate_topology(scale=1)
+        benchmark.build_topology(cls.neo4jdb, cls.topology)
+
+    def setUp(self):
+        super(DependencyGraphTests, self).setUp()
+        self.graph = impact.DependencyGraph(self.neo4jdb)
+        self.graph.build()
+
+    def tearDown(self):
+        self.graph.close()
+        super(DependencyGraphTests, self).tearDown()
+
+    def answers(self, node_models):
+        return {model.handle_id: (handle_ids(model.get_dependent_as_types()),
+                                  handle_ids(model.get_dependencies_as_types())) for model in node_models}
+
+    def test_same_answers_as_cypher(self):
+        node_models = [core.get_node_model(self.neo4jdb, node['handle_id']) for node in self.topology.nodes]
+        from_graph = self.answers(node_models)
+        self.graph.close()
+        self.assertIsNone(self.neo4jdb.dependency_graph)
+        self.assertEqual(from_graph, self.answers(node_models))
+
+    def test_refresh(self):
+        core.create_node(self.neo4jdb, name='Service', meta_type_label='Logical', type_label='Service',
+                         handle_id='impact-service')
+        port = next(node['handle_id'] for node in self.topology.nodes if node['type_label'] == 'Port')
+        relationship_id = core.create_relationship(self.neo4jdb, 'impact-service', port, 'Depends_on')
+        dependents = core.get_node_model(self.neo4jdb, port).get_dependent_as_types()
+        self.assertIn('impact-service', handle_ids(dependents)['services'])
+
+        core.delete_relationship(self.neo4jdb, relationship_id)
+        dependents = core.get_node_model(self.neo4jdb, port).get_dependent_as_types()
+        self.assertNotIn('impact-service', handle_ids(dependents).get('services', []))
+
+        core.create_relationship(self.neo4jdb, 'impact-service', port, 'Depends_on')
+        core.delete_node(self.neo4jdb, 'impact-service')
+        dependents = core.get_node_model(self.neo4jdb, port).get_dependent_as_types()
+        self.assertNotIn('impact-service', handle_ids(dependents).get('services', []))
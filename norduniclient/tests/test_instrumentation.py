@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from norduniclient.testing import Neo4jTestCase
+from norduniclient import core
+from norduniclient.instrumentation import QueryMetrics, _percentile
+
+__author__ = 'lundberg'
+
+
+class InstrumentationTests(Neo4jTestCase):
+
+    def setUp(self):
+        super(InstrumentationTests, self).setUp()
+        core.create_node(self.neo4jdb, name='Test Node 1', meta_type_label='Logical',
+                         type_label='Test_Node', handle_id='1')
+        core.create_node(self.neo4jdb, name='Test Node 2', meta_type_label='Logical',
+                         type_label='Test_Node', handle_id='2')
+        self.events = []
+        self.metrics = QueryMetrics(key=('function', 'query_id'), callback=self.events.append)
+        self.neo4jdb.instrumentation = self.metrics
+
+    def tearDown(self):
+        self.neo4jdb.instrumentation = None
+        super(InstrumentationTests, self).tearDown()
+
+    def test_core_function(self):
+        list(core.get_nodes_by_type(self.neo4jdb, 'Test_Node'))
+        self.assertEqual(len(self.events), 1)
+        event = self.events[0]
+        self.assertEqual(event.function, 'norduniclient.core.get_nodes_by_type')
+        self.assertEqual(event.records, 2)
+        self.assertIsNotNone(event.first_record_time)
+        self.assertGreaterEqual(event.wall_time, event.first_record_time)
+        self.assertIsNone(event.error)
+
+    def test_template_id(self):
+        core.create_relationship(self.neo4jdb, '1', '2', 'Depends_on')
+        self.assertEqual(self.events[-1].query_id, 'create_validated_relationship')
+
+    def test_model_method(self):
+        node = core.get_node_model(self.neo4jdb, '1')
+        node.get_dependencies()
+        self.assertEqual(self.events[-1].function, 'norduniclient.models.LogicalModel.get_dependencies')
+
+    def test_error(self):
+        with self.assertRaises(Exception):
+            core.query_to_dict(self.neo4jdb, 'NOT CYPHER')
+        self.assertEqual(self.events[-1].function, __name__ + '.InstrumentationTests.test_error')
+        self.assertIsNotNone(self.events[-1].error)
+
+    def test_summary(self):
+        for i in range(10):
+            core.get_node_bundle(self.neo4jdb, '1')
+        key = [key for key in self.metrics.summary() if key.startswith('norduniclient.core.get_node_bundle')][0]
+        summary = self.metrics.summary()[key]
+        self.assertEqual(summary['count'], 10)
+        self.assertEqual(summary['records'], 10)
+        self.assertLessEqual(summary['p50'], summary['p95'])
+        self.assertLessEqual(summary['p95'], summary['p99'])
+        self.assertIn(key, self.metrics.export())
+
+    def test_percentile(self):
+        samples = [1, 2, 3, 4]
+        self.assertEqual(_percentile(samples, 50), 2)
+        self.assertEqual(_percentile(samples, 75), 3)
+        self.assertEqual(_percentile(samples, 99), 4)
+        self.assertEqual(_percentile(samples, 0), 1)
+        self.assertIsNone(_percentile([], 50))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import unittest
+from neo4j.exceptions import ConstraintError, TransientError
+from norduniclient import core
+from norduniclient import exceptions
+from norduniclient import memory
+from norduniclient import queries
+
+__author__ = 'lundberg'
+
+
+class MemoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = core.init_db('memory://test-memory')
+        core.create_node(self.manager, name='Router 1', meta_type_label='Physical', type_label='Router',
+                         handle_id='1')
+        core.create_node(self.manager, name='Port 1', meta_type_label='Physical', type_label='Port', handle_id='2')
+        core.create_node(self.manager, name='Host 1', meta_type_label='Logical', type_label='Host', handle_id='3')
+
+    def tearDown(self):
+        self.manager.driver.graph.clear()
+
+    def test_shared_graph(self):
+        manager = core.init_db('memory://test-memory')
+        self.assertEqual(core.get_node(manager, '1').get('name'), 'Router 1')
+        manager = core.init_db('memory://other')
+        self.assertRaises(exceptions.NodeNotFound, core.get_node, manager, '1')
+
+    def test_unique_handle_id(self):
+        self.assertRaises(ConstraintError, core.create_node, self.manager, name='Router 2',
+                          meta_type_label='Physical', type_label='Router', handle_id='1')
+
+    def test_nodes(self):
+        core.set_node_properties(self.manager, '1', {'name': 'Changed', 'description': None})
+        self.assertEqual(core.get_node(self.manager, '1'), {'name': 'Changed', 'handle_id': '1'})
+        self.assertEqual(core.get_node_meta_type(self.manager, '3'), 'Logical')
+        self.assertEqual([n['handle_id'] for n in core.get_nodes_by_value(self.manager, 'Port 1', 'name')], ['2'])
+        self.assertEqual(sorted(n['handle_id'] for n in core.search_nodes_by_value(self.manager, ' 1')), ['2', '3'])
+        self.assertEqual([n['handle_id'] for n in core.get_nodes_by_type(self.manager, 'Host')], ['3'])
+        core.delete_node(self.manager, '1')
+        self.assertRaises(exceptions.NodeNotFound, core.get_node, self.manager, '1')
+
+    def test_relationships(self):
+        relationship_id = core.create_relationship(self.manager, '1', '2', 'Has')
+        bundle = core.get_relationship_bundle(self.manager, relationship_id)
+        self.assertEqual((bundle['type'], bundle['start']['handle_id'], bundle['end']['handle_id']),
+                         ('Has', '1', '2'))
+        self.assertEqual(len(core.get_relationships(self.manager, '2', '1', 'Has')), 1)
+        self.assertRaises(exceptions.NoRelationshipPossible, core.create_relationship, self.manager, '3', '2',
+                          'Has')
+        core.delete_node(self.manager, '2')
+        self.assertRaises(exceptions.RelationshipNotFound, core.get_relationship, self.manager, relationship_id)
+
+    def test_unit_of_work_rollback(self):
+        with self.assertRaises(ValueError):
+            with self.manager.unit_of_work():
+                core.create_node(self.manager, name='Router 2', meta_type_label='Physical', type_label='Router',
+                                 handle_id='4')
+                self.assertEqual(core.get_node(self.manager, '4').get('name'), 'Router 2')
+                raise ValueError()
+        self.assertRaises(exceptions.NodeNotFound, core.get_node, self.manager, '4')
+
+    def test_concurrent_transactions(self):
+        with self.manager.driver.session() as s1, self.manager.driver.session() as s2:
+            t1, t2 = s1.begin_transaction(), s2.begin_transaction()
+            t1.run(queries.render('add_label', label='Testing'), {'handle_id': '1'})
+            t2.run(queries.render('create_relationship', rel_type='Has'), {'start': '1', 'end': '2'})
+            t2.run(queries.render('delete_node'), {'handle_id': '3'})
+            t1.commit()
+            t2.commit()
+        self.assertIn('Testing', core.get_node_model(self.manager, '1').labels)
+        self.assertEqual(len(core.get_relationships(self.manager, '1', '2', 'Has')), 1)
+        self.assertRaises(exceptions.NodeNotFound, core.get_node, self.manager, '3')
+
+    def test_conflicting_transactions(self):
+        with self.manager.driver.session() as s1, self.manager.driver.session() as s2:
+            t1, t2 = s1.begin_transaction(), s2.begin_transaction()
+            t1.run(queries.render('delete_node'), {'handle_id': '2'})
+            t2.run(queries.render('create_relationship', rel_type='Has'), {'start': '1', 'end': '2'})
+            t1.commit()
+            self.assertRaises(TransientError, t2.commit)
+        self.assertRaises(exceptions.NodeNotFound, core.get_node, self.manager, '2')
+
+    def test_unsupported_query(self):
+        self.assertRaises(memory.UnsupportedQuery, core.query_to_dict, self.manager, 'MATCH (n) RETURN n')
@@ -2,7 +2,10 @@
 
 from __future__ import absolute_import
 
-from norduniclient.testing import Neo4jTestCase
+import logging
+from functools import partial
+
+from norduniclient.testing import Neo4jTestCase, handle_ids
 from norduniclient import core
 from norduniclient import exceptions
 from norduniclient import models
@@ -12,8 +15,10 @@ __author__ = 'lundberg'
 
 class ModelsTests(Neo4jTestCase):
 
-    def setUp(self):
-        super(ModelsTests, self).setUp()
+    transactional = True
+
+    @classmethod
+    def load_fixture(cls):
         q1 = """
             // Create nodes
             CREATE (router1:Node:Physical:Router{name:'Router1', handle_id:'1'}),
@@ -145,11 +150,11 @@ class ModelsTests(Neo4jTestCase):
             """
 
         # Insert mocked network
-        with self.neo4jdb.session as s:
+        with cls.neo4jdb.session as s:
             s.run(q1)
 
         # Insert generic models
-        with self.neo4jdb.session as s:
+        with cls.neo4jdb.session as s:
             s.run(q2)
 
     def test_base_node_model(self):
@@ -171,6 +176,40 @@ class ModelsTests(Neo4jTestCase):
         self.assertIsInstance(node_model_1.outgoing, dict)
         self.assertIsInstance(node_model_1.relationships, dict)
 
+    def test_get_model_class(self):
+        self.assertIs(models.get_model_class('Physical', ['Router']), models.RouterModel)
+        self.assertIs(models.get_model_class('Physical', ['Host']), models.PhysicalHostModel)
+        self.assertIs(models.get_model_class('Logical', ['Peering_Group']), models.PeeringGroupModel)
+        self.assertIs(models.get_model_class('Physical', ['No_Such_Label']), models.PhysicalModel)
+        self.assertIs(models.get_model_class(None, ['No_Such_Label']), models.BaseNodeModel)
+
+    def test_get_model_class_new_subclass(self):
+        self.assertIs(models.get_model_class('Physical', ['Test_Registry']), models.PhysicalModel)
+
+        class TestRegistryModel(models.PhysicalModel):
+            pass
+
+        self.assertIs(models.get_model_class('Physical', ['Test_Registry']), TestRegistryModel)
+        del models.NodeModelRegistry.classes['TestRegistryModel']
+        models.NodeModelRegistry._resolved.clear()
+
+    def test_replaced_model_class(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        models.logger.addHandler(handler)
+        try:
+            class RouterModel(models.PhysicalModel):
+                pass
+            self.assertIs(models.get_model_class('Physical', ['Router']), RouterModel)
+        finally:
+            models.logger.removeHandler(handler)
+            models.NodeModelRegistry.classes['RouterModel'] = models.RouterModel
+            models.NodeModelRegistry._resolved.clear()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].levelno, logging.WARNING)
+        self.assertIs(models.get_model_class('Physical', ['Router']), models.RouterModel)
+
     def test_add_label(self):
         node_model_1 = core.get_node_model(self.neo4jdb, handle_id='101')
         initial_labels = node_model_1.labels
@@ -290,6 +329,20 @@ class ModelsTests(Neo4jTestCase):
         relations = location2.get_relations()
         self.assertIsInstance(relations['Responsible_for'][0]['node'], models.RelationModel)
 
+    def test_get_relations_lazy_neighbours(self):
+        physical1 = core.get_node_model(self.neo4jdb, handle_id='101')
+        physical1.lazy_neighbours = True
+        relations = physical1.get_relations()
+        node = relations['Owns'][0]['node']
+        self.assertIsInstance(node, models.LazyNodeModel)
+        self.assertIsInstance(relations['Owns'][0]['relationship'], dict)
+        self.assertIsNone(node._model)
+        self.assertIsNotNone(node.handle_id)
+        self.assertIsNotNone(node.data.get('name'))
+        self.assertIsNone(node._model)
+        self.assertEqual(node.meta_type, 'Relation')
+        self.assertIsInstance(node._model, models.RelationModel)
+
     def test_get_dependencies(self):
         logical3 = core.get_node_model(self.neo4jdb, handle_id='107')
         dependencies = logical3.get_dependencies()
@@ -297,6 +350,21 @@ class ModelsTests(Neo4jTestCase):
         self.assertEqual(dependencies['Depends_on'][0]['node'].handle_id, '103')
         self.assertIsInstance(dependencies['Depends_on'][0]['node'], models.LogicalModel)
 
+    def test_gather(self):
+        logical3 = core.get_node_model(self.neo4jdb, handle_id='107')
+        results = self.neo4jdb.gather(logical3.get_dependencies, logical3.get_relations,
+                                      partial(logical3.add_label, 'Bad Label'))
+        self.assertEqual(results[0]['Depends_on'][0]['node'].handle_id, '103')
+        self.assertIsInstance(results[1]['Uses'][0]['node'], models.RelationModel)
+        self.assertIsInstance(results[2], Exception)
+
+    def test_nested_gather(self):
+        logical3 = core.get_node_model(self.neo4jdb, handle_id='107')
+        nested = partial(self.neo4jdb.gather, logical3.get_dependencies, logical3.get_relations)
+        results = self.neo4jdb.gather(*[nested] * (self.neo4jdb.max_pool_size + 1))
+        self.assertEqual(len(results), self.neo4jdb.max_pool_size + 1)
+        self.assertEqual(results[-1][0]['Depends_on'][0]['node'].handle_id, '103')
+
     def test_get_dependents(self):
         logical1 = core.get_node_model(self.neo4jdb, handle_id='103')
         dependents = logical1.get_dependents()
@@ -345,6 +413,26 @@ class ModelsTests(Neo4jTestCase):
         self.assertEqual(dependents['paths'], [])
         self.assertEqual(dependents['services'][0]['name'], 'Service5')
 
+    def test_materialized_dependents(self):
+        node_models = [core.get_node_model(self.neo4jdb, handle_id=handle_id)
+                       for handle_id in ['1', '4', '16', '24', '32', '47', '103']]
+        expected = [handle_ids(node_model.get_dependent_as_types()) for node_model in node_models]
+        core.rebuild_dependents(self.neo4jdb)
+        self.neo4jdb.materialize_dependents = True
+        try:
+            self.assertEqual([handle_ids(node_model.get_dependent_as_types()) for node_model in node_models],
+                             expected)
+            self.assertNotIn('_dependents', core.get_node(self.neo4jdb, '4'))
+
+            service4 = core.get_node_model(self.neo4jdb, handle_id='38')
+            service4.set_dependency('24')  # port4 in odf1
+            odf1 = core.get_node_model(self.neo4jdb, handle_id='23')
+            self.assertIn('38', handle_ids(odf1.get_dependent_as_types())['services'])
+            service4.delete()
+            self.assertNotIn('38', handle_ids(odf1.get_dependent_as_types())['services'])
+        finally:
+            self.neo4jdb.materialize_dependents = False
+
     def test_get_dependencies_as_types(self):
         logical4 = core.get_node_model(self.neo4jdb, handle_id='111')
         dependencies = logical4.get_dependencies_as_types()
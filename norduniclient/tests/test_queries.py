@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import unittest
+from norduniclient import exceptions
+from norduniclient import queries
+from norduniclient.testing import Neo4jTestCase, cypher_only
+
+__author__ = 'lundberg'
+
+
+class QueriesTests(unittest.TestCase):
+
+    def test_render(self):
+        q = queries.render('get_indexed_node', label='Port', prop='name', lookup_func='STARTS WITH')
+        self.assertIn('MATCH (n:Port)', q)
+        self.assertIn('LOWER(n.name) STARTS WITH LOWER({value})', q)
+
+    def test_render_is_memoized(self):
+        template = queries.register('test_template', 'MATCH (n:$label) RETURN n')
+        q1 = template.render(label='Router')
+        q2 = template.render(label='Router')
+        self.assertIs(q1, q2)
+        template.render(label='Port')
+        self.assertEqual(len(template), 2)
+        del queries.TEMPLATES['test_template']
+
+    def test_invalid_identifiers(self):
+        for label in ['Node) DETACH DELETE n //', 'Node\n', '1Node', '', None]:
+            self.assertRaises(exceptions.InvalidIdentifier, queries.render, 'nodes_by_label', label=label)
+        self.assertRaises(exceptions.InvalidIdentifier, queries.render, 'get_indexed_node', label='Node',
+                          prop='name', lookup_func='=~')
+        self.assertRaises(exceptions.InvalidIdentifier, queries.render, 'create_relationship',
+                          rel_type='Depends_on]->(b) DETACH DELETE b //')
+
+
+class QueryTemplateCypherTests(Neo4jTestCase):
+
+    identifiers = {
+        'label': 'Node',
+        'meta_type': 'Logical',
+        'prop': 'name',
+        'shadow_prop': '_name_lc',
+        'rel_type': 'Depends_on',
+        'lookup_func': 'STARTS WITH',
+    }
+
+    @cypher_only
+    def test_templates_compile(self):
+        # Schema commands can not be explained
+        schema_templates = ['create_index', 'create_unique_constraint']
+        with self.neo4jdb.session as s:
+            for name, template in sorted(queries.TEMPLATES.items()):
+                if name in schema_templates:
+                    continue
+                identifiers = dict((slot, self.identifiers[slot]) for slot in template.slots)
+                q = template.render(**identifiers)
+                s.run('EXPLAIN ' + q).consume()
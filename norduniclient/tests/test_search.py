@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from norduniclient.testing import Neo4jTestCase
+from norduniclient import core
+from norduniclient.search import SearchIndex, trigrams
+
+__author__ = 'lundberg'
+
+
+class SearchIndexTests(Neo4jTestCase):
+
+    def setUp(self):
+        super(SearchIndexTests, self).setUp()
+        core.create_node(self.neo4jdb, name='Test Node 1', meta_type_label='Logical',
+                         type_label='Test_Node', handle_id='1')
+        core.create_node(self.neo4jdb, name='Test Node 2', meta_type_label='Logical',
+                         type_label='Test_Node', handle_id='2')
+        core.set_node_properties(self.neo4jdb, handle_id='1', new_properties={'name': 'Test Node 1',
+                                                                              'test': 'hello world'})
+        self.index = SearchIndex()
+        self.index.build(self.neo4jdb, page_size=1)
+        self.neo4jdb.search_index = self.index
+
+    def tearDown(self):
+        self.neo4jdb.search_index = None
+        super(SearchIndexTests, self).tearDown()
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams('hello'), {'hel', 'ell', 'llo'})
+        self.assertEqual(trigrams('he'), set())
+
+    def test_build(self):
+        self.assertEqual(len(self.index), 2)
+        self.assertIn('1', self.index)
+
+    def test_internal_properties(self):
+        self.neo4jdb.normalized_properties = ('name',)
+        self.neo4jdb.materialize_dependents = True
+        try:
+            core.create_relationship(self.neo4jdb, '1', '2', 'Depends_on')
+            core.set_node_properties(self.neo4jdb, '2', {'name': 'Test Node 2'})
+            result = list(core.search_nodes_by_value(self.neo4jdb, value='1'))
+            self.assertEqual([node['handle_id'] for node in result], ['1'])
+            self.index.refresh(self.neo4jdb)
+            self.assertEqual(set(self.index._documents['2'][1]), {'name', 'handle_id'})
+        finally:
+            self.neo4jdb.normalized_properties = ()
+            self.neo4jdb.materialize_dependents = False
+
+    def test_node_listener(self):
+        self.assertIn(self.index, self.neo4jdb.node_listeners)
+        self.neo4jdb.search_index = None
+        self.assertNotIn(self.index, self.neo4jdb.node_listeners)
+
+    def test_search_nodes_by_value(self):
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='WORLD'))
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].get('test'), 'hello world')
+
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='world', prop='name'))
+        self.assertEqual(result, [])
+
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='node', prop='name', node_type='Test_Node'))
+        self.assertEqual([node['handle_id'] for node in result], ['1', '2'])
+
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='no', node_type='Other_Node'))
+        self.assertEqual(result, [])
+
+        # Regular expressions are not answered from the index
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='node [12]', prop='name'))
+        self.assertEqual(sorted(node['handle_id'] for node in result), ['1', '2'])
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='node [12]', prop='name', literal=True))
+        self.assertEqual(result, [])
+
+    def test_search_nodes_by_value_pagination(self):
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='node', page_size=1))
+        self.assertEqual([node['handle_id'] for node in result], ['1', '2'])
+        token = core.create_resume_token(result[0])
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='node', resume_token=token))
+        self.assertEqual([node['handle_id'] for node in result], ['2'])
+
+    def test_incremental_updates(self):
+        core.set_node_properties(self.neo4jdb, handle_id='2', new_properties={'name': 'Test Node 2',
+                                                                              'test': ['brave', 'new world']})
+        core.create_node(self.neo4jdb, name='New world node', meta_type_label='Logical',
+                         type_label='Test_Node', handle_id='3')
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='world'))
+        self.assertEqual([node['handle_id'] for node in result], ['1', '2', '3'])
+
+        core.delete_node(self.neo4jdb, '1')
+        result = list(core.search_nodes_by_value(self.neo4jdb, value='world'))
+        self.assertEqual([node['handle_id'] for node in result], ['2', '3'])
+        self.assertNotIn('1', self.index)
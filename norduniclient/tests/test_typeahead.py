@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from norduniclient.testing import Neo4jTestCase
+from norduniclient import core
+from norduniclient.typeahead import PrefixIndex
+
+__author__ = 'lundberg'
+
+
+class PrefixIndexTests(Neo4jTestCase):
+
+    def setUp(self):
+        super(PrefixIndexTests, self).setUp()
+        core.create_node(self.neo4jdb, name='Stockholm', meta_type_label='Location',
+                         type_label='Site', handle_id='1')
+        core.create_node(self.neo4jdb, name='stavanger', meta_type_label='Location',
+                         type_label='Site', handle_id='2')
+        core.create_node(self.neo4jdb, name='Stockholm Router', meta_type_label='Physical',
+                         type_label='Router', handle_id='3')
+        self.index = PrefixIndex(self.neo4jdb, labels=['Site', 'Router'])
+        self.index.build(page_size=1)
+
+    def tearDown(self):
+        self.index.close()
+        super(PrefixIndexTests, self).tearDown()
+
+    def test_build(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(sorted(self.index.labels), ['Router', 'Site'])
+
+    def test_complete(self):
+        self.assertEqual(self.index.complete('ST', 'Site'), [('stavanger', '2'), ('Stockholm', '1')])
+        self.assertEqual(self.index.complete('st', 'Site', limit=1), [('stavanger', '2')])
+        self.assertEqual(self.index.complete('stock', 'Router'), [('Stockholm Router', '3')])
+        self.assertEqual(self.index.complete('oslo', 'Site'), [])
+
+    def test_incremental_updates(self):
+        core.create_node(self.neo4jdb, name='Stockholm 2', meta_type_label='Location',
+                         type_label='Site', handle_id='4')
+        core.set_node_properties(self.neo4jdb, '2', {'name': 'Oslo'})
+        core.delete_node(self.neo4jdb, '1')
+        self.assertEqual(self.index.complete('st', 'Site'), [('Stockholm 2', '4')])
+        self.assertEqual(self.index.complete('o', 'Site'), [('Oslo', '2')])
+
+    def test_rollback(self):
+        with self.neo4jdb.unit_of_work(rollback=True):
+            core.set_node_properties(self.neo4jdb, '2', {'name': 'Oslo'})
+            self.assertEqual(self.index.complete('o', 'Site'), [('Oslo', '2')])
+        self.assertEqual(self.index.complete('o', 'Site'), [])
+        self.assertEqual(self.index.complete('sta', 'Site'), [('stavanger', '2')])
+
+    def test_close(self):
+        self.index.close()
+        self.assertNotIn(self.index, self.neo4jdb.node_listeners)
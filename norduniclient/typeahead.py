@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory typeahead for node names.
+
+PrefixIndex keeps a sorted list of lower cased names per label and answers prefix lookups with bisect, without a
+query to Neo4j. It is loaded by streaming the nodes of each label once and then follows the writes made through the
+manager, as every node write evicts the changed nodes through Neo4jDBSessionManager.evict_nodes. Changed nodes are
+fetched again, with one query, before the next lookup.
+
+    index = PrefixIndex(manager, labels=['Site', 'Router'])
+    index.build()
+    index.complete('sto', 'Site', limit=10)  # [(name, handle_id), ...]
+"""
+
+from __future__ import absolute_import
+
+from bisect import bisect_left, insort
+from threading import RLock
+
+from norduniclient import core
+
+__author__ = 'lundberg'
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class _LabelIndex(object):
+
+    def __init__(self):
+        self.keys = []  # Sorted (lower cased name, handle_id)
+        self.names = {}  # handle_id -> (key, name)
+
+    def add(self, handle_id, name):
+        self.remove(handle_id)
+        key = (name.lower(), handle_id)
+        insort(self.keys, key)
+        self.names[handle_id] = (key, name)
+
+    def load(self, names):
+        """
+        Replaces the contents with the (handle_id, name) pairs, sorted once.
+        """
+        self.names = {handle_id: ((name.lower(), handle_id), name) for handle_id, name in names}
+        self.keys = sorted(key for key, name in self.names.values())
+
+    def remove(self, handle_id):
+        entry = self.names.pop(handle_id, None)
+        if entry is None:
+            return
+        i = bisect_left(self.keys, entry[0])
+        if i < len(self.keys) and self.keys[i] == entry[0]:
+            del self.keys[i]
+
+    def complete(self, prefix, limit):
+        results = []
+        i = bisect_left(self.keys, (prefix,))
+        while i < len(self.keys) and len(results) < limit:
+            name_lc, handle_id = self.keys[i]
+            if not name_lc.startswith(prefix):
+                break
+            results.append((self.names[handle_id][1], handle_id))
+            i += 1
+        return results
+
+
+class PrefixIndex(object):
+    """
+    Prefix index over the name property of the nodes with the given labels.
+
+    :param manager: Neo4jDBSessionManager
+    :param labels: Labels to index, defaults to Node
+    :type labels: list
+    """
+
+    def __init__(self, manager, labels=('Node',)):
+        self.manager = manager
+        self._labels = {label: _LabelIndex() for label in labels}
+        self._dirty = set()
+        self._lock = RLock()
+        manager.node_listeners.append(self)
+
+    @property
+    def labels(self):
+        return list(self._labels)
+
+    def __len__(self):
+        return sum(len(index.names) for index in self._labels.values())
+
+    def build(self, page_size=1000):
+        """
+        Loads the names of all nodes of the indexed labels, fetched in pages of page_size.
+
+        :param page_size: Nodes fetched per session
+        :type page_size: int
+        """
+        with self._lock:
+            self._dirty.clear()
+            for label in self._labels:
+                index = self._labels[label] = _LabelIndex()
+                index.load((node['handle_id'], node['name'])
+                           for node in core.get_nodes_by_type(self.manager, label, page_size=page_size)
+                           if isinstance(node.get('name'), string_types))
+
+    def close(self):
+        """
+        Stops following writes made through the manager.
+        """
+        if self in self.manager.node_listeners:
+            self.manager.node_listeners.remove(self)
+
+    def invalidate(self, *handle_ids):
+        with self._lock:
+            self._dirty.update(handle_ids)
+
+    def refresh(self):
+        """
+        Fetches the nodes changed since the last refresh and updates the index.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            try:
+                nodes = core._get_nodes(self.manager, list(dirty))
+            except Exception:
+                self._dirty.update(dirty)
+                raise
+            for handle_id, node in nodes.items():
+                for label, index in self._labels.items():
+                    if node is not None and label in node.labels and isinstance(node.get('name'), string_types):
+                        index.add(handle_id, node['name'])
+                    else:
+                        index.remove(handle_id)
+
+    def complete(self, prefix, label='Node', limit=10):
+        """
+        :param prefix: Case insensitive name prefix
+        :param label: Indexed label
+        :param limit: Maximum number of matches
+
+        :type prefix: str
+        :type label: str
+        :type limit: int
+
+        :return: (name, handle_id) of the first matching names in alphabetical order
+        :rtype: list
+        """
+        self.refresh()
+        with self._lock:
+            return self._labels[label].complete(prefix.lower(), limit)
@@ -4,6 +4,7 @@ version = '1.3.3'
 
 requires = [
     'neo4j-driver<2.0',
+    'futures; python_version < "3"',
 ]
 
 testing_requires = [